@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import fcntl
+import functools
+import json
+import os
+import ssl
+import threading
+import urllib.parse
+import urllib.request
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any
+
+import yaml
+
+from app.background import RateLimiter
+from app.batch import to_objects
+from app.consts import (
+    AUDIT_LIST_PAGE_SIZE,
+    AUDIT_LOCK_PATH,
+    AUDIT_REQUEST_TIMEOUT_IN_SEC,
+    MANIFEST_FILE_SUFFIXES,
+    SERVICE_ACCOUNT_PATH,
+)
+from app.utils import get_object_hash
+
+if TYPE_CHECKING:
+    from app.models import WhorfConfig
+
+
+class AuditSource(ABC):
+    @abstractmethod
+    def list_objects(self) -> Iterator[dict[str, Any]]:
+        """Lists all existing objects, which should be audited"""
+
+
+class DirectoryAuditSource(AuditSource):
+    """Reads the objects from YAML and JSON manifests in a local directory, ex. a mounted cluster dump"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def list_objects(self) -> Iterator[dict[str, Any]]:
+        for file_path in sorted(self.path.rglob("*")):
+            if file_path.suffix not in MANIFEST_FILE_SUFFIXES or not file_path.is_file():
+                continue
+
+            with file_path.open() as f:
+                for document in yaml.safe_load_all(f):
+                    if document:
+                        yield from to_objects(document)
+
+
+class ApiServerAuditSource(AuditSource):
+    """Lists the objects via the Kubernetes API with the service account of the pod
+
+    The resources are given by their group version and plural name, ex. 'apps/v1/deployments' or 'v1/pods'.
+    The API server and the service account are only looked up by the first audit, so a misconfigured source
+    fails the audit instead of the start of the webhook.
+    """
+
+    def __init__(self, resources: list[str]) -> None:
+        self.resources = resources
+
+    @functools.cached_property
+    def url(self) -> str:
+        host = os.environ.get("KUBERNETES_SERVICE_HOST")
+        if not host:
+            raise RuntimeError(
+                "The 'api-server' audit source needs to run in a Kubernetes pod, KUBERNETES_SERVICE_HOST is not set"
+            )
+
+        return f"https://{host}:{os.environ.get('KUBERNETES_SERVICE_PORT', '443')}"
+
+    @functools.cached_property
+    def ssl_context(self) -> ssl.SSLContext:
+        ca_file_path = SERVICE_ACCOUNT_PATH / "ca.crt"
+        if not ca_file_path.exists():
+            raise RuntimeError(
+                f"The 'api-server' audit source needs the service account token, {ca_file_path} is not mounted, "
+                "see 'Audit of existing objects' in the README"
+            )
+
+        return ssl.create_default_context(cafile=str(ca_file_path))
+
+    def list_objects(self) -> Iterator[dict[str, Any]]:
+        for resource in self.resources:
+            group_version, _, plural = resource.rpartition("/")
+            path = f"/api/{group_version}/{plural}" if "/" not in group_version else f"/apis/{group_version}/{plural}"
+
+            continue_token = ""
+            while True:
+                query = urllib.parse.urlencode({"limit": AUDIT_LIST_PAGE_SIZE, "continue": continue_token})
+                object_list = self.get(f"{path}?{query}")
+
+                # the items of a list don't contain their kind and API version
+                kind = object_list["kind"].removesuffix("List")
+                for item in object_list.get("items") or []:
+                    yield {"apiVersion": group_version, "kind": kind, **item}
+
+                continue_token = (object_list.get("metadata") or {}).get("continue") or ""
+                if not continue_token:
+                    break
+
+    def get(self, path: str) -> dict[str, Any]:
+        url = f"{self.url}{path}"
+        ssl_context = self.ssl_context
+        # the token is rotated by the kubelet, therefore it is read for every request
+        token = (SERVICE_ACCOUNT_PATH / "token").read_text().strip()
+        request = urllib.request.Request(  # noqa: S310  # the URL is the in-cluster API server
+            url, headers={"Authorization": f"Bearer {token}", "Accept": "application/json"}
+        )
+        with urllib.request.urlopen(  # noqa: S310
+            request, timeout=AUDIT_REQUEST_TIMEOUT_IN_SEC, context=ssl_context
+        ) as response:
+            return json.loads(response.read())  # type: ignore[no-any-return]
+
+
+class Auditor:
+    """Finds the objects of the audit source, which changed since their last audit
+
+    The objects are identified by their kind, namespace and name and compared by a hash, which ignores
+    volatile fields and includes the hash of the Checkov config, so a config change audits everything again.
+    """
+
+    def __init__(self, source: AuditSource, max_objects_per_min: int) -> None:
+        self.source = source
+        self.rate_limiter = RateLimiter(max_objects_per_min=max_objects_per_min)
+
+        self.object_hashes: dict[str, str] = {}
+        self.audited = 0
+        self._lock = threading.Lock()
+        self._lock_file: IO[bytes] | None = None
+
+    def acquire_lock(self) -> bool:
+        """Returns, if this process audits the cluster, the lock is released, when the process exits"""
+
+        if self._lock_file:
+            return True
+
+        lock_file = AUDIT_LOCK_PATH.open("ab")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+
+        self._lock_file = lock_file
+        return True
+
+    def get_changed_objects(self, config_hash: str) -> Iterator[tuple[str, dict[str, Any]]]:
+        """Yields the hash and the object of all changed objects and forgets the objects, which don't exist anymore"""
+
+        object_keys = set()
+        for obj in self.source.list_objects():
+            object_key = get_object_key(obj)
+            object_keys.add(object_key)
+
+            object_hash = get_object_hash(obj=obj, salt=config_hash)
+            if self.object_hashes.get(object_key) != object_hash:
+                yield object_hash, obj
+
+        with self._lock:
+            for object_key in self.object_hashes.keys() - object_keys:
+                del self.object_hashes[object_key]
+
+    def mark_audited(self, obj: dict[str, Any], object_hash: str) -> None:
+        with self._lock:
+            self.object_hashes[get_object_key(obj)] = object_hash
+            self.audited += 1
+
+    def wait_for_rate_limit(self, object_count: int) -> None:
+        """Spreads the scans over time, so the audit only uses a fraction of the engine time, 0 disables the limit"""
+
+        self.rate_limiter.wait(object_count=object_count)
+
+
+def get_object_key(obj: dict[str, Any]) -> str:
+    metadata = obj.get("metadata") or {}
+    return f'{obj.get("kind")}/{metadata.get("namespace")}/{metadata.get("name")}'
+
+
+def create_auditor(whorf_conf: WhorfConfig) -> Auditor | None:
+    """Creates the auditor based on the whorf config, if an audit source is configured"""
+
+    source: AuditSource
+    if whorf_conf.audit_source == "api-server":
+        source = ApiServerAuditSource(resources=whorf_conf.audit_resources)
+    elif whorf_conf.audit_source == "directory":
+        source = DirectoryAuditSource(path=Path(whorf_conf.audit_directory))
+    else:
+        return None
+
+    return Auditor(source=source, max_objects_per_min=whorf_conf.audit_max_objects_per_min)
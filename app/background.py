@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, TypeVar
+
+from app.metrics import BACKGROUND_SCAN_QUEUE_DEPTH, BACKGROUND_SCANS_DROPPED
+
+T = TypeVar("T")
+
+
+class BackgroundScanExecutor:
+    """Runs the scans, which don't decide an admission, one at a time with a lower priority than admission scans
+
+    A queued scan only starts, when no admission scan is running or waiting for the engine, or after waiting for
+    'max_wait_in_sec', so it can't starve completely. New scans are dropped, when the queue is full.
+    """
+
+    def __init__(self, maxsize: int, max_wait_in_sec: float) -> None:
+        self.maxsize = maxsize
+        self.max_wait_in_sec = max_wait_in_sec
+
+        self.pending = 0
+        self.dropped = 0
+
+        self._admission_scans = 0
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="background-scan")
+
+    @contextmanager
+    def admission_scan(self) -> Iterator[None]:
+        """Marks an admission scan, while it waits for and runs on the engine, background scans wait meanwhile"""
+
+        with self._condition:
+            self._admission_scans += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._admission_scans -= 1
+                self._condition.notify_all()
+
+    def wait_for_admission_scans(self) -> None:
+        """Blocks, until no admission scan is running or waiting for the engine, at most 'max_wait_in_sec'"""
+
+        with self._condition:
+            self._condition.wait_for(lambda: self._admission_scans == 0, timeout=self.max_wait_in_sec)
+
+    def submit(self, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> Future[T] | None:
+        """Queues the scan and returns its future or None, if it was dropped"""
+
+        with self._condition:
+            if self.pending >= self.maxsize:
+                self.dropped += 1
+                BACKGROUND_SCANS_DROPPED.inc()
+                return None
+            self.pending += 1
+            BACKGROUND_SCAN_QUEUE_DEPTH.inc()
+
+        return self._executor.submit(self._run, fn, *args, **kwargs)
+
+    def _run(self, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+        self.wait_for_admission_scans()
+        with self._condition:
+            self.pending -= 1
+            BACKGROUND_SCAN_QUEUE_DEPTH.dec()
+
+        return fn(*args, **kwargs)
+
+
+class RateLimiter:
+    """Spreads scans over time, so they only use a fraction of the engine time, 0 disables the limit
+
+    Concurrent callers reserve consecutive time slots, therefore the limit applies to all of them together.
+    """
+
+    def __init__(self, max_objects_per_min: int) -> None:
+        self.max_objects_per_min = max_objects_per_min
+
+        self._next_scan_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self, object_count: int) -> None:
+        """Blocks, until the objects may be scanned"""
+
+        if self.max_objects_per_min <= 0:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            scan_time = max(self._next_scan_time, now)
+            self._next_scan_time = scan_time + object_count * 60 / self.max_objects_per_min
+
+        if (delay := scan_time - now) > 0:
+            time.sleep(delay)
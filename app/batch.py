@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import json
+import uuid
+from collections import defaultdict
+from collections.abc import Callable, Container, Iterable, Iterator
+from itertools import islice
+from typing import TYPE_CHECKING, Any, TypeVar
+
+from checkov.common.bridgecrew.check_type import CheckType
+from checkov.common.output.report import Report
+
+from app.consts import MANIFEST_ROOT_PATH
+from app.models import BatchResult
+from app.validate import get_verdict
+
+if TYPE_CHECKING:
+    from app.models import PolicyIndex
+
+_T = TypeVar("_T")
+
+
+class BatchTooLargeError(ValueError):
+    """Raised, when a batch validation contains more objects than allowed"""
+
+
+def iter_objects(lines: Iterable[str]) -> Iterator[dict[str, Any]]:
+    """Parses the Kubernetes objects of a batch lazily
+
+    Supported are a JSON 'List' like the output of 'kubectl get -o json', a JSON array and newline delimited JSON
+    with one object per line. Only newline delimited JSON is parsed line by line, a formatted JSON document
+    is parsed as a whole. AdmissionReviews are replaced by the object of their request.
+    """
+
+    lines = iter(lines)
+    for line in lines:
+        if not line.strip():
+            continue
+
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            # a formatted JSON document spans the remaining lines
+            data = json.loads(line + "".join(lines))
+
+        yield from to_objects(data)
+
+
+def to_objects(data: Any) -> Iterator[dict[str, Any]]:
+    """Unwraps the objects of a parsed List, array or AdmissionReview"""
+
+    if isinstance(data, dict):
+        data = data.get("items") or [] if str(data.get("kind", "")).endswith("List") else [data]
+    elif not isinstance(data, list):
+        raise ValueError(f"Expected a Kubernetes object, got {type(data).__name__}")
+
+    for obj in data:
+        if not isinstance(obj, dict):
+            raise ValueError(f"Expected a Kubernetes object, got {type(obj).__name__}")
+        if obj.get("kind") == "AdmissionReview":
+            obj = (obj.get("request") or {}).get("object") or {}
+        yield obj
+
+
+def limit_objects(objects: Iterable[_T], max_count: int) -> Iterator[_T]:
+    """Passes the objects through, but raises a BatchTooLargeError for the first one above the limit, 0 disables it"""
+
+    for count, obj in enumerate(objects, start=1):
+        if 0 < max_count < count:
+            raise BatchTooLargeError(f"Batch exceeds the limit of {max_count} objects")
+        yield obj
+
+
+def chunked(items: Iterable[_T], size: int) -> Iterator[list[_T]]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def split_scan_reports(scan_reports: list[Report]) -> dict[str, list[Report]]:
+    """Splits the scan reports of multiple objects scanned in a single run into reports per virtual file path"""
+
+    reports_by_file: dict[str, dict[str, Report]] = defaultdict(dict)
+    for report in scan_reports:
+        for record in (*report.failed_checks, *report.passed_checks, *report.skipped_checks):
+            file_reports = reports_by_file[record.file_abs_path]
+            file_report = file_reports.setdefault(report.check_type, Report(check_type=report.check_type))
+            file_report.add_record(record)
+
+    return {file_path: list(reports.values()) for file_path, reports in reports_by_file.items()}
+
+
+def validate_objects(
+    objects: list[dict[str, Any]],
+    *,
+    scan: Callable[[dict[str, dict[str, Any]]], list[Report]],
+    policy_index: PolicyIndex,
+    ignored_namespaces: Container[str],
+) -> list[BatchResult]:
+    """Scans the objects in a single run and decides about each of them like about an admission request"""
+
+    batch_id = uuid.uuid4().hex
+    # objects of ignored namespaces are not scanned, they keep their position in the results
+    objects_by_file = {
+        str(MANIFEST_ROOT_PATH / f"batch-{batch_id}-{idx}.yaml"): obj
+        for idx, obj in enumerate(objects)
+        if get_metadata(obj).get("namespace") not in ignored_namespaces
+    }
+    reports_by_file = split_scan_reports(scan(objects_by_file)) if objects_by_file else {}
+
+    results = []
+    for idx, obj in enumerate(objects):
+        metadata = get_metadata(obj)
+        file_path = str(MANIFEST_ROOT_PATH / f"batch-{batch_id}-{idx}.yaml")
+        if file_path in objects_by_file:
+            verdict = get_verdict(
+                # an object without any applicable check has no records, like an empty Checkov report
+                scan_reports=reports_by_file.get(file_path) or [Report(check_type=CheckType.KUBERNETES)],
+                policy_index=policy_index,
+                obj_kind_name=f'{obj.get("kind")}/{metadata.get("name")}',
+            )
+            allowed, message = verdict.allowed, verdict.message
+        else:
+            allowed, message = True, "Namespace in ignore list. Ignoring validation"
+
+        results.append(
+            BatchResult(
+                kind=obj.get("kind"),
+                namespace=metadata.get("namespace"),
+                name=metadata.get("name"),
+                allowed=allowed,
+                message=message,
+            )
+        )
+
+    return results
+
+
+def get_metadata(obj: dict[str, Any]) -> dict[str, Any]:
+    metadata = obj.get("metadata")
+    return metadata if isinstance(metadata, dict) else {}
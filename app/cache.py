@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Generic, TypeVar
+
+if TYPE_CHECKING:
+    from prometheus_client import Counter
+
+_T = TypeVar("_T")
+
+
+class TTLCache(Generic[_T]):
+    """Thread-safe LRU cache, which additionally expires entries after the given TTL
+
+    The optional metrics count the lookups by `result` (hit, miss) and the evictions by `reason` (expired, size).
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        lookups_metric: Counter | None = None,
+        evictions_metric: Counter | None = None,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lookups_metric = lookups_metric
+        self.evictions_metric = evictions_metric
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: OrderedDict[str, tuple[float, _T]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> _T | None:
+        """Returns the cached value or None, if it doesn't exist or is expired"""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count_lookup("miss")
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._count_eviction("expired")
+                self._count_lookup("miss")
+                return None
+
+            self._entries.move_to_end(key)
+            self._count_lookup("hit")
+            return value
+
+    def set(self, key: str, value: _T) -> None:
+        """Adds the value and evicts the least recently used entries, if the cache is full"""
+
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._count_eviction("size")
+
+    def clear(self) -> None:
+        """Removes all entries, but keeps the counters"""
+
+        with self._lock:
+            self._entries.clear()
+
+    def _count_lookup(self, result: str) -> None:
+        if result == "hit":
+            self.hits += 1
+        else:
+            self.misses += 1
+        if self.lookups_metric:
+            self.lookups_metric.labels(result=result).inc()
+
+    def _count_eviction(self, reason: str) -> None:
+        self.evictions += 1
+        if self.evictions_metric:
+            self.evictions_metric.labels(reason=reason).inc()
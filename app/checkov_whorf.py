@@ -1,27 +1,75 @@
 from __future__ import annotations
 
+import copy
+import hashlib
 import os.path
-from typing import TYPE_CHECKING, Literal
+import threading
+from typing import TYPE_CHECKING, Any, Literal
 
 import yaml
 from checkov.common.bridgecrew.bc_source import BCSourceType, SourceTypes
+from checkov.common.bridgecrew.check_type import CheckType
+from checkov.common.bridgecrew.platform_integration import bc_integration
+from checkov.common.runners.runner_registry import RunnerRegistry
+from checkov.kubernetes.checks.resource.registry import registry as resource_registry
 from checkov.main import Checkov
+from checkov.version import version as checkov_version
 
-from app.consts import CHECKOV_CONFIG_PATH
+from app.consts import CHECKOV_CONFIG_PATH, MANIFEST_ROOT_PATH, WARM_UP_MANIFEST
+from app.fast_path import HardFailEvaluator
+from app.kubernetes_runner import KubernetesObjectRunner
+from app.models import PolicyIndex
+from app.tracing import tracer
 
 if TYPE_CHECKING:
     from logging import Logger
+    from pathlib import Path
 
+    from checkov.common.bridgecrew.bc_source import SourceType
     from checkov.common.output.baseline import Baseline
     from checkov.common.output.report import Report
-    from checkov.common.runners.runner_registry import RunnerRegistry
+    from checkov.runner_filter import RunnerFilter
+
+    from app.image_cache import ImageScanCache
+
+# 'hard-fail' only runs the checks of the 'hard-fail-on' config, 'remaining' all other checks
+ScanPhase = Literal["all", "hard-fail", "remaining"]
 
 
 class CheckovWhorf(Checkov):
-    def __init__(self, logger: Logger, argv: list[str]) -> None:
+    """Long-lived Checkov engine
+
+    The first scan runs the complete Checkov setup (platform integration, runner filter, external checks),
+    all following scans reuse it and only reset the per scan state of the runners.
+    Access has to be guarded by the 'lock', because the runners are stateful.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        argv: list[str],
+        config_path: Path | None = None,
+        image_cache: ImageScanCache | None = None,
+    ) -> None:
         super().__init__(argv=argv)
 
         self.logger = logger
+        self.argv = argv
+        self.config_path = config_path  # defaults to the Checkov config file of the container
+        self.lock = threading.RLock()
+
+        self.config_mtime: int | None = None
+        self.config_hash = ""
+        self.runner_filter: RunnerFilter | None = None
+        self.policy_index = PolicyIndex()
+        self.hard_fail_evaluator = HardFailEvaluator()
+        self._two_phase_supported: bool | None = None
+
+        # use an own Kubernetes runner, which is able to scan already decoded objects
+        self.kubernetes_runner = KubernetesObjectRunner(image_cache=image_cache)
+        self.runners = [
+            self.kubernetes_runner if runner.check_type == CheckType.KUBERNETES else runner for runner in self.runners
+        ]
 
     def upload_results(
         self,
@@ -36,10 +84,10 @@ class CheckovWhorf(Checkov):
         # don't upload results with every run
         return
 
-    def upload_results_periodically(self, root_folder: str) -> None:
+    def upload_results_periodically(self, root_folder: str, files: list[str] | None = None) -> None:
         """Used to upload results on a periodic basis"""
 
-        super().upload_results(root_folder=root_folder, absolute_root_folder=os.path.abspath(root_folder))
+        super().upload_results(root_folder=root_folder, absolute_root_folder=os.path.abspath(root_folder), files=files)
 
     def print_results(
         self,
@@ -48,12 +96,23 @@ class CheckovWhorf(Checkov):
         created_baseline_path: str | None = None,
         baseline: Baseline | None = None,
     ) -> Literal[0, 1]:
-        # just don't print anything to stdout
+        # keep the runner filter for the following scans, but just don't print anything to stdout
+        self.runner_filter = runner_registry.runner_filter
         return 0
 
-    def update_config(self) -> None:
-        conf = yaml.safe_load(CHECKOV_CONFIG_PATH.read_text())
+    def update_config(self) -> bool:
+        """Applies the Checkov config file, if it changed since the last call and returns, if it was applied"""
+
+        config_path = self.config_path or CHECKOV_CONFIG_PATH
+        config_mtime = config_path.stat().st_mtime_ns
+        if config_mtime == self.config_mtime:
+            return False
 
+        conf_text = config_path.read_text()
+        conf = yaml.safe_load(conf_text)
+
+        # start from a clean config, otherwise removed parameters would still be active
+        self.parse_config(argv=list(self.argv))
         for param, value in conf.items():
             flag_attr = param.replace("-", "_")
             if hasattr(self.config, flag_attr):
@@ -62,19 +121,190 @@ class CheckovWhorf(Checkov):
             else:
                 self.logger.error(f"Parameter {param} is not supported")
 
-    def scan_file(self, file: str) -> None:
-        """Scan the given file"""
+        self.config_mtime = config_mtime
+        self.config_hash = hashlib.sha256(conf_text.encode()).hexdigest()
+        self.policy_index = PolicyIndex(hard_fail_ids=frozenset(self.config.hard_fail_on or ()))
+        self.hard_fail_evaluator = HardFailEvaluator(
+            hard_fail_on=self.config.hard_fail_on or (), skip_checks=self.config.skip_check or ()
+        )
+        if self.hard_fail_evaluator.unsupported_ids:
+            self.logger.info(
+                f"The hard fail checks {sorted(self.hard_fail_evaluator.unsupported_ids)} can't be evaluated by the "
+                "fast path, therefore it is disabled"
+            )
+        self._two_phase_supported = None
+        self.kubernetes_runner.template_results.clear()
+        self.kubernetes_runner.graph_checks_by_kind = None
+        # the next scan needs to go through the complete Checkov setup again
+        self.runner_filter = None
+
+        return True
+
+    def scan_object(self, obj: dict[str, Any], file_path: str, phase: ScanPhase = "all") -> bool:
+        """Scan the given decoded Kubernetes object without writing it to the given virtual file path
+
+        Returns, if all checks were run, which is always the case for the first scan after a config change,
+        because it runs the complete Checkov setup, and for hard fail configs not supported by the two-phase scan.
+        """
+
+        complete = self.scan_objects(objects={file_path: obj}, phase=phase)
+
+        self.logger.info(f"Successfully scanned object {file_path} with {phase} checks")
+        return complete
+
+    def scan_objects(self, objects: dict[str, dict[str, Any]], phase: ScanPhase = "all") -> bool:
+        """Scan the given decoded Kubernetes objects by their virtual file paths in a single run
+
+        The records of the scan reports can be assigned to the objects via their 'file_abs_path'.
+        """
+
+        if phase != "all" and not self.two_phase_supported:
+            phase = "all"
+
+        files = list(objects)
+        self.config.directory = None
+        self.config.file = files
+        self.reset_runners()
+        runner_filter = self.get_phase_runner_filter(phase=phase)
+        self.kubernetes_runner.load_objects(objects=objects, runner_filter=runner_filter)
+        # the reports are uploaded later on, therefore the platform integration is set up for Kubernetes workloads
+        complete = phase == "all" or self.runner_filter is None
+        self.rerun(
+            files=files,
+            source_type=SourceTypes[BCSourceType.KUBERNETES_WORKLOADS],
+            runner_filter=runner_filter,
+        )
+
+        return complete
+
+    def preload_checks(self) -> None:
+        """Loads the graph checks, which are otherwise loaded by the first scan, the resource checks are loaded on import"""
+
+        if self.kubernetes_runner.graph_registry:
+            self.kubernetes_runner.graph_registry.load_checks()
+
+    def warm_up(self) -> None:
+        """Scans a synthetic manifest to run the complete Checkov setup including the platform integration"""
+
+        with self.lock:
+            self.update_config()
+            self.scan_object(obj=WARM_UP_MANIFEST, file_path=str(MANIFEST_ROOT_PATH / "whorf-warm-up.yaml"))
+
+    def setup_platform_integration(self) -> bool:
+        """Sets up the platform integration again like a Checkov run would do and returns, if it succeeded
+
+        Each upload needs fresh credentials and its own upload path, and a failed previous upload must not
+        disable all following ones.
+        """
+
+        bc_integration.s3_setup_failed = False
+        bc_integration.use_s3_integration = False
+        try:
+            bc_integration.bc_api_key = self.config.bc_api_key
+            bc_integration.setup_bridgecrew_credentials(
+                repo_id=self.config.repo_id,
+                skip_download=self.config.skip_download,
+                source=SourceTypes[BCSourceType.KUBERNETES_WORKLOADS],
+                source_version=os.getenv("BC_SOURCE_VERSION", checkov_version),
+                repo_branch=self.config.branch,
+                prisma_api_url=self.config.prisma_api_url,
+            )
+        except Exception:
+            self.logger.error("Failed to set up the platform integration", exc_info=True)
+            return False
+
+        return bool(bc_integration.use_s3_integration)
+
+    def upload_reports(self, root_folder: str, files: list[str], scan_reports: list[Report]) -> bool:
+        """Uploads the given files together with their scan reports of previous scans and returns, if it succeeded"""
+
+        if not self.config.bc_api_key:
+            # nothing to upload to, therefore the files are just discarded
+            return True
+
+        if not self.setup_platform_integration():
+            self.logger.error(f"Failed to upload {len(files)} files, because the platform integration isn't set up")
+            return False
+
+        self.scan_reports = scan_reports
+        # errors of the upload are only logged by Checkov and mark the platform integration as failed
+        self.upload_results_periodically(root_folder=root_folder, files=files)
+        if bc_integration.s3_setup_failed:
+            self.logger.error(f"Failed to upload {len(files)} files")
+            return False
+
+        self.logger.info(f"Successfully uploaded {len(files)} files")
+        return True
+
+    def rerun(
+        self, files: list[str], source_type: SourceType | None = None, runner_filter: RunnerFilter | None = None
+    ) -> None:
+        """Runs the runners against the given files by reusing the Checkov setup of a previous run"""
+
+        if self.runner_filter is None:
+            with tracer.start_span("checkov_setup"):
+                self.run(source_type=source_type)
+            return
+
+        runner_registry = RunnerRegistry("", runner_filter or self.runner_filter, *self.runners)
+        runner_registry.filter_runners_for_files(files)
+
+        # external checks were already loaded into the registries by the first run
+        frameworks = ",".join(runner.check_type for runner in runner_registry.runners)
+        with tracer.start_span("runners", frameworks=frameworks):
+            self.scan_reports = runner_registry.run(files=files)
+
+    @property
+    def two_phase_supported(self) -> bool:
+        """Checks, if the hard fail checks can be selected by their IDs for the hard fail phase of a two-phase scan
+
+        Severities in the 'hard-fail-on' config are only resolved by the runner filter of the complete Checkov setup,
+        and CVE and license IDs need the image scan, therefore such configs are always scanned with all checks.
+        It is only known after the complete Checkov setup, which also loads the external checks.
+        """
+
+        if self._two_phase_supported is None:
+            if self.runner_filter is None:
+                return False
+
+            graph_registry = self.kubernetes_runner.graph_registry
+            known_ids = {
+                check_id
+                for checks in (*resource_registry.checks.values(), graph_registry.checks if graph_registry else ())
+                for check in checks
+                for check_id in (check.id, check.bc_id)
+                if check_id
+            }
+            hard_fail_ids = set(self.config.hard_fail_on or ())
+            if unsupported_ids := hard_fail_ids - known_ids:
+                self.logger.warning(
+                    f"The hard fail entries {sorted(unsupported_ids)} aren't Kubernetes check IDs, therefore the "
+                    "objects are scanned with all checks instead of in two phases"
+                )
+            self._two_phase_supported = bool(hard_fail_ids) and not unsupported_ids
+
+        return self._two_phase_supported
+
+    def get_phase_runner_filter(self, phase: ScanPhase) -> RunnerFilter | None:
+        """Restricts the runner filter of the Checkov setup to the checks of the given scan phase"""
 
-        self.config.file = [file]
-        self.run()
+        if phase == "all" or self.runner_filter is None:
+            return self.runner_filter
 
-        self.logger.info(f"Successfully scanned file {file}")
+        runner_filter = copy.copy(self.runner_filter)
+        if phase == "hard-fail":
+            runner_filter.checks = list(self.config.hard_fail_on)
+            # container images are not scanned for the admission decision
+            runner_filter.run_image_referencer = False
+        else:
+            runner_filter.skip_checks = [*runner_filter.skip_checks, *self.config.hard_fail_on]
 
-    def scan_directory(self, directory: str) -> None:
-        """Scan the given directory"""
+        return runner_filter
 
-        self.config.directory = [directory]
-        self.run(source_type=SourceTypes[BCSourceType.KUBERNETES_WORKLOADS])
-        self.upload_results_periodically(root_folder=directory)
+    def reset_runners(self) -> None:
+        """Removes the definitions of the previous scan, otherwise the runners would just scan them again"""
 
-        self.logger.info(f"Successfully scanned directory {directory} and uploaded results")
+        self.scan_reports = []
+        for runner in self.runners:
+            if runner.context is not None:
+                runner.set_external_data(definitions=None, context=None, breadcrumbs=None)
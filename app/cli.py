@@ -0,0 +1,88 @@
+"""Validates Kubernetes manifests against the admission policy without a running Whorf, ex. in a CI pipeline
+
+ex.
+    kubectl get deploy,sts,ds -A -o json > objects.json
+    python -m app.cli objects.json --checkov-config config/.checkov.yaml
+
+The results are written as newline delimited JSON to stdout, the exit code is 1, if any object would be rejected.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sys
+from collections.abc import Iterator
+from dataclasses import asdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import yaml
+from flask import Flask
+
+from app.batch import chunked, iter_objects, to_objects, validate_objects
+from app.checkov_whorf import CheckovWhorf
+from app.consts import CHECKOV_CONFIG_PATH, DEFAULT_CHECKOV_ARGS, LOG_LEVEL, WHORF_CONFIG_PATH
+from app.models import WhorfConfig
+from app.utils import get_whorf_config
+
+if TYPE_CHECKING:
+    from checkov.common.output.report import Report
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Validates Kubernetes manifests against the Whorf admission policy")
+    parser.add_argument(
+        "files", nargs="+", help="JSON, NDJSON or YAML files with Kubernetes objects, Lists or AdmissionReviews"
+    )
+    parser.add_argument("--checkov-config", default=str(CHECKOV_CONFIG_PATH), help="Path of the .checkov.yaml")
+    args = parser.parse_args(argv)
+
+    logger = logging.getLogger("whorf.cli")
+    logger.setLevel(LOG_LEVEL)
+
+    whorf_conf = get_whorf_config() if WHORF_CONFIG_PATH.exists() else WhorfConfig(ignores_namespaces=[])
+    # the verdicts are logged via the Flask app like for admission requests
+    app = Flask("whorf-cli")
+    whorf_conf.init_app(app)
+
+    ckv_whorf = CheckovWhorf(logger=logger, argv=DEFAULT_CHECKOV_ARGS, config_path=Path(args.checkov_config))
+    ckv_whorf.update_config()
+
+    def scan(objects: dict[str, dict[str, Any]]) -> list[Report]:
+        ckv_whorf.scan_objects(objects=objects)
+        return ckv_whorf.scan_reports
+
+    exit_code = 0
+    with app.app_context():
+        for file in args.files:
+            for chunk in chunked(load_objects(Path(file)), whorf_conf.batch_chunk_size):
+                results = validate_objects(
+                    objects=chunk,
+                    scan=scan,
+                    policy_index=ckv_whorf.policy_index,
+                    ignored_namespaces=whorf_conf.ignored_namespaces,
+                )
+                for result in results:
+                    sys.stdout.write(f"{json.dumps(asdict(result))}\n")
+                    exit_code = exit_code if result.allowed else 1
+
+    return exit_code
+
+
+def load_objects(file_path: Path) -> Iterator[dict[str, Any]]:
+    """Reads the objects of the file lazily, which are then scanned chunk by chunk"""
+
+    with file_path.open() as f:
+        if file_path.suffix in (".json", ".ndjson", ".jsonl"):
+            yield from iter_objects(f)
+            return
+
+        for document in yaml.safe_load_all(f):
+            if document:
+                yield from to_objects(document)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,11 +2,104 @@ import os
 import re
 from pathlib import Path
 
+from checkov.common.bridgecrew.severities import BcSeverities
+
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# the app is loaded in the Gunicorn master and the workers are forked from it, see gunicorn.conf.py
+PRELOAD = os.environ.get("WHORF_PRELOAD", "false").lower() == "true"
+# number of processes to offload the scans to, 0 scans in the web server process
+SCAN_PROCESSES = int(os.environ.get("WHORF_SCAN_PROCESSES", "0"))
 
 CHECKOV_CONFIG_PATH = Path("config/.checkov.yaml")
+# the config files are mounted from ConfigMaps and checked for changes in this interval instead of per request
+CONFIG_RELOAD_INTERVAL_IN_SEC = 10
 MANIFEST_ROOT_PATH = Path("/tmp")  # noqa: S108
 WHORF_CONFIG_PATH = Path("config/whorf.yaml")
 
 DEFAULT_CHECKOV_ARGS = ["--framework", "kubernetes", "--repo-id", "k8s_ac/cluster"]
 UUID_PATTERN = re.compile(r"\b[0-9a-f]{8}\b-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-\b[0-9a-f]{12}\b")
+# strings, brackets, colons and literals of a JSON document to read single fields of an AdmissionReview without decoding it
+JSON_TOKEN_PATTERN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]:]|[^\s"{}\[\]:,]+')
+
+# metadata fields, which change without changing the object itself, are ignored for the verdict cache key
+VOLATILE_METADATA_FIELDS = frozenset(
+    (
+        "creationTimestamp",
+        "deletionGracePeriodSeconds",
+        "deletionTimestamp",
+        "generation",
+        "managedFields",
+        "resourceVersion",
+        "selfLink",
+        "uid",
+    )
+)
+
+# the container check results of a pod template are reused by the ReplicaSets and Pods of a Deployment
+POD_TEMPLATE_CACHE_SIZE = 500
+POD_TEMPLATE_CACHE_TTL_IN_SEC = 3600
+POD_TEMPLATE_HASH_LABELS = frozenset(("controller-revision-hash", "pod-template-generation", "pod-template-hash"))
+SERVICE_ACCOUNT_VOLUME_PREFIX = "kube-api-access-"
+
+# scratch files in the manifest directory, which are deleted, when they are older than the max spool age
+SPOOL_FILE_PATTERNS = ("*-req.yaml", "*-req.json", "*-req-reports.json", "*-req-images.json", "audit-*.yaml")
+SPOOL_MAX_BYTES = 100 * 1024 * 1024
+
+# the upload is triggered ahead of schedule, when the upload queue is filled up to this ratio
+UPLOAD_QUEUE_HIGH_WATERMARK = 0.8
+
+# scans are serialized by the engine lock, but scans exceeding the deadline shouldn't block new requests
+SCAN_EXECUTOR_MAX_WORKERS = 4
+# scans, which don't decide an admission, yield to the admission scans, but wait at most this long
+BACKGROUND_SCAN_QUEUE_SIZE = 100
+BACKGROUND_SCAN_MAX_WAIT_IN_SEC = 10
+
+# SCA image findings are classified by the prefix of their check ID
+SCA_CHECK_ID_PREFIX_LENGTH = 7
+SCA_CHECK_ID_PREFIXES = {"BC_LIC_": "license", "BC_VUL_": "cve"}
+# the file path of an SCA image record contains the image name, ex. '/uid-req.yaml (nginx lines:1-98 (sha256:1403e55ab3))'
+SCA_IMAGE_NAME_PATTERN = re.compile(r" \((?P<image_name>\S+) lines:")
+CVE_SEVERITIES = (BcSeverities.CRITICAL, BcSeverities.HIGH, BcSeverities.MEDIUM, BcSeverities.LOW)
+
+# scanned once by every new engine to run the complete Checkov setup ahead of the first admission request
+WARM_UP_MANIFEST = {
+    "apiVersion": "v1",
+    "kind": "Pod",
+    "metadata": {"name": "whorf-warm-up", "namespace": "default"},
+    "spec": {"containers": [{"name": "warm-up", "image": "busybox"}]},
+}
+
+# a scan running longer than this is considered as wedged and fails the liveness probe
+MAX_SCAN_DURATION_IN_SEC = 300
+# a failed warm-up is retried with a doubled delay, after the last attempt the liveness probe fails
+WARM_UP_MAX_ATTEMPTS = 5
+WARM_UP_RETRY_DELAY_IN_SEC = 2
+# the scan processes wait this long for each other during the warm-up, before the attempt fails
+WARM_UP_TIMEOUT_IN_SEC = 120
+
+# the results of a batch validation are returned as newline delimited JSON, one object per line
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# spans of sampled traces are exported in batches, the oldest ones are dropped, when the exporter can't keep up
+TRACING_EXPORT_INTERVAL_IN_SEC = 5
+TRACING_EXPORT_TIMEOUT_IN_SEC = 5
+TRACING_MAX_QUEUE_SIZE = 2048
+TRACING_FILE_PATH = "/tmp/whorf-traces.jsonl"  # noqa: S108
+TRACING_COLLECTOR_ENDPOINT = "http://localhost:4318/v1/traces"
+
+# existing objects of the cluster are audited in small chunks, so admission requests never wait long for the engine
+AUDIT_CHUNK_SIZE = 10
+AUDIT_LIST_PAGE_SIZE = 500
+AUDIT_REQUEST_TIMEOUT_IN_SEC = 30
+AUDIT_RESOURCES = (
+    "v1/pods",
+    "apps/v1/deployments",
+    "apps/v1/statefulsets",
+    "apps/v1/daemonsets",
+    "batch/v1/jobs",
+    "batch/v1/cronjobs",
+)
+# only a single Gunicorn worker audits the cluster, the others skip the audit as long as it holds the lock
+AUDIT_LOCK_PATH = Path("/tmp/whorf-audit.lock")  # noqa: S108
+MANIFEST_FILE_SUFFIXES = frozenset((".json", ".yaml", ".yml"))
+SERVICE_ACCOUNT_PATH = Path("/var/run/secrets/kubernetes.io/serviceaccount")
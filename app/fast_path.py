@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import copy
+import logging
+import threading
+from typing import TYPE_CHECKING, Any
+
+from checkov.common.bridgecrew.check_type import CheckType
+from checkov.common.models.enums import CheckResult
+from checkov.common.util.type_forcers import convert_csv_string_arg_to_list
+from checkov.kubernetes.checks.resource.registry import registry
+from checkov.kubernetes.kubernetes_utils import get_skipped_checks
+from checkov.kubernetes.parser.validatior import K8sValidator
+
+from app.kubernetes_runner import to_definition
+from app.metrics import FAST_PATH_COMPARISONS, FAST_PATH_DIVERGENCES, FAST_PATH_DURATION
+from app.models import FastPathResult
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from checkov.common.checks.base_check import BaseCheck
+    from checkov.common.output.report import Report
+
+    from app.models import PolicyIndex
+
+logger = logging.getLogger("whorf.fast_path")
+
+
+class HardFailEvaluator:
+    """Evaluates the hard fail checks directly on a decoded object without a Checkov run
+
+    The checks of the 'hard-fail-on' config are looked up once per config change in the Kubernetes check registry
+    and mapped by kind, so the predicates are the ones of Checkov, but the runner, the reports and the graph are
+    skipped. Hard fail entries, which aren't Kubernetes resource checks (graph checks, severities, external checks),
+    can't be evaluated this way, then the evaluator is incomplete and Checkov decides.
+    """
+
+    def __init__(self, hard_fail_on: Iterable[str] = (), skip_checks: Iterable[str] = ()) -> None:
+        hard_fail_ids = frozenset(hard_fail_on)
+        skip_ids = frozenset(convert_csv_string_arg_to_list(list(skip_checks)))
+
+        known_ids: set[str] = set()
+        own_checks: dict[str, BaseCheck] = {}
+        self.checks_by_kind: dict[str, list[BaseCheck]] = {}
+        for kind, checks in registry.checks.items():
+            for check in checks:
+                check_ids = {check_id for check_id in (check.id, check.bc_id) if check_id}
+                known_ids.update(check_ids)
+                if check_ids.isdisjoint(hard_fail_ids) or not check_ids.isdisjoint(skip_ids):
+                    continue
+
+                # the checks keep state of the current evaluation, therefore the evaluator uses its own copies
+                own_check = own_checks.setdefault(check.id, copy.copy(check))
+                self.checks_by_kind.setdefault(kind, []).append(own_check)
+
+        self.unsupported_ids = hard_fail_ids - known_ids
+        self._lock = threading.Lock()
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.checks_by_kind) and not self.unsupported_ids
+
+    def evaluate(self, obj: dict[str, Any]) -> FastPathResult:
+        """Runs the hard fail checks of the object kind, like the Checkov registry would do for the object"""
+
+        with FAST_PATH_DURATION.time():
+            hard_fails: dict[str, str] = {}
+            is_valid, _ = K8sValidator.is_valid_template(obj)
+            if not is_valid:
+                # Checkov skips invalid objects as well
+                return FastPathResult(hard_fails=hard_fails)
+
+            entity_type, entity_conf = registry.extract_entity_details(to_definition(obj))
+            skipped_ids = {skipped["id"] for skipped in get_skipped_checks(entity_conf)}
+
+            # the evaluations take a fraction of a millisecond, therefore concurrent requests just wait for each other
+            with self._lock:
+                for check in self.checks_by_kind.get(entity_type, ()):
+                    if check.id in skipped_ids or check.bc_id in skipped_ids:
+                        continue
+
+                    result = check.scan_entity_conf(entity_conf, entity_type)
+                    if isinstance(result, tuple):
+                        result = result[0]
+                    if result == CheckResult.FAILED:
+                        hard_fails[check.id] = f"\n  Description: {check.name}"
+                        if check.guideline:
+                            hard_fails[check.id] += f"\n  Guidance: {check.guideline}"
+
+        return FastPathResult(hard_fails=hard_fails)
+
+
+def compare_fast_path_result(
+    fast_path_result: FastPathResult, scan_reports: list[Report], policy_index: PolicyIndex, obj_kind_name: str
+) -> bool:
+    """Cross-checks the fast path result against the hard fail checks failed by Checkov and reports any divergence
+
+    Returns, if both failed the same hard fail checks.
+    """
+
+    checkov_ids = {
+        record.check_id
+        for report in scan_reports
+        if report.check_type == CheckType.KUBERNETES
+        for record in report.failed_checks
+        if policy_index.is_hard_fail(check_id=record.check_id, bc_check_id=record.bc_check_id)
+    }
+    fast_path_ids = set(fast_path_result.hard_fails)
+    if checkov_ids == fast_path_ids:
+        FAST_PATH_COMPARISONS.labels(result="match").inc()
+        return True
+
+    FAST_PATH_COMPARISONS.labels(result="divergence").inc()
+    for check_id in fast_path_ids - checkov_ids:
+        FAST_PATH_DIVERGENCES.labels(check_id=check_id, source="fast_path").inc()
+    for check_id in checkov_ids - fast_path_ids:
+        FAST_PATH_DIVERGENCES.labels(check_id=check_id, source="checkov").inc()
+    logger.warning(
+        f"Fast path diverged from Checkov for object {obj_kind_name}, only failed by the fast path: "
+        f"{sorted(fast_path_ids - checkov_ids)}, only failed by Checkov: {sorted(checkov_ids - fast_path_ids)}"
+    )
+    return False
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from multiprocessing.sharedctypes import SynchronizedArray
+
+
+class HealthMonitor:
+    """Tracks the warm-up of the scanner engine and the running scans for the readiness and liveness probes"""
+
+    def __init__(self, max_scan_duration_in_sec: float) -> None:
+        self.max_scan_duration_in_sec = max_scan_duration_in_sec
+        self.ready = threading.Event()
+        self.warm_up_failed = threading.Event()
+        # start times of the scans in the scan processes, which track them themselves, 0 for an idle process
+        self.scan_process_start_times: SynchronizedArray[float] | None = None
+
+        self._scan_start_times: dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track_scan(self) -> Iterator[None]:
+        """Records the duration of the scan run within the context by a thread of this process"""
+
+        scan_id = threading.get_ident()
+        with self._lock:
+            self._scan_start_times[scan_id] = time.monotonic()
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._scan_start_times.pop(scan_id, None)
+
+    def get_wedged_scan_duration(self) -> float | None:
+        """Returns the duration of the longest running scan, if it exceeds the max scan duration"""
+
+        with self._lock:
+            start_times = list(self._scan_start_times.values())
+        if self.scan_process_start_times is not None:
+            start_times.extend(start_time for start_time in self.scan_process_start_times[:] if start_time)
+
+        if not start_times:
+            return None
+        duration = time.monotonic() - min(start_times)
+
+        return duration if duration > self.max_scan_duration_in_sec else None
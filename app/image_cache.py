@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from app.cache import TTLCache
+from app.metrics import SCA_IMAGE_CACHE_LOOKUPS
+from app.models import ImageScanResult
+
+if TYPE_CHECKING:
+    from app.models import WhorfConfig
+
+logger = logging.getLogger("whorf.image_cache")
+
+
+class ImageScanCache:
+    """Results of the SCA image scan mapped by the image digest, kept in memory and optionally on disk
+
+    Images referenced by a tag are mapped by their reference instead, the TTL makes sure, that moved tags and new
+    vulnerabilities of an image are picked up eventually. The disk store survives restarts and is shared by all
+    processes, which use the same path.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, path: Path | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+
+        self._memory: TTLCache[ImageScanResult] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._disk_lock = threading.Lock()
+
+        if path:
+            path.mkdir(parents=True, exist_ok=True)
+
+    def resize(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = self._memory.maxsize = maxsize
+        self.ttl = self._memory.ttl = ttl
+
+    def get(self, image_name: str) -> ImageScanResult | None:
+        key = get_image_cache_key(image_name)
+        if result := self._memory.get(key):
+            SCA_IMAGE_CACHE_LOOKUPS.labels(result="memory_hit").inc()
+            return result
+
+        if result := self._load(key):
+            SCA_IMAGE_CACHE_LOOKUPS.labels(result="disk_hit").inc()
+            self._memory.set(key, result)
+            return result
+
+        SCA_IMAGE_CACHE_LOOKUPS.labels(result="miss").inc()
+        return None
+
+    def set(self, image_name: str, result: ImageScanResult) -> None:
+        key = get_image_cache_key(image_name)
+        self._memory.set(key, result)
+        self._store(key, result)
+
+    def _load(self, key: str) -> ImageScanResult | None:
+        if not self.path:
+            return None
+
+        file_path = self.path / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+        try:
+            entry = json.loads(file_path.read_text())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning(f"Failed to read the cached image scan result {file_path}", exc_info=True)
+            return None
+
+        try:
+            if entry["stored_at"] + self.ttl < time.time():
+                return None
+
+            return ImageScanResult(scan_result=entry["scan_result"], license_statuses=entry["license_statuses"])
+        except (KeyError, TypeError):
+            # ex. written by a different version, it is replaced by the result of the following scan
+            logger.warning(f"Evict the invalid cached image scan result {file_path}")
+            file_path.unlink(missing_ok=True)
+            return None
+
+    def _store(self, key: str, result: ImageScanResult) -> None:
+        if not self.path or self.maxsize <= 0:
+            return
+
+        file_path = self.path / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+        entry = {
+            "stored_at": time.time(),
+            "scan_result": result.scan_result,
+            "license_statuses": result.license_statuses,
+        }
+        with self._disk_lock:
+            # other processes may read the file at the same time, therefore it is replaced atomically
+            tmp_file_path = file_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_file_path.write_text(json.dumps(entry))
+            tmp_file_path.replace(file_path)
+
+            # new results are only stored after a miss, which took way longer than listing the directory
+            file_paths = list(self.path.glob("*.json"))
+            if len(file_paths) > self.maxsize:
+                file_paths.sort(key=get_mtime)
+                for expired_file_path in file_paths[: len(file_paths) - self.maxsize]:
+                    expired_file_path.unlink(missing_ok=True)
+
+
+def get_image_cache_key(image_name: str) -> str:
+    """Returns the digest of the image reference, if it is pinned by one, otherwise the reference itself"""
+
+    _, _, digest = image_name.partition("@")
+    return digest or image_name
+
+
+def get_mtime(file_path: Path) -> float:
+    try:
+        return file_path.stat().st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+def create_image_cache(whorf_conf: WhorfConfig) -> ImageScanCache | None:
+    """Creates the image scan cache based on the whorf config, if it is enabled"""
+
+    if whorf_conf.sca_image_cache_size <= 0:
+        return None
+
+    return ImageScanCache(
+        maxsize=whorf_conf.sca_image_cache_size,
+        ttl=whorf_conf.sca_image_cache_ttl_in_sec,
+        path=Path(whorf_conf.sca_image_cache_path) if whorf_conf.sca_image_cache_path else None,
+    )
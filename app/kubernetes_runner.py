@@ -0,0 +1,420 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Any, cast
+
+from checkov.common.bridgecrew.check_type import CheckType
+from checkov.common.graph.checks_infra.enums import SolverType
+from checkov.common.util.consts import END_LINE, START_LINE
+from checkov.common.util.data_structures_utils import pickle_deepcopy
+from checkov.kubernetes.checks.resource.base_container_check import BaseK8sContainerCheck
+from checkov.kubernetes.checks.resource.registry import registry
+from checkov.kubernetes.image_referencer.provider.k8s import SUPPORTED_K8S_IMAGE_RESOURCE_TYPES
+from checkov.kubernetes.kubernetes_utils import build_definitions_context, get_skipped_checks
+from checkov.kubernetes.parser.validatior import K8sValidator
+from checkov.kubernetes.runner import Runner as KubernetesRunner
+from checkov.kubernetes.runner import _get_entity_abs_path
+
+from app.cache import TTLCache
+from app.consts import (
+    POD_TEMPLATE_CACHE_SIZE,
+    POD_TEMPLATE_CACHE_TTL_IN_SEC,
+    POD_TEMPLATE_HASH_LABELS,
+)
+from app.metrics import CHECKOV_GRAPH_BUILDS, CHECKOV_RUN_DURATION
+from app.models import ImageScanResult
+from app.tracing import tracer
+from app.utils import dump_manifest, is_service_account_volume
+
+if TYPE_CHECKING:
+    from checkov.common.checks.base_check import BaseCheck
+    from checkov.common.graph.checks_infra.base_check import BaseGraphCheck
+    from checkov.common.models.enums import CheckResult
+    from checkov.common.output.report import Report
+    from checkov.common.typing import _CheckResult, _LicenseStatus, _SkippedCheck
+    from checkov.runner_filter import RunnerFilter
+
+    from app.image_cache import ImageScanCache
+
+
+def to_definition(obj: Any) -> Any:
+    """Copies a decoded JSON object and adds the line markers, like the Checkov JSON parser would do"""
+
+    if isinstance(obj, dict):
+        definition = {key: to_definition(value) for key, value in obj.items()}
+        definition[START_LINE] = 0
+        definition[END_LINE] = 0
+        return definition
+    elif isinstance(obj, list):
+        return [to_definition(item) for item in obj]
+
+    return obj
+
+
+def get_pod_template(entity_conf: dict[str, Any]) -> tuple[str, dict[str, Any], dict[str, Any]] | None:
+    """Extracts the pod template of a Pod or workload object like a Deployment
+
+    Returns the evaluated key prefix used by the container checks, the pod metadata and the pod spec.
+    """
+
+    kind = entity_conf.get("kind")
+    if kind == "Pod":
+        evaluated_key_prefix = "spec"
+        metadata = entity_conf.get("metadata")
+        spec = entity_conf.get("spec")
+    elif kind in BaseK8sContainerCheck.TEMPLATE_ENTITIES:
+        evaluated_key_prefix = "spec/template/spec"
+        template = (entity_conf.get("spec") or {}).get("template")
+        if not isinstance(template, dict):
+            return None
+        metadata = template.get("metadata")
+        spec = template.get("spec")
+    else:
+        return None
+
+    if not isinstance(spec, dict):
+        return None
+
+    return evaluated_key_prefix, metadata if isinstance(metadata, dict) else {}, spec
+
+
+def get_pod_template_fingerprint(metadata: dict[str, Any], spec: dict[str, Any]) -> str:
+    """Creates a hash of the parts of a pod template, which are evaluated by the container checks
+
+    Labels added by the controllers and the service account token volume are removed, because they differ between
+    a Deployment, its ReplicaSet and each of its Pods.
+    """
+
+    labels = {
+        key: value for key, value in (metadata.get("labels") or {}).items() if key not in POD_TEMPLATE_HASH_LABELS
+    }
+    containers = {
+        container_type: [
+            {
+                **container,
+                "volumeMounts": [
+                    mount for mount in container.get("volumeMounts") or [] if not is_service_account_volume(mount)
+                ],
+            }
+            for container in spec.get(container_type) or []
+            if isinstance(container, dict)
+        ]
+        for container_type in ("containers", "initContainers")
+    }
+
+    fingerprint = json.dumps(
+        {"labels": labels, "annotations": metadata.get("annotations"), "containers": containers},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(fingerprint.encode()).hexdigest()
+
+
+def get_graph_check_kinds(check: BaseGraphCheck) -> set[str] | None:
+    """Collects the kinds of the resources and connected resources of the graph check and its sub checks
+
+    Returns None, if the graph check applies to all kinds.
+    """
+
+    if check.sub_checks:
+        kinds: set[str] = set()
+        for sub_check in check.sub_checks:
+            if sub_check.type == SolverType.FILTER:
+                # filters only narrow down the resources of the other sub checks
+                continue
+            sub_check_kinds = get_graph_check_kinds(sub_check)
+            if sub_check_kinds is None:
+                return None
+            kinds.update(sub_check_kinds)
+        return kinds
+
+    resource_types = {*(check.resource_types or ()), *(check.connected_resources_types or ())}
+    if not check.resource_types or "all" in resource_types:
+        return None
+
+    return resource_types
+
+
+class KubernetesObjectRunner(KubernetesRunner):
+    """Kubernetes runner, which additionally supports scanning already decoded objects
+
+    The results of the container checks are kept per pod template, so the Pods and ReplicaSets of a Deployment
+    only need to be evaluated by the remaining checks.
+    The resource checks are already selected by kind via the check registry, the graph checks are mapped
+    by kind here, so the graph is only built, if a selected graph check or the image scan applies to the objects.
+    """
+
+    def __init__(self, image_cache: ImageScanCache | None = None) -> None:
+        super().__init__()
+
+        # results of the SCA image scan, which are reused by all objects referencing the same image
+        self.image_cache = image_cache
+        # results of the current run, which were found in the cache by the first lookup, mapped by the image name
+        self._cached_image_results: dict[str, ImageScanResult] = {}
+        # results of the current run, which were not cached, yet, mapped by the image name
+        self._uncached_image_results: dict[str, dict[str, Any]] = {}
+
+        # container check results mapped by check ID without the evaluated key prefix
+        self.template_results: TTLCache[dict[str, tuple[CheckResult, list[str]]]] = TTLCache(
+            maxsize=POD_TEMPLATE_CACHE_SIZE, ttl=POD_TEMPLATE_CACHE_TTL_IN_SEC
+        )
+        # duration of the image scan within the current run
+        self.image_scan_duration = 0.0
+
+        # graph checks mapped by the kinds they apply to, '*' for all kinds, reset, when the checks change
+        self.graph_checks_by_kind: dict[str, list[BaseGraphCheck]] | None = None
+        # the graph is skipped, if neither a selected graph check nor the image scan applies to the loaded objects
+        self.graph_needed = True
+        # directory of the virtual file paths of the loaded objects, the record paths are relative to it
+        self.objects_root_folder: str | None = None
+
+    def run(
+        self,
+        root_folder: str | None,
+        external_checks_dir: list[str] | None = None,
+        files: list[str] | None = None,
+        runner_filter: RunnerFilter | None = None,
+        collect_skip_comments: bool = True,  # noqa: FBT001, FBT002  # same signature as the parent
+    ) -> Report | list[Report]:
+        # the image scan is part of the Kubernetes run, but is measured separately as SCA image framework
+        self.image_scan_duration = 0.0
+        graph_manager = self.graph_manager
+        if not self.graph_needed:
+            # the parent runs the graph checks and the image scan against the graph of the previous run otherwise
+            self.graph_manager = None
+
+        # like a scan of the directory, which the manifests are uploaded from
+        root_folder = root_folder or self.objects_root_folder
+
+        start_time = time.perf_counter()
+        try:
+            with tracer.start_span("runner", framework=CheckType.KUBERNETES, graph=self.graph_needed):
+                reports = super().run(root_folder, external_checks_dir, files, runner_filter, collect_skip_comments)
+        finally:
+            self.graph_manager = graph_manager
+            self.graph_needed = True
+        duration = time.perf_counter() - start_time
+
+        CHECKOV_RUN_DURATION.labels(framework=CheckType.KUBERNETES).observe(duration - self.image_scan_duration)
+        if self.image_scan_duration:
+            CHECKOV_RUN_DURATION.labels(framework=CheckType.SCA_IMAGE).observe(self.image_scan_duration)
+
+        return reports
+
+    def get_image_report(self, root_folder: str | None, runner_filter: RunnerFilter) -> Report | None:
+        start_time = time.perf_counter()
+        with tracer.start_span("sca_image_scan"):
+            report = super().get_image_report(root_folder, runner_filter)
+        self.image_scan_duration = time.perf_counter() - start_time
+
+        return report
+
+    # the parent methods are static, but the cache belongs to the runner
+    async def _fetch_image_results_async(  # type: ignore[override]
+        self, image_names_to_query: list[str]
+    ) -> list[dict[str, Any]]:
+        """Looks up the image scan results in the image cache, before they are fetched from the platform"""
+
+        if not self.image_cache:
+            return await super()._fetch_image_results_async(image_names_to_query)
+
+        cached_results = {name: self.image_cache.get(name) for name in image_names_to_query}
+        self._cached_image_results = {name: result for name, result in cached_results.items() if result}
+        uncached_names = [name for name in image_names_to_query if name not in self._cached_image_results]
+        fetched_results = await super()._fetch_image_results_async(uncached_names)
+        self._uncached_image_results = dict(zip(uncached_names, fetched_results, strict=True))
+
+        return [
+            (
+                self._cached_image_results[name].scan_result
+                if name in self._cached_image_results
+                else self._uncached_image_results[name]
+            )
+            for name in image_names_to_query
+        ]
+
+    async def _fetch_licenses_per_image(  # type: ignore[override]
+        self, image_names: list[str], image_results: list[dict[str, Any]]
+    ) -> dict[str, list[_LicenseStatus]]:
+        """Looks up the license statuses in the image cache and adds the fetched results of this run to the cache"""
+
+        if not self.image_cache:
+            return await super()._fetch_licenses_per_image(image_names, image_results)
+
+        # the results of the first lookup are reused, otherwise cache hits would be counted twice
+        license_statuses = {
+            name: cached_result.license_statuses
+            for name in image_names
+            if (cached_result := self._cached_image_results.get(name))
+        }
+
+        uncached_names = list(self._uncached_image_results)
+        license_statuses.update(
+            await super()._fetch_licenses_per_image(uncached_names, list(self._uncached_image_results.values()))
+        )
+
+        for name, scan_result in self._uncached_image_results.items():
+            # failed lookups and images unknown to the platform are not cached
+            if scan_result.get("results"):
+                self.image_cache.set(
+                    name, ImageScanResult(scan_result=scan_result, license_statuses=license_statuses.get(name) or [])
+                )
+        self._cached_image_results = {}
+        self._uncached_image_results = {}
+
+        return license_statuses
+
+    def get_graph_checks_by_kind(self) -> dict[str, list[BaseGraphCheck]]:
+        if self.graph_checks_by_kind is None:
+            graph_checks_by_kind: dict[str, list[BaseGraphCheck]] = {}
+            for check in self.graph_registry.checks if self.graph_registry else ():
+                kinds = get_graph_check_kinds(check)
+                for kind in kinds if kinds is not None else ("*",):
+                    graph_checks_by_kind.setdefault(kind, []).append(check)
+            self.graph_checks_by_kind = graph_checks_by_kind
+
+        return self.graph_checks_by_kind
+
+    def is_graph_needed(self, kinds: set[str], runner_filter: RunnerFilter) -> bool:
+        """Checks, if a graph check selected by the runner filter or the image scan applies to the given kinds"""
+
+        if runner_filter.run_image_referencer and not kinds.isdisjoint(SUPPORTED_K8S_IMAGE_RESOURCE_TYPES):
+            return True
+
+        graph_checks_by_kind = self.get_graph_checks_by_kind()
+        for kind in ("*", *kinds):
+            for check in graph_checks_by_kind.get(kind, ()):
+                if runner_filter.should_run_check(check=check, report_type=self.check_type):
+                    return True
+
+        return False
+
+    def load_objects(self, objects: dict[str, dict[str, Any]], runner_filter: RunnerFilter | None = None) -> None:
+        """Sets the given objects mapped by a virtual file path as definitions, which are scanned by the next run
+
+        Without a runner filter, the run goes through the complete Checkov setup and therefore always needs the graph.
+        """
+
+        self.definitions = {}
+        self.definitions_raw = {}
+        self.objects_root_folder = os.path.commonpath([os.path.dirname(file_path) for file_path in objects]) or None
+        for file_path, obj in objects.items():
+            is_valid, reason = K8sValidator.is_valid_template(obj)
+            if not is_valid:
+                logging.info(
+                    f"Skipping object {file_path}, because it is not a valid Kubernetes object, reason: {reason}"
+                )
+                continue
+
+            self.definitions[file_path] = [to_definition(obj)]
+            # the whole object is represented as one JSON line, which is also the form of the uploaded manifest
+            self.definitions_raw[file_path] = [(1, dump_manifest(obj))]
+
+        self.context = build_definitions_context(self.definitions, self.definitions_raw)
+        self.spread_list_items()
+
+        kinds = {str(entity.get("kind")) for entities in self.definitions.values() for entity in entities}
+        self.graph_needed = runner_filter is None or self.is_graph_needed(kinds=kinds, runner_filter=runner_filter)
+        if not self.graph_needed:
+            CHECKOV_GRAPH_BUILDS.labels(result="skipped").inc()
+        elif self.graph_manager:
+            CHECKOV_GRAPH_BUILDS.labels(result="built").inc()
+            local_graph = self.graph_manager.build_graph_from_definitions(pickle_deepcopy(self.definitions))
+            self.graph_manager.save_graph(local_graph)
+
+    def check_definitions(
+        self,
+        root_folder: str | None,
+        runner_filter: RunnerFilter,
+        report: Report,
+        collect_skip_comments: bool = True,  # noqa: FBT001, FBT002  # same signature as the parent
+    ) -> Report:
+        # same as the parent method, but scans the entities via 'scan_entity()'
+        for k8_file in self.definitions:
+            self.pbar.set_additional_data({"Current File Scanned": os.path.relpath(k8_file, root_folder)})
+            file_abs_path = _get_entity_abs_path(root_folder, k8_file)
+            k8_file_path = f"/{os.path.relpath(file_abs_path, root_folder)}"
+            for entity_conf in self.definitions[k8_file]:
+                if entity_conf.get("kind") == "Kustomization":
+                    continue
+
+                skipped_checks = get_skipped_checks(entity_conf)
+                results = self.scan_entity(k8_file, entity_conf, skipped_checks, runner_filter)
+
+                report = self.mutate_kubernetes_results(
+                    results, report, k8_file, k8_file_path, file_abs_path, entity_conf, {}, root_folder
+                )
+            self.pbar.update()
+        self.pbar.close()
+        return report
+
+    def scan_entity(
+        self,
+        k8_file: str,
+        entity_conf: dict[str, Any],
+        skipped_checks: list[_SkippedCheck],
+        runner_filter: RunnerFilter,
+    ) -> dict[BaseCheck, _CheckResult]:
+        """Scans the entity like the check registry, but reuses the container check results of known pod templates"""
+
+        pod_template = get_pod_template(entity_conf)
+        if not pod_template:
+            return registry.scan(k8_file, entity_conf, skipped_checks, runner_filter)
+
+        evaluated_key_prefix, metadata, spec = pod_template
+        fingerprint = get_pod_template_fingerprint(metadata=metadata, spec=spec)
+        template_results = self.template_results.get(fingerprint)
+
+        if template_results is None:
+            results = registry.scan(k8_file, entity_conf, skipped_checks, runner_filter)
+            self.template_results.set(
+                fingerprint,
+                {
+                    check.id: (
+                        cast("CheckResult", result["result"]),
+                        [key.removeprefix(f"{evaluated_key_prefix}/") for key in result.get("evaluated_keys") or []],
+                    )
+                    for check, result in results.items()
+                    if isinstance(check, BaseK8sContainerCheck) and "evaluated_keys" in result
+                },
+            )
+            return results
+
+        entity_type, entity_configuration = registry.extract_entity_details(entity_conf)
+        skip_infos = {skipped["id"]: skipped for skipped in skipped_checks}
+
+        results = {}
+        for check in registry.get_checks(entity_type):
+            # mirrors the check selection of the registry, the parity is covered by the tests of the benchmark corpus
+            if not registry._should_run_scan(check, entity_configuration, runner_filter, registry.report_type):
+                continue
+
+            skip_info = skip_infos.get(check.id, {})
+            if check.id in template_results and not skip_info:
+                check_result, evaluated_keys = template_results[check.id]
+                results[check] = {
+                    "result": check_result,
+                    "evaluated_keys": [f"{evaluated_key_prefix}/{key}" for key in evaluated_keys],
+                }
+            else:
+                result = check.run(
+                    scanned_file=k8_file,
+                    entity_configuration=entity_configuration,
+                    entity_name=entity_type,
+                    entity_type=entity_type,
+                    skip_info=skip_info,
+                )
+                results[check] = result
+                if isinstance(check, BaseK8sContainerCheck) and "evaluated_keys" in result:
+                    # the previous scans of the pod template may have run a different selection of checks
+                    template_results[check.id] = (
+                        cast("CheckResult", result["result"]),
+                        [key.removeprefix(f"{evaluated_key_prefix}/") for key in result["evaluated_keys"]],
+                    )
+
+        return results
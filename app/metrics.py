@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+if TYPE_CHECKING:
+    from checkov.common.output.report import Report
+
+# the values of all Gunicorn workers and scan processes are aggregated via files in this directory
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+ADMISSION_DURATION = Histogram(
+    "whorf_admission_duration_seconds",
+    "End-to-end duration of an admission request",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25),
+)
+REQUEST_DECODE_DURATION = Histogram(
+    "whorf_request_decode_duration_seconds",
+    "Duration of decoding the JSON body of an admission request",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+MANIFEST_DUMP_DURATION = Histogram(
+    "whorf_manifest_dump_duration_seconds",
+    "Duration of dumping an admitted object to a manifest file for the upload",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+CHECKOV_RUN_DURATION = Histogram(
+    "whorf_checkov_run_duration_seconds",
+    "Duration of a Checkov run per framework",
+    ["framework"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25),
+)
+REPORT_PROCESSING_DURATION = Histogram(
+    "whorf_report_processing_duration_seconds",
+    "Duration of deciding about the admission based on the scan reports",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+FAST_PATH_DURATION = Histogram(
+    "whorf_fast_path_duration_seconds",
+    "Duration of evaluating the hard fail checks on the decoded object without a Checkov run",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025),
+)
+UPLOAD_DURATION = Histogram(
+    "whorf_upload_duration_seconds",
+    "Duration of uploading a batch of scanned manifests",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60),
+)
+
+ADMISSION_DECISIONS = Counter(
+    "whorf_admission_decisions",
+    "Admission decisions by their outcome (allowed, denied, ignored_namespace, invalid_uid)",
+    ["decision"],
+)
+FAILED_CHECKS = Counter("whorf_failed_checks", "Failed checks of scanned objects", ["check_id"])
+UPLOAD_DROPPED = Counter("whorf_upload_dropped", "Scanned manifests dropped, because the upload queue was full")
+UPLOAD_DEDUPLICATED = Counter(
+    "whorf_upload_deduplicated",
+    "Scanned manifests skipped, because an identical manifest was uploaded in the same batch",
+)
+SPOOL_EVICTIONS = Counter(
+    "whorf_spool_evictions",
+    "Scratch files deleted before their upload by `reason` (age, bytes, files, duplicate, orphan)",
+    ["reason"],
+)
+SCA_IMAGE_CACHE_LOOKUPS = Counter(
+    "whorf_sca_image_cache_lookups",
+    "Lookups of image scan results by `result` (memory_hit, disk_hit, miss)",
+    ["result"],
+)
+VERDICT_CACHE_LOOKUPS = Counter(
+    "whorf_verdict_cache_lookups", "Lookups of cached admission verdicts by `result` (hit, miss)", ["result"]
+)
+VERDICT_CACHE_EVICTIONS = Counter(
+    "whorf_verdict_cache_evictions", "Cached admission verdicts evicted by `reason` (expired, size)", ["reason"]
+)
+CHECKOV_GRAPH_BUILDS = Counter(
+    "whorf_checkov_graph_builds",
+    "Kubernetes graphs by `result` (built, skipped), skipped when no selected graph check applies to the objects",
+    ["result"],
+)
+FAST_PATH_COMPARISONS = Counter(
+    "whorf_fast_path_comparisons",
+    "Fast path results cross-checked against the Checkov results by `result` (match, divergence)",
+    ["result"],
+)
+FAST_PATH_DIVERGENCES = Counter(
+    "whorf_fast_path_divergences",
+    "Hard fail checks failed by only one of the fast path and Checkov by `check_id` and the failing `source`",
+    ["check_id", "source"],
+)
+BACKGROUND_SCANS_DROPPED = Counter(
+    "whorf_background_scans_dropped", "Background scans dropped, because the background scan queue was full"
+)
+AUDITED_OBJECTS = Counter("whorf_audited_objects", "Existing objects scanned by the background audit")
+
+UPLOAD_QUEUE_DEPTH = Gauge(
+    "whorf_upload_queue_depth", "Scanned manifests waiting for the upload", multiprocess_mode="livesum"
+)
+BACKGROUND_SCAN_QUEUE_DEPTH = Gauge(
+    "whorf_background_scan_queue_depth",
+    "Background scans waiting for admission scans to finish",
+    multiprocess_mode="livesum",
+)
+SPOOL_BYTES = Gauge(
+    "whorf_spool_bytes", "Size of the scratch files in the manifest directory", multiprocess_mode="livesum"
+)
+SPOOL_FILES = Gauge(
+    "whorf_spool_files", "Number of scratch files in the manifest directory", multiprocess_mode="livesum"
+)
+
+
+def generate_metrics() -> tuple[bytes, str]:
+    """Renders the metrics in the Prometheus text format and returns them with their content type"""
+
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)  # type: ignore[no-untyped-call]
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def count_failed_checks(scan_reports: list[Report]) -> None:
+    for report in scan_reports:
+        for record in report.failed_checks:
+            FAILED_CHECKS.labels(check_id=record.check_id).inc()
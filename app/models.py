@@ -1,9 +1,15 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import TYPE_CHECKING
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from app.consts import AUDIT_RESOURCES, CVE_SEVERITIES, SPOOL_MAX_BYTES, TRACING_COLLECTOR_ENDPOINT, TRACING_FILE_PATH
+from app.namespaces import NamespaceMatcher
 
 if TYPE_CHECKING:
+    from pathlib import Path
+
+    from checkov.common.output.report import Report
     from flask import Flask
 
 
@@ -11,8 +17,110 @@ if TYPE_CHECKING:
 class WhorfConfig:
     ignores_namespaces: list[str]  # a list of namespaces to ignore requests from
     upload_interval_in_min: str = "*/30"  # every 30 minutes
+    verdict_cache_size: int = 1000  # max number of cached admission verdicts, 0 disables the cache
+    verdict_cache_ttl_in_sec: int = 300
+    upload_queue_size: int = 1000  # max number of scanned manifests waiting for the upload
+    upload_batch_size: int = 100  # max number of scanned manifests per upload
+    spool_max_bytes: int = SPOOL_MAX_BYTES  # max size of the scratch files per process
+    spool_max_files: int = 5000  # max number of scratch files per process
+    spool_max_age_in_min: int = 120
+    scan_deadline_in_sec: float = 25  # has to be lower than the webhook timeout, 0 disables the deadline
+    scan_deadline_fail_open: bool = False  # allow or reject requests, which exceed the scan deadline
+    two_phase_scan: bool = False  # decide only based on the hard fail checks and run the remaining in the background
+    batch_chunk_size: int = 100  # max number of objects of a batch validation, which are scanned in a single run
+    batch_max_objects: int = 10000  # larger batch validations are rejected, 0 disables the limit
+    batch_max_objects_per_min: int = 600  # limits the share of the engine used by batch validations
+    tracing_exporter: str = "none"  # 'none', 'json-file' or 'collector'
+    tracing_sample_ratio: float = 1.0  # ratio of traced admission requests
+    tracing_file_path: str = TRACING_FILE_PATH
+    tracing_collector_endpoint: str = TRACING_COLLECTOR_ENDPOINT  # OTLP/HTTP endpoint
+    audit_source: str = "none"  # 'none', 'api-server' or 'directory'
+    audit_interval_in_min: int = 60
+    audit_directory: str = ""  # manifests to audit with the 'directory' source
+    audit_resources: list[str] = field(default_factory=lambda: list(AUDIT_RESOURCES))  # for the 'api-server' source
+    audit_max_objects_per_min: int = 60  # limits the share of the engine used by the audit
+    sca_image_cache_size: int = 500  # max number of cached image scan results, 0 disables the cache
+    sca_image_cache_ttl_in_sec: int = 21600  # refreshes the vulnerabilities of an image every 6 hours
+    sca_image_cache_path: str = ""  # optional directory to persist the cached image scan results
+    fast_path_mode: str = "off"  # 'off', 'shadow' or 'enforce', evaluates the hard fail checks without a Checkov run
+    # compiled from 'ignores_namespaces', which may contain globs like 'kube-*'
+    ignored_namespaces: NamespaceMatcher = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.ignored_namespaces = NamespaceMatcher(self.ignores_namespaces)
 
     def init_app(self, app: Flask) -> None:
         """Register whorf config to a Flask application instance"""
 
         app.extensions["whorf"] = self
+
+
+@dataclass(frozen=True)
+class Verdict:
+    allowed: bool
+    message: str
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    """Verdict of a single object of a batch validation"""
+
+    kind: str | None
+    namespace: str | None
+    name: str | None
+    allowed: bool
+    message: str
+
+
+@dataclass(frozen=True)
+class UploadItem:
+    file_path: Path  # persisted manifest
+    scan_reports: list[Report]
+    content_hash: str = ""  # canonical hash of the manifest, identical manifests of an upload batch are uploaded once
+
+
+@dataclass(frozen=True)
+class ImageScanResult:
+    """Result of the SCA image scan of the platform and the license statuses of its packages"""
+
+    scan_result: dict[str, Any]
+    license_statuses: list[Any]
+
+
+@dataclass(frozen=True)
+class PolicyIndex:
+    """Lookup tables of the Checkov config, which are built once per config change
+
+    The classification of the SCA findings by check ID prefix and severity doesn't depend on the config,
+    therefore it stays in the consts.
+    """
+
+    hard_fail_ids: frozenset[str] = frozenset()  # check IDs and BC IDs of the 'hard-fail-on' config
+
+    def is_hard_fail(self, check_id: str, bc_check_id: str | None) -> bool:
+        return check_id in self.hard_fail_ids or bc_check_id in self.hard_fail_ids
+
+
+@dataclass(frozen=True)
+class FastPathResult:
+    """Hard fail checks evaluated directly on a decoded object"""
+
+    hard_fails: dict[str, str]  # failed check ID to its description like in 'ReportSummary.hard_fails'
+
+
+@dataclass
+class ImageSummary:
+    cve_count: int = 0
+    cve_severities: dict[str, int] = field(default_factory=lambda: dict.fromkeys(CVE_SEVERITIES, 0))
+    license_count: int = 0
+
+
+@dataclass
+class ReportSummary:
+    k8s_issue_count: int | None = None  # None, if there was no Kubernetes report
+    hard_fails: dict[str, str] = field(default_factory=dict)  # check ID to its description
+    sca_image_scanned: bool = False
+    cve_count: int = 0
+    cve_severities: dict[str, int] = field(default_factory=lambda: dict.fromkeys(CVE_SEVERITIES, 0))
+    license_count: int = 0
+    images: dict[str, ImageSummary] = field(default_factory=dict)  # findings per container image
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import fnmatch
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+GLOB_CHARS = frozenset("*?[")
+
+
+class NamespaceMatcher:
+    """Matches namespaces against exact names and globs, ex. 'kube-*' for all namespaces with the prefix 'kube-'
+
+    The exact names are looked up in a set and all globs are compiled into a single regular expression once per config.
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        patterns = [str(pattern) for pattern in patterns]
+        self.names = frozenset(pattern for pattern in patterns if GLOB_CHARS.isdisjoint(pattern))
+
+        globs = [pattern for pattern in patterns if not GLOB_CHARS.isdisjoint(pattern)]
+        self.glob_pattern = re.compile("|".join(fnmatch.translate(glob) for glob in globs)) if globs else None
+
+    def __contains__(self, namespace: object) -> bool:
+        if not isinstance(namespace, str):
+            return False
+
+        return namespace in self.names or bool(self.glob_pattern and self.glob_pattern.match(namespace))
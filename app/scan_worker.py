@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any
+
+from app.checkov_whorf import CheckovWhorf
+from app.consts import DEFAULT_CHECKOV_ARGS, LOG_LEVEL
+from app.image_cache import create_image_cache
+from app.tracing import configure_tracing, tracer
+
+if TYPE_CHECKING:
+    from multiprocessing.sharedctypes import Synchronized, SynchronizedArray
+    from multiprocessing.synchronize import Barrier
+
+    from checkov.common.output.report import Report
+
+    from app.checkov_whorf import ScanPhase
+    from app.models import WhorfConfig
+    from app.tracing import SpanContext
+
+# the engine of a scan process, which is created by the process pool initializer
+ckv_whorf: CheckovWhorf | None = None
+# start times of the running scans of all scan processes of the pool, which are shared with the web server process
+# for its liveness probe, because the time a scan waits for a free scan process shouldn't count
+scan_start_times: SynchronizedArray[float] | None = None
+scan_slot = 0
+# the warm-ups wait for each other, so each one keeps a different process of the pool busy
+warm_up_barrier: Barrier | None = None
+
+
+def init_worker(
+    whorf_conf: WhorfConfig | None = None,
+    start_times: SynchronizedArray[float] | None = None,
+    slot_counter: Synchronized[int] | None = None,
+    barrier: Barrier | None = None,
+) -> None:
+    """Creates the Checkov engine of the scan process and runs its setup"""
+
+    global ckv_whorf, scan_slot, scan_start_times, warm_up_barrier
+
+    if start_times is not None and slot_counter is not None:
+        with slot_counter.get_lock():
+            scan_slot = slot_counter.value % len(start_times)
+            slot_counter.value += 1
+        scan_start_times = start_times
+    warm_up_barrier = barrier
+
+    logger = logging.getLogger("whorf.scan_worker")
+    logger.setLevel(LOG_LEVEL)
+
+    image_cache = None
+    if whorf_conf:
+        configure_tracing(whorf_conf)
+        image_cache = create_image_cache(whorf_conf)
+
+    ckv_whorf = CheckovWhorf(logger=logger, argv=DEFAULT_CHECKOV_ARGS, image_cache=image_cache)
+    # the platform integration needs to be set up for the upload, even if this process didn't scan anything yet
+    ckv_whorf.warm_up()
+
+
+def warm_up(timeout_in_sec: float | None = None) -> int:
+    """Returns the process ID as soon as the scan process was initialized including the warm-up of its engine
+
+    With the warm-up barrier it only returns, when the warm-ups of all other scan processes are running as well.
+    """
+
+    get_engine()
+    if warm_up_barrier is not None:
+        warm_up_barrier.wait(timeout=timeout_in_sec)
+
+    return os.getpid()
+
+
+@contextmanager
+def track_scan() -> Iterator[None]:
+    """Records the start time of the scan run within the context in the slot of this scan process"""
+
+    if scan_start_times is None:
+        yield
+        return
+
+    scan_start_times[scan_slot] = time.monotonic()
+    try:
+        yield
+    finally:
+        scan_start_times[scan_slot] = 0.0
+
+
+def get_engine() -> CheckovWhorf:
+    if ckv_whorf is None:
+        raise RuntimeError("The scan process was not initialized")
+
+    return ckv_whorf
+
+
+def scan_object(
+    obj: dict[str, Any], file_path: str, phase: ScanPhase, trace_context: SpanContext | None = None
+) -> tuple[bool, list[Report]]:
+    """Scans the object with the engine of the scan process and returns, if all checks were run and the reports"""
+
+    engine = get_engine()
+    # the spans of this process are part of the trace of the admission request
+    with tracer.attach(trace_context), track_scan():
+        with tracer.start_span("update_config"):
+            engine.update_config()
+        complete = engine.scan_object(obj=obj, file_path=file_path, phase=phase)
+
+    return complete, engine.scan_reports
+
+
+def upload_reports(root_folder: str, files: list[str], scan_reports: list[Report]) -> bool:
+    """Uploads the files and their reports with the engine of the scan process and returns, if it succeeded"""
+
+    return get_engine().upload_reports(root_folder=root_folder, files=files, scan_reports=scan_reports)
+
+
+def scan_objects(objects: dict[str, dict[str, Any]]) -> list[Report]:
+    """Scans the objects of a batch with all checks in a single run of the engine of the scan process"""
+
+    engine = get_engine()
+    with track_scan():
+        engine.update_config()
+        engine.scan_objects(objects=objects)
+
+    return engine.scan_reports
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from app.consts import SPOOL_FILE_PATTERNS
+from app.metrics import SPOOL_BYTES, SPOOL_EVICTIONS, SPOOL_FILES
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+@dataclass(frozen=True)
+class SpoolEntry:
+    size: int
+    created_at: float
+    content_hash: str
+
+
+class ManifestSpool:
+    """Bounds the scratch files of this process in the manifest directory by their total size, count and age
+
+    When a limit is exceeded, the oldest files are evicted. A file with the same content hash as an already spooled
+    one replaces it, therefore an object admitted repeatedly between two uploads only occupies a single file.
+    """
+
+    def __init__(self, root_path: Path, max_bytes: int, max_files: int, max_age_in_sec: float) -> None:
+        self.root_path = root_path
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_age_in_sec = max_age_in_sec
+
+        self.bytes = 0
+        self.evictions = 0
+
+        # ordered by their creation, the oldest file comes first
+        self._entries: dict[Path, SpoolEntry] = {}
+        self._hashes: dict[str, Path] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def file_count(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, file_path: Path) -> bool:
+        return file_path in self._entries
+
+    def write(self, file_path: Path, data: str, content_hash: str = "") -> None:
+        encoded_data = data.encode()
+        file_path.write_bytes(encoded_data)
+
+        with self._lock:
+            self._remove(file_path)
+            if content_hash and (duplicate_path := self._hashes.get(content_hash)):
+                self._evict(duplicate_path, reason="duplicate")
+
+            self._entries[file_path] = SpoolEntry(
+                size=len(encoded_data), created_at=time.time(), content_hash=content_hash
+            )
+            self.bytes += len(encoded_data)
+            if content_hash:
+                self._hashes[content_hash] = file_path
+
+            self._evict_expired()
+            while self._entries and (len(self._entries) > self.max_files or self.bytes > self.max_bytes):
+                self._evict(
+                    next(iter(self._entries)), reason="files" if len(self._entries) > self.max_files else "bytes"
+                )
+
+            self._update_metrics()
+
+    def remove(self, file_path: Path) -> None:
+        """Deletes the file, ex. after it was uploaded"""
+
+        with self._lock:
+            self._remove(file_path)
+            self._update_metrics()
+        file_path.unlink(missing_ok=True)
+
+    def sweep(self) -> None:
+        """Evicts the expired files of this process and deletes expired files left over by previous processes"""
+
+        with self._lock:
+            self._evict_expired()
+            self._update_metrics()
+
+            expired_at = time.time() - self.max_age_in_sec
+            for pattern in SPOOL_FILE_PATTERNS:
+                for file_path in self.root_path.glob(pattern):
+                    if file_path in self._entries:
+                        continue
+                    try:
+                        if file_path.stat().st_mtime < expired_at:
+                            file_path.unlink()
+                            SPOOL_EVICTIONS.labels(reason="orphan").inc()
+                    except FileNotFoundError:
+                        # already deleted by another process
+                        continue
+
+    def _evict_expired(self) -> None:
+        expired_at = time.time() - self.max_age_in_sec
+        while self._entries:
+            file_path, entry = next(iter(self._entries.items()))
+            if entry.created_at >= expired_at:
+                break
+            self._evict(file_path, reason="age")
+
+    def _evict(self, file_path: Path, reason: str) -> None:
+        self._remove(file_path)
+        file_path.unlink(missing_ok=True)
+        self.evictions += 1
+        SPOOL_EVICTIONS.labels(reason=reason).inc()
+
+    def _remove(self, file_path: Path) -> None:
+        if entry := self._entries.pop(file_path, None):
+            self.bytes -= entry.size
+            if self._hashes.get(entry.content_hash) == file_path:
+                del self._hashes[entry.content_hash]
+
+    def _update_metrics(self) -> None:
+        SPOOL_BYTES.set(self.bytes)
+        SPOOL_FILES.set(len(self._entries))
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import random
+import secrets
+import threading
+import time
+import urllib.request
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from app.consts import TRACING_EXPORT_INTERVAL_IN_SEC, TRACING_EXPORT_TIMEOUT_IN_SEC, TRACING_MAX_QUEUE_SIZE
+
+if TYPE_CHECKING:
+    from app.models import WhorfConfig
+
+logger = logging.getLogger("whorf.tracing")
+
+AttributeValue = str | bool | int | float
+
+# span kind and status codes of the OpenTelemetry protocol (OTLP)
+SPAN_KIND_INTERNAL = 1
+STATUS_CODE_ERROR = 2
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    """Identifies a span, it is passed to other threads and scan processes to continue the trace"""
+
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_span_id: str | None = None
+    start_time_unix_nano: int = 0
+    end_time_unix_nano: int = 0
+    attributes: dict[str, AttributeValue] = field(default_factory=dict)
+    error: str | None = None
+
+    def set_attribute(self, key: str, value: AttributeValue | None) -> None:
+        if self.context.sampled and value is not None:
+            self.attributes[key] = value
+
+    def to_otlp(self) -> dict[str, Any]:
+        """Converts the span to the JSON encoding of the OpenTelemetry protocol"""
+
+        otlp_span: dict[str, Any] = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_time_unix_nano),
+            "endTimeUnixNano": str(self.end_time_unix_nano),
+            "attributes": [to_otlp_attribute(key=key, value=value) for key, value in self.attributes.items()],
+        }
+        if self.parent_span_id:
+            otlp_span["parentSpanId"] = self.parent_span_id
+        if self.error:
+            otlp_span["status"] = {"code": STATUS_CODE_ERROR, "message": self.error}
+
+        return otlp_span
+
+
+# spans of traces, which were not sampled, are neither recorded nor exported
+NON_RECORDING_SPAN = Span(name="", context=SpanContext(trace_id="", span_id="", sampled=False))
+
+
+class SpanExporter(ABC):
+    @abstractmethod
+    def export(self, spans: list[Span]) -> None:
+        """Exports a batch of finished spans"""
+
+
+class JsonFileSpanExporter(SpanExporter):
+    """Appends every batch of spans as OTLP JSON line to the file, like the file exporter of the OpenTelemetry Collector"""
+
+    def __init__(self, file_path: Path) -> None:
+        self.file_path = file_path
+
+    def export(self, spans: list[Span]) -> None:
+        with self.file_path.open("a") as f:
+            f.write(json.dumps(to_otlp_traces(spans), separators=(",", ":")) + "\n")
+
+
+class CollectorSpanExporter(SpanExporter):
+    """Sends every batch of spans via OTLP/HTTP in the JSON encoding to a collector"""
+
+    def __init__(self, endpoint: str) -> None:
+        self.endpoint = endpoint
+
+    def export(self, spans: list[Span]) -> None:
+        request = urllib.request.Request(  # noqa: S310  # the endpoint is part of the whorf config
+            self.endpoint,
+            data=json.dumps(to_otlp_traces(spans), separators=(",", ":")).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=TRACING_EXPORT_TIMEOUT_IN_SEC):  # noqa: S310
+            pass
+
+
+class Tracer:
+    """Records the spans of sampled traces and exports them in batches in a background thread
+
+    The sampling decision is made once per trace, therefore a trace is either completely recorded or not at all.
+    Without an exporter no spans are recorded.
+    """
+
+    def __init__(self) -> None:
+        self.exporter: SpanExporter | None = None
+        self.sample_ratio = 1.0
+
+        self._current_context: ContextVar[SpanContext | None] = ContextVar("whorf_span_context", default=None)
+        self._finished_spans: deque[Span] = deque(maxlen=TRACING_MAX_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._export_thread_pid: int | None = None
+
+    def configure(self, exporter: SpanExporter | None, sample_ratio: float) -> None:
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+
+    @contextmanager
+    def start_span(self, name: str, /, **attributes: AttributeValue | None) -> Iterator[Span]:
+        """Starts a child span of the current span or a new trace, if there is no current span"""
+
+        parent_context = self._current_context.get()
+        if not self.exporter or (parent_context and not parent_context.sampled):
+            yield NON_RECORDING_SPAN
+            return
+
+        if parent_context is None:
+            sampled = random.random() < self.sample_ratio  # noqa: S311  # not used for cryptographic purposes
+            if not sampled:
+                with self.attach(SpanContext(trace_id="", span_id="", sampled=False)):
+                    yield NON_RECORDING_SPAN
+                return
+
+        span = Span(
+            name=name,
+            context=SpanContext(
+                trace_id=parent_context.trace_id if parent_context else secrets.token_hex(16),
+                span_id=secrets.token_hex(8),
+            ),
+            parent_span_id=parent_context.span_id if parent_context else None,
+            start_time_unix_nano=time.time_ns(),
+        )
+        for key, value in attributes.items():
+            span.set_attribute(key, value)
+
+        try:
+            with self.attach(span.context):
+                yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_time_unix_nano = time.time_ns()
+            self._record(span)
+
+    def get_current_context(self) -> SpanContext | None:
+        return self._current_context.get()
+
+    @contextmanager
+    def attach(self, context: SpanContext | None) -> Iterator[None]:
+        """Continues the trace of the given span context, ex. in a scan process"""
+
+        token = self._current_context.set(context)
+        try:
+            yield
+        finally:
+            self._current_context.reset(token)
+
+    def flush(self) -> None:
+        """Exports all finished spans"""
+
+        with self._lock:
+            spans = list(self._finished_spans)
+            self._finished_spans.clear()
+
+        if not spans or not self.exporter:
+            return
+
+        with self._export_lock:
+            try:
+                self.exporter.export(spans)
+            except Exception:
+                logger.warning(f"Failed to export {len(spans)} spans", exc_info=True)
+
+    def _record(self, span: Span) -> None:
+        with self._lock:
+            self._finished_spans.append(span)
+            if self._export_thread_pid != os.getpid():
+                # threads are not forked, therefore every process needs its own export thread
+                self._export_thread_pid = os.getpid()
+                threading.Thread(target=self._export_periodically, name="span-export", daemon=True).start()
+
+    def _export_periodically(self) -> None:
+        while True:
+            time.sleep(TRACING_EXPORT_INTERVAL_IN_SEC)
+            self.flush()
+
+
+def to_otlp_attribute(key: str, value: AttributeValue) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": value}}
+
+
+def to_otlp_traces(spans: list[Span]) -> dict[str, Any]:
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [to_otlp_attribute(key="service.name", value="whorf")]},
+                "scopeSpans": [{"scope": {"name": "whorf"}, "spans": [span.to_otlp() for span in spans]}],
+            }
+        ]
+    }
+
+
+def configure_tracing(whorf_conf: WhorfConfig) -> None:
+    """Configures the tracer of this process based on the whorf config"""
+
+    exporter: SpanExporter | None = None
+    if whorf_conf.tracing_exporter == "json-file":
+        exporter = JsonFileSpanExporter(file_path=Path(whorf_conf.tracing_file_path))
+    elif whorf_conf.tracing_exporter == "collector":
+        exporter = CollectorSpanExporter(endpoint=whorf_conf.tracing_collector_endpoint)
+
+    tracer.configure(exporter=exporter, sample_ratio=whorf_conf.tracing_sample_ratio)
+
+
+# one tracer per process, which is configured by 'configure_tracing'
+tracer = Tracer()
+atexit.register(tracer.flush)
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import queue
+import threading
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+from checkov.common.output.report import Report
+
+from app.consts import UPLOAD_QUEUE_HIGH_WATERMARK
+from app.metrics import UPLOAD_DEDUPLICATED, UPLOAD_DROPPED, UPLOAD_DURATION, UPLOAD_QUEUE_DEPTH
+
+if TYPE_CHECKING:
+    from app.models import UploadItem
+
+
+class UploadQueue:
+    """Bounded queue of already scanned manifests, which are uploaded in batches by the periodic upload
+
+    New items are dropped, when the queue is full, because an admission request should never wait for the upload.
+    """
+
+    def __init__(self, maxsize: int, batch_size: int) -> None:
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.uploaded = 0
+        self.uploads = 0
+        self.last_upload_latency_in_sec = 0.0
+        self.upload_latency_sum_in_sec = 0.0
+
+        self._queue: queue.Queue[UploadItem] = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def resize(self, maxsize: int, batch_size: int) -> None:
+        """Applies the sizes of a changed whorf config, already queued items are kept"""
+
+        with self._queue.mutex:
+            self._queue.maxsize = maxsize
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def under_pressure(self) -> bool:
+        """Indicates, if the queue should be drained before the next scheduled upload"""
+
+        return self.depth >= self.maxsize * UPLOAD_QUEUE_HIGH_WATERMARK
+
+    def put(self, item: UploadItem) -> bool:
+        """Adds the item to the queue and returns, if it was accepted"""
+
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            UPLOAD_DROPPED.inc()
+            return False
+
+        with self._lock:
+            self.enqueued += 1
+        UPLOAD_QUEUE_DEPTH.set(self.depth)
+        return True
+
+    def get_batch(self, max_size: int | None = None) -> list[UploadItem]:
+        """Removes and returns up to 'batch_size' or 'max_size' items from the queue"""
+
+        batch_size = self.batch_size if max_size is None else min(self.batch_size, max_size)
+        batch: list[UploadItem] = []
+        while len(batch) < batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        UPLOAD_QUEUE_DEPTH.set(self.depth)
+        return batch
+
+    def record_upload(self, item_count: int, latency_in_sec: float) -> None:
+        with self._lock:
+            self.uploaded += item_count
+            self.uploads += 1
+            self.last_upload_latency_in_sec = latency_in_sec
+            self.upload_latency_sum_in_sec += latency_in_sec
+        UPLOAD_DURATION.observe(latency_in_sec)
+
+
+def deduplicate_upload_items(upload_items: list[UploadItem]) -> list[UploadItem]:
+    """Keeps only the latest of the items with the same content hash, ex. an object admitted twice between uploads"""
+
+    latest_items: dict[str, UploadItem] = {}
+    for upload_item in upload_items:
+        # items without a content hash are never deduplicated
+        key = upload_item.content_hash or str(upload_item.file_path)
+        latest_items.pop(key, None)
+        latest_items[key] = upload_item
+
+    if duplicate_count := len(upload_items) - len(latest_items):
+        UPLOAD_DEDUPLICATED.inc(duplicate_count)
+
+    return list(latest_items.values())
+
+
+def merge_scan_reports(scan_reports: Iterable[list[Report]]) -> list[Report]:
+    """Merges the scan reports of multiple scans into a single report per check type"""
+
+    merged_reports: dict[str, Report] = {}
+    for reports in scan_reports:
+        for report in reports:
+            merged_report = merged_reports.setdefault(report.check_type, Report(check_type=report.check_type))
+            merged_report.passed_checks.extend(report.passed_checks)
+            merged_report.failed_checks.extend(report.failed_checks)
+            merged_report.skipped_checks.extend(report.skipped_checks)
+            merged_report.parsing_errors.extend(report.parsing_errors)
+            merged_report.resources.update(report.resources)
+            merged_report.extra_resources.update(report.extra_resources)
+            merged_report.image_cached_results.extend(report.image_cached_results)
+
+    return list(merged_reports.values())
@@ -1,24 +1,38 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import logging
 import os
-import shutil
 from datetime import datetime
 from pathlib import Path
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, cast
 
 import yaml
+from checkov.common.bridgecrew.check_type import CheckType
 from checkov.common.bridgecrew.wrapper import reduce_scan_reports
-from flask import current_app as webhook
 from flask import jsonify
 
-from app.consts import MANIFEST_ROOT_PATH, WHORF_CONFIG_PATH
+from app.consts import (
+    AUDIT_RESOURCES,
+    JSON_TOKEN_PATTERN,
+    MANIFEST_ROOT_PATH,
+    SCA_IMAGE_NAME_PATTERN,
+    SERVICE_ACCOUNT_VOLUME_PREFIX,
+    SPOOL_MAX_BYTES,
+    TRACING_COLLECTOR_ENDPOINT,
+    TRACING_FILE_PATH,
+    VOLATILE_METADATA_FIELDS,
+    WHORF_CONFIG_PATH,
+)
 from app.models import WhorfConfig
 
 if TYPE_CHECKING:
     from checkov.common.output.report import Report
     from flask import Response
 
+    from app.spool import ManifestSpool
+
 
 def admission_response(*, allowed: bool, uid: str, message: str) -> Response:
     return jsonify(
@@ -34,6 +48,80 @@ def admission_response(*, allowed: bool, uid: str, message: str) -> Response:
     )
 
 
+def peek_admission_request(body: bytes) -> tuple[str, str | None] | None:
+    """Reads the UID and namespace of an AdmissionReview request from the raw body without decoding it completely
+
+    The fields of the request are only read until its 'object', which the API server serializes after them.
+    Returns None, if the UID wasn't found until then, and None as namespace, if it wasn't found.
+    """
+
+    fields: dict[bytes, Any] = {}
+    # keys of the enclosing objects and arrays with the information, if it is an object
+    containers: list[tuple[bytes | None, bool]] = []
+    key = None
+    after_colon = False
+    for match in JSON_TOKEN_PATTERN.finditer(body):
+        token = match.group()
+        if token == b":":
+            after_colon = True
+            continue
+
+        value_key = key if after_colon else None
+        after_colon = False
+        in_request = len(containers) == 2 and containers[1][0] == b'"request"'
+        if token in (b"{", b"["):
+            containers.append((value_key, token == b"{"))
+        elif token in (b"}", b"]"):
+            if in_request or not containers:
+                break
+            containers.pop()
+        elif value_key is None:
+            if containers and containers[-1][1]:
+                key = token
+                if in_request and key == b'"object"':
+                    break
+        elif in_request and value_key in (b'"uid"', b'"namespace"'):
+            try:
+                fields[value_key] = json.loads(token)
+            except ValueError:
+                # the complete decoding reports the invalid body
+                return None
+            if len(fields) == 2:
+                break
+
+    uid = fields.get(b'"uid"')
+    if not isinstance(uid, str):
+        return None
+
+    namespace = fields.get(b'"namespace"')
+    return uid, namespace if isinstance(namespace, str) else None
+
+
+logger = logging.getLogger("whorf.utils")
+
+
+def get_choice(whorf_conf: dict[str, Any], key: str, choices: tuple[str, ...]) -> str:
+    """Returns the value of the config key, which has to be one of the choices, the first one is the default
+
+    An unknown value is logged and replaced by the default, instead of silently behaving like any other choice.
+    """
+
+    value = whorf_conf.get(key)
+    if value is None:
+        return choices[0]
+    if value is False and "off" in choices:
+        # YAML parses an unquoted 'off' as false
+        return "off"
+    if value not in choices:
+        logger.error(
+            f"Unknown value {value!r} of '{key}' in the whorf config, expected one of {', '.join(choices)}, "
+            f"falling back to '{choices[0]}'"
+        )
+        return choices[0]
+
+    return cast(str, value)
+
+
 def get_whorf_config() -> WhorfConfig:
     """Parse the whorf config file"""
 
@@ -46,9 +134,45 @@ def get_whorf_config() -> WhorfConfig:
     return WhorfConfig(
         ignores_namespaces=whorf_conf.get("ignores-namespaces") or [],
         upload_interval_in_min=f"*/{whorf_conf.get('upload-interval-in-min') or 5}",
+        verdict_cache_size=int(whorf_conf.get("verdict-cache-size", 1000)),
+        verdict_cache_ttl_in_sec=int(whorf_conf.get("verdict-cache-ttl-in-sec", 300)),
+        upload_queue_size=int(whorf_conf.get("upload-queue-size", 1000)),
+        upload_batch_size=int(whorf_conf.get("upload-batch-size", 100)),
+        spool_max_bytes=int(whorf_conf.get("spool-max-bytes", SPOOL_MAX_BYTES)),
+        spool_max_files=int(whorf_conf.get("spool-max-files", 5000)),
+        spool_max_age_in_min=int(whorf_conf.get("spool-max-age-in-min", 120)),
+        scan_deadline_in_sec=float(whorf_conf.get("scan-deadline-in-sec", 25)),
+        scan_deadline_fail_open=get_choice(whorf_conf, "scan-deadline-mode", ("fail-closed", "fail-open"))
+        == "fail-open",
+        two_phase_scan=get_choice(whorf_conf, "scan-mode", ("full", "two-phase")) == "two-phase",
+        batch_chunk_size=int(whorf_conf.get("batch-chunk-size", 100)),
+        batch_max_objects=int(whorf_conf.get("batch-max-objects", 10000)),
+        batch_max_objects_per_min=int(whorf_conf.get("batch-max-objects-per-min", 600)),
+        tracing_exporter=get_choice(whorf_conf, "tracing-exporter", ("none", "json-file", "collector")),
+        tracing_sample_ratio=float(whorf_conf.get("tracing-sample-ratio", 1.0)),
+        tracing_file_path=whorf_conf.get("tracing-file-path", TRACING_FILE_PATH),
+        tracing_collector_endpoint=whorf_conf.get("tracing-collector-endpoint", TRACING_COLLECTOR_ENDPOINT),
+        audit_source=get_choice(whorf_conf, "audit-source", ("none", "api-server", "directory")),
+        audit_interval_in_min=int(whorf_conf.get("audit-interval-in-min", 60)),
+        audit_directory=whorf_conf.get("audit-directory", ""),
+        audit_resources=whorf_conf.get("audit-resources") or list(AUDIT_RESOURCES),
+        audit_max_objects_per_min=int(whorf_conf.get("audit-max-objects-per-min", 60)),
+        sca_image_cache_size=int(whorf_conf.get("sca-image-cache-size", 500)),
+        sca_image_cache_ttl_in_sec=int(whorf_conf.get("sca-image-cache-ttl-in-sec", 21600)),
+        sca_image_cache_path=whorf_conf.get("sca-image-cache-path", ""),
+        fast_path_mode=get_choice(whorf_conf, "fast-path-mode", ("off", "shadow", "enforce")),
     )
 
 
+def get_whorf_config_mtime() -> int | None:
+    """Returns the modification time of the whorf config file to detect changes of the mounted ConfigMap"""
+
+    try:
+        return WHORF_CONFIG_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
 def parse_config(configfile: str) -> dict[str, list[str]]:
     cf = {}
     with open(configfile) as myfile:
@@ -74,31 +198,120 @@ def to_dict(obj: Any) -> Any:
         return obj
 
 
-def cleanup_directory(path: Path) -> None:
-    """Deletes all content of given directory, but not the directory itself"""
+def is_service_account_volume(volume: Any) -> bool:
+    """Checks, if the volume or volume mount is the service account token, which is injected with a random name suffix"""
+
+    return isinstance(volume, dict) and str(volume.get("name", "")).startswith(SERVICE_ACCOUNT_VOLUME_PREFIX)
+
+
+def strip_service_account_volumes(spec: dict[str, Any]) -> dict[str, Any]:
+    """Copies the pod spec without the service account token volume and its mounts, which differ between replicas"""
 
-    if not path.exists():
-        return
+    stripped_spec = {**spec}
+    if isinstance(spec.get("volumes"), list):
+        stripped_spec["volumes"] = [volume for volume in spec["volumes"] if not is_service_account_volume(volume)]
+    for container_type in ("containers", "initContainers", "ephemeralContainers"):
+        if isinstance(spec.get(container_type), list):
+            stripped_spec[container_type] = [
+                (
+                    {
+                        **container,
+                        "volumeMounts": [
+                            mount
+                            for mount in container.get("volumeMounts") or []
+                            if not is_service_account_volume(mount)
+                        ],
+                    }
+                    if isinstance(container, dict)
+                    else container
+                )
+                for container in spec[container_type]
+            ]
 
-    for entry in os.scandir(path):
-        try:
-            if entry.is_dir(follow_symlinks=False):
-                shutil.rmtree(entry)
-            else:
-                os.remove(entry)
-        except Exception:
-            webhook.logger.error(f"Failed to delete {entry}", exc_info=True)
+    return stripped_spec
 
 
-def check_debug_mode(request_info: dict[str, Any], uid: str, scan_reports: list[Report]) -> None:
+def get_object_hash(obj: dict[str, Any], salt: str = "") -> str:
+    """Creates a canonical hash of the Kubernetes object, which ignores volatile fields like 'uid' or 'status'"""
+
+    metadata = {key: value for key, value in (obj.get("metadata") or {}).items() if key not in VOLATILE_METADATA_FIELDS}
+    if "generateName" in metadata:
+        # the name is just a random suffix of 'generateName'
+        metadata.pop("name", None)
+
+    canonical_obj = {key: value for key, value in obj.items() if key not in ("metadata", "status")}
+    canonical_obj["metadata"] = metadata
+    if isinstance(spec := canonical_obj.get("spec"), dict):
+        # scaling doesn't change the result of any check
+        spec = {key: value for key, value in spec.items() if key != "replicas"}
+        if obj.get("kind") == "Pod":
+            spec = strip_service_account_volumes(spec)
+        canonical_obj["spec"] = spec
+
+    canonical_json = json.dumps(canonical_obj, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{salt}{canonical_json}".encode()).hexdigest()
+
+
+def dump_manifest(obj: dict[str, Any]) -> str:
+    """Serializes the Kubernetes object as a single JSON line, which is valid YAML as well
+
+    The decoded object is scanned in this form, so the line ranges and code blocks of the scan records match the
+    uploaded manifest file.
+    """
+
+    return json.dumps(obj, default=str)
+
+
+def persist_manifest(obj: dict[str, Any], file_path: Path, spool: ManifestSpool, content_hash: str = "") -> None:
+    """Writes the Kubernetes object in its scanned form to be uploaded by the periodic upload"""
+
+    spool.write(file_path=file_path, data=dump_manifest(obj), content_hash=content_hash)
+
+
+def check_debug_mode(request_info: dict[str, Any], uid: str, scan_reports: list[Report], spool: ManifestSpool) -> None:
     # check the debug env.  If 'yes' we don't delete the evidence of the scan.  Just in case it's misbehaving.
     # to activate add an env DEBUG:yes to the deployment manifest
     debug = os.getenv("DEBUG")
     if isinstance(debug, str) and debug.lower() == "yes":
         # write original request and scan report to file system
         request_file_path = MANIFEST_ROOT_PATH / f"{uid}-req.json"
-        request_file_path.write_text(json.dumps(request_info))
+        spool.write(file_path=request_file_path, data=json.dumps(request_info))
 
         reduced_scan_reports = reduce_scan_reports(scan_reports)
         scan_reports_file_path = MANIFEST_ROOT_PATH / f"{uid}-req-reports.json"
-        scan_reports_file_path.write_text(json.dumps(reduced_scan_reports))
+        spool.write(file_path=scan_reports_file_path, data=json.dumps(reduced_scan_reports))
+
+        if sca_findings := get_sca_findings_by_image(scan_reports):
+            sca_findings_file_path = MANIFEST_ROOT_PATH / f"{uid}-req-images.json"
+            spool.write(file_path=sca_findings_file_path, data=json.dumps(sca_findings))
+
+
+def get_sca_image_name(file_path: str) -> str:
+    if match := SCA_IMAGE_NAME_PATTERN.search(file_path):
+        return match.group("image_name")
+
+    return "unknown"
+
+
+def get_sca_findings_by_image(scan_reports: list[Report]) -> dict[str, list[dict[str, Any]]]:
+    """Lists the failed SCA image checks per image for the debug mode"""
+
+    findings: dict[str, list[dict[str, Any]]] = {}
+    for report in scan_reports:
+        if report.check_type != CheckType.SCA_IMAGE:
+            continue
+
+        for record in report.failed_checks:
+            details = record.vulnerability_details or {}
+            findings.setdefault(get_sca_image_name(record.file_path), []).append(
+                {
+                    "check_id": record.check_id,
+                    "id": details.get("id"),
+                    "severity": record.severity.name if record.severity else None,
+                    "package_name": details.get("package_name"),
+                    "package_version": details.get("package_version"),
+                    "license": details.get("license"),
+                }
+            )
+
+    return findings
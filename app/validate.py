@@ -1,137 +1,200 @@
 from __future__ import annotations
 
 import re
-from typing import TYPE_CHECKING, cast
+from typing import TYPE_CHECKING
 
 from checkov.common.bridgecrew.check_type import CheckType
 from checkov.common.bridgecrew.severities import BcSeverities
 from flask import current_app as webhook
 
-from app.consts import UUID_PATTERN
-from app.utils import admission_response
+from app.consts import SCA_CHECK_ID_PREFIX_LENGTH, SCA_CHECK_ID_PREFIXES, UUID_PATTERN
+from app.metrics import ADMISSION_DECISIONS
+from app.models import ImageSummary, ReportSummary, Verdict
+from app.utils import admission_response, get_sca_image_name
 
 if TYPE_CHECKING:
     from checkov.common.output.report import Report
     from flask import Response
 
-    from app.checkov_whorf import CheckovWhorf
+    from app.models import FastPathResult, PolicyIndex
 
 
-def validate_k8s_request(namespace: str, uid: str) -> Response | None:
+def validate_k8s_request(namespace: str | None, uid: str) -> Response | None:
     # Check/Sanitise UID to make sure it's a k8s request and only a k8s request as it is used for file naming
     if re.match(UUID_PATTERN, uid):
         webhook.logger.info("Valid UID Found, continuing")
     else:
         message = "Invalid UID. Aborting validation"
+        ADMISSION_DECISIONS.labels(decision="invalid_uid").inc()
         webhook.logger.error("K8s UID failed security checks. Request rejected!")
         return admission_response(allowed=False, uid=uid, message=message)
 
     # check we're not in a system namespace
-    if namespace in webhook.extensions["whorf"].ignores_namespaces:
+    if namespace in webhook.extensions["whorf"].ignored_namespaces:
         message = "Namespace in ignore list. Ignoring validation"
+        ADMISSION_DECISIONS.labels(decision="ignored_namespace").inc()
         webhook.logger.error("Namespace in ignore list. Ignoring validation!")
         return admission_response(allowed=True, uid=uid, message=message)
 
     return None
 
 
-def process_passed_checks(ckv_whorf: CheckovWhorf, uid: str, obj_kind_name: str) -> Response:
-    """Invoked when no Kubernetes related issues were found"""
+def get_deadline_verdict(*, deadline_in_sec: float, fail_open: bool) -> Verdict:
+    """Invoked when the scan didn't finish within the scan deadline"""
 
+    if fail_open:
+        message = f"Checkov scan exceeded the deadline of {deadline_in_sec}s and was truncated. Allowing the request."
+        webhook.logger.warning(f"Scan exceeded the deadline of {deadline_in_sec}s. Allowing the request.")
+    else:
+        message = f"Checkov scan exceeded the deadline of {deadline_in_sec}s and was truncated. Request rejected!"
+        webhook.logger.warning(f"Scan exceeded the deadline of {deadline_in_sec}s. Request rejected!")
+
+    return Verdict(allowed=fail_open, message=message)
+
+
+def get_verdict(scan_reports: list[Report], policy_index: PolicyIndex, obj_kind_name: str) -> Verdict:
+    """Decides about the admission of the scanned object"""
+
+    summary = summarize_reports(reports=scan_reports, policy_index=policy_index)
+    if summary.k8s_issue_count:
+        return get_failed_checks_verdict(summary=summary, obj_kind_name=obj_kind_name)
+    else:
+        return get_passed_checks_verdict(summary=summary, obj_kind_name=obj_kind_name)
+
+
+def get_passed_checks_verdict(summary: ReportSummary, obj_kind_name: str) -> Verdict:
     message = []
 
-    k8s_message = generate_k8s_output(reports=ckv_whorf.scan_reports)
+    k8s_message = generate_k8s_output(summary=summary)
     message.extend(k8s_message)
 
-    sca_message = generate_sca_output(reports=ckv_whorf.scan_reports)
+    sca_message = generate_sca_output(summary=summary)
     message.extend(sca_message)
 
     webhook.logger.info(f"Object {obj_kind_name} passed security checks. Allowing the request.")
-    return admission_response(allowed=True, uid=uid, message="\n".join(message))
-
+    return Verdict(allowed=True, message="\n".join(message))
 
-def process_failed_checks(ckv_whorf: CheckovWhorf, uid: str, obj_kind_name: str) -> Response:
-    """Invoked when Kubernetes related issues were found"""
 
-    message = []
+def get_failed_checks_verdict(summary: ReportSummary, obj_kind_name: str) -> Verdict:
+    message = generate_hard_fail_output(summary=summary)
 
-    if ckv_whorf.config.hard_fail_on:
-        hard_fails = {}
-        try:
-            for report in ckv_whorf.scan_reports:
-                for check in report.failed_checks:
-                    if (
-                        check.check_id in ckv_whorf.config.hard_fail_on
-                        or check.bc_check_id in ckv_whorf.config.hard_fail_on
-                    ):
-                        hard_fails[check.check_id] = f"\n  Description: {check.check_name}"
-                        if check.guideline:
-                            hard_fails[check.check_id] += f"\n  Guidance: {check.guideline}"
-        finally:
-            webhook.logger.error("hard fail error")
-
-        if hard_fails:
-            message.append(f"Checkov found {len(hard_fails)} issues in violation of admission policy.")
-
-            for ckv in hard_fails:
-                message.append(f"{ckv}:{hard_fails[ckv]}")
-
-    k8s_message = generate_k8s_output(reports=ckv_whorf.scan_reports)
+    k8s_message = generate_k8s_output(summary=summary)
     message.extend(k8s_message)
 
-    sca_message = generate_sca_output(reports=ckv_whorf.scan_reports)
+    sca_message = generate_sca_output(summary=summary)
     message.extend(sca_message)
 
     webhook.logger.error(f"Object {obj_kind_name} failed security checks. Request rejected!")
-    return admission_response(allowed=False, uid=uid, message="\n".join(message))
+    return Verdict(allowed=False, message="\n".join(message))
 
 
-def generate_k8s_output(reports: list[Report]) -> list[str]:
-    """Counts the failed checks to generate a message output"""
+def get_hard_fail_verdict(scan_reports: list[Report], policy_index: PolicyIndex, obj_kind_name: str) -> Verdict:
+    """Decides about the admission of the scanned object, which was only scanned with the hard fail checks"""
 
-    k8s_report = next((report for report in reports if report.check_type == CheckType.KUBERNETES), None)
-    if not k8s_report:
-        return []
+    summary = summarize_reports(reports=scan_reports, policy_index=policy_index)
+    return get_hard_fail_summary_verdict(summary=summary, obj_kind_name=obj_kind_name)
+
+
+def get_fast_path_verdict(fast_path_result: FastPathResult, obj_kind_name: str) -> Verdict:
+    """Decides about the admission of the object, which was only evaluated by the fast path of the hard fail checks"""
+
+    summary = ReportSummary(hard_fails=fast_path_result.hard_fails)
+    return get_hard_fail_summary_verdict(summary=summary, obj_kind_name=obj_kind_name)
+
+
+def get_hard_fail_summary_verdict(summary: ReportSummary, obj_kind_name: str) -> Verdict:
+    hard_fail_message = generate_hard_fail_output(summary=summary)
+    message = [*hard_fail_message, "The remaining checks are evaluated in the background."]
+
+    if hard_fail_message:
+        webhook.logger.error(f"Object {obj_kind_name} failed hard fail checks. Request rejected!")
+        return Verdict(allowed=False, message="\n".join(message))
+
+    webhook.logger.info(f"Object {obj_kind_name} passed hard fail checks. Allowing the request.")
+    return Verdict(allowed=True, message="\n".join(message))
 
-    issue_count = cast(int, k8s_report.get_summary()["failed"])
 
-    message = [f"Checkov found {issue_count} total issues in this manifest."]
+def summarize_reports(reports: list[Report], policy_index: PolicyIndex) -> ReportSummary:
+    """Collects the K8s issue count, the hard fails and the SCA findings in a single pass over the reports"""
+
+    summary = ReportSummary()
+
+    for report in reports:
+        is_sca_image_report = False
+        if report.check_type == CheckType.KUBERNETES and summary.k8s_issue_count is None:
+            summary.k8s_issue_count = len(report.failed_checks)
+        elif report.check_type == CheckType.SCA_IMAGE and not summary.sca_image_scanned:
+            summary.sca_image_scanned = True
+            is_sca_image_report = True
+
+        for check in report.failed_checks:
+            if policy_index.is_hard_fail(check_id=check.check_id, bc_check_id=check.bc_check_id):
+                summary.hard_fails[check.check_id] = f"\n  Description: {check.check_name}"
+                if check.guideline:
+                    summary.hard_fails[check.check_id] += f"\n  Guidance: {check.guideline}"
+
+            if not is_sca_image_report:
+                continue
+
+            image_summary = summary.images.setdefault(get_sca_image_name(check.file_path), ImageSummary())
+            finding_type = SCA_CHECK_ID_PREFIXES.get(check.check_id[:SCA_CHECK_ID_PREFIX_LENGTH])
+            if finding_type == "license":
+                summary.license_count += 1
+                image_summary.license_count += 1
+            elif finding_type == "cve":
+                summary.cve_count += 1
+                image_summary.cve_count += 1
+                if check.severity:
+                    if check.severity.name in summary.cve_severities:
+                        summary.cve_severities[check.severity.name] += 1
+                        image_summary.cve_severities[check.severity.name] += 1
+                    else:
+                        webhook.logger.warning(f"Unexpected severity {check.severity.name} received")
+            else:
+                webhook.logger.warning(f"Unexpected check ID {check.check_id} received")
+
+    return summary
+
+
+def generate_hard_fail_output(summary: ReportSummary) -> list[str]:
+    """Lists the failed checks, which are part of the 'hard-fail-on' config to generate a message output"""
+
+    if not summary.hard_fails:
+        return []
+
+    message = [f"Checkov found {len(summary.hard_fails)} issues in violation of admission policy."]
+    for ckv, details in summary.hard_fails.items():
+        message.append(f"{ckv}:{details}")
 
     return message
 
 
-def generate_sca_output(reports: list[Report]) -> list[str]:
-    """Extracts the CVEs and License violations to generate a message output"""
+def generate_k8s_output(summary: ReportSummary) -> list[str]:
+    """Uses the failed checks count to generate a message output"""
 
-    sca_image_report = next((report for report in reports if report.check_type == CheckType.SCA_IMAGE), None)
-    if not sca_image_report:
+    if summary.k8s_issue_count is None:
         return []
 
-    license_count = 0
-    cve_count = 0
-    cve_severities = {
-        BcSeverities.CRITICAL: 0,
-        BcSeverities.HIGH: 0,
-        BcSeverities.MEDIUM: 0,
-        BcSeverities.LOW: 0,
-    }
-
-    for check in sca_image_report.failed_checks:  # TODO: differentiate between different images
-        if check.check_id.startswith("BC_LIC_"):
-            license_count += 1
-        elif check.check_id.startswith("BC_VUL_"):
-            cve_count += 1
-            if check.severity:
-                if check.severity.name in cve_severities:
-                    cve_severities[check.severity.name] += 1
-                else:
-                    webhook.logger.warning(f"Unexpected severity {check.severity.name} received")
-        else:
-            webhook.logger.warning(f"Unexpected check ID {check.check_id} received")
+    message = [f"Checkov found {summary.k8s_issue_count} total issues in this manifest."]
+
+    return message
+
+
+def generate_sca_output(summary: ReportSummary) -> list[str]:
+    """Uses the CVEs and License violations in total and per image to generate a message output"""
+
+    if not summary.sca_image_scanned:
+        return []
 
+    cve_severities = summary.cve_severities
     message = [
-        f"Checkov found {cve_count} CVEs in container images of which are {cve_severities[BcSeverities.CRITICAL]} critical, {cve_severities[BcSeverities.HIGH]} high, {cve_severities[BcSeverities.MEDIUM]} medium and {cve_severities[BcSeverities.LOW]} low.",
-        f"Checkov found {license_count} license violations in container images.",
+        f"Checkov found {summary.cve_count} CVEs in container images of which are {cve_severities[BcSeverities.CRITICAL]} critical, {cve_severities[BcSeverities.HIGH]} high, {cve_severities[BcSeverities.MEDIUM]} medium and {cve_severities[BcSeverities.LOW]} low.",
+        f"Checkov found {summary.license_count} license violations in container images.",
     ]
+    for image_name, image_summary in sorted(summary.images.items()):
+        severities = image_summary.cve_severities
+        message.append(
+            f"Image {image_name}: {image_summary.cve_count} CVEs ({severities[BcSeverities.CRITICAL]} critical, {severities[BcSeverities.HIGH]} high, {severities[BcSeverities.MEDIUM]} medium, {severities[BcSeverities.LOW]} low) and {image_summary.license_count} license violations."
+        )
 
     return message
@@ -1,30 +1,154 @@
 from __future__ import annotations
 
+import contextvars
+import itertools
 import json
-from typing import TYPE_CHECKING, Any, cast
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, replace
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, TypeVar, cast
 
-import yaml
-from checkov.common.bridgecrew.check_type import CheckType
-from flask import Flask, request
+from flask import Flask, Response, request, stream_with_context
 from flask_apscheduler import APScheduler
 
+from app import scan_worker
+from app.audit import create_auditor
+from app.background import BackgroundScanExecutor, RateLimiter
+from app.batch import BatchTooLargeError, chunked, iter_objects, limit_objects, split_scan_reports, validate_objects
+from app.cache import TTLCache
 from app.checkov_whorf import CheckovWhorf
-from app.consts import DEFAULT_CHECKOV_ARGS, LOG_LEVEL, MANIFEST_ROOT_PATH
-from app.utils import check_debug_mode, cleanup_directory, get_whorf_config, to_dict
-from app.validate import process_failed_checks, process_passed_checks, validate_k8s_request
+from app.consts import (
+    AUDIT_CHUNK_SIZE,
+    BACKGROUND_SCAN_MAX_WAIT_IN_SEC,
+    BACKGROUND_SCAN_QUEUE_SIZE,
+    CONFIG_RELOAD_INTERVAL_IN_SEC,
+    DEFAULT_CHECKOV_ARGS,
+    LOG_LEVEL,
+    MANIFEST_ROOT_PATH,
+    MAX_SCAN_DURATION_IN_SEC,
+    NDJSON_MIMETYPE,
+    PRELOAD,
+    SCAN_EXECUTOR_MAX_WORKERS,
+    SCAN_PROCESSES,
+    WARM_UP_MAX_ATTEMPTS,
+    WARM_UP_RETRY_DELAY_IN_SEC,
+    WARM_UP_TIMEOUT_IN_SEC,
+)
+from app.fast_path import compare_fast_path_result
+from app.health import HealthMonitor
+from app.image_cache import create_image_cache
+from app.metrics import (
+    ADMISSION_DECISIONS,
+    ADMISSION_DURATION,
+    AUDITED_OBJECTS,
+    MANIFEST_DUMP_DURATION,
+    REPORT_PROCESSING_DURATION,
+    REQUEST_DECODE_DURATION,
+    VERDICT_CACHE_EVICTIONS,
+    VERDICT_CACHE_LOOKUPS,
+    count_failed_checks,
+    generate_metrics,
+)
+from app.models import BatchResult, FastPathResult, UploadItem, WhorfConfig
+from app.spool import ManifestSpool
+from app.tracing import configure_tracing, tracer
+from app.upload import UploadQueue, deduplicate_upload_items, merge_scan_reports
+from app.utils import (
+    admission_response,
+    check_debug_mode,
+    get_object_hash,
+    get_whorf_config,
+    get_whorf_config_mtime,
+    peek_admission_request,
+    persist_manifest,
+)
+from app.validate import (
+    get_deadline_verdict,
+    get_fast_path_verdict,
+    get_hard_fail_verdict,
+    get_verdict,
+    validate_k8s_request,
+)
 
 if TYPE_CHECKING:
-    from flask import Response
+    from concurrent.futures import Future
+    from multiprocessing.synchronize import Barrier
+
+    from checkov.common.output.report import Report
+
+    from app.audit import Auditor
+    from app.checkov_whorf import ScanPhase
+    from app.models import Verdict
+
+T = TypeVar("T")
 
 webhook = Flask(__name__)
 webhook.logger.setLevel(LOG_LEVEL)
 
 scheduler = APScheduler()
 scheduler.init_app(webhook)
-scheduler.start()
 
+# the config is replaced as a whole, when the mounted ConfigMap changes, see 'reload_config'
+whorf_conf_mtime = get_whorf_config_mtime()
 whorf_conf = get_whorf_config()
 whorf_conf.init_app(webhook)
+configure_tracing(whorf_conf)
+
+# one scanner engine per worker, which is reused by all requests
+ckv_whorf = CheckovWhorf(logger=webhook.logger, argv=DEFAULT_CHECKOV_ARGS, image_cache=create_image_cache(whorf_conf))
+ckv_whorf.update_config()
+# with preloading the checks are loaded once in the Gunicorn master and shared copy-on-write with the workers
+ckv_whorf.preload_checks()
+
+# verdicts of already scanned objects, the key includes the hash of the Checkov config
+verdict_cache: TTLCache[Verdict] = TTLCache(
+    maxsize=whorf_conf.verdict_cache_size,
+    ttl=whorf_conf.verdict_cache_ttl_in_sec,
+    lookups_metric=VERDICT_CACHE_LOOKUPS,
+    evictions_metric=VERDICT_CACHE_EVICTIONS,
+)
+
+# scans run in the background to be able to answer the admission request, when the scan deadline is exceeded
+scan_executor = ThreadPoolExecutor(max_workers=SCAN_EXECUTOR_MAX_WORKERS, thread_name_prefix="scan")
+# scans, which only run for the upload, ex. the remaining checks of the two-phase scan, yield to admission scans
+background_scanner = BackgroundScanExecutor(
+    maxsize=BACKGROUND_SCAN_QUEUE_SIZE, max_wait_in_sec=BACKGROUND_SCAN_MAX_WAIT_IN_SEC
+)
+# shared by all batch validations, so they can't monopolize the engine
+batch_rate_limiter = RateLimiter(max_objects_per_min=whorf_conf.batch_max_objects_per_min)
+
+# optionally the CPU heavy scans and uploads run in separate processes with their own engines, which keeps this
+# process responsive. The pool is created by the worker itself, see 'get_scan_process_pool'.
+scan_process_pool: ProcessPoolExecutor | None = None
+scan_process_pool_lock = threading.Lock()
+# shared with the scan processes of the pool to warm up all of them, see 'warm_up_scan_processes'
+scan_warm_up_barrier: Barrier | None = None
+
+# scanned manifests waiting for the periodic upload
+upload_queue = UploadQueue(maxsize=whorf_conf.upload_queue_size, batch_size=whorf_conf.upload_batch_size)
+# the files of the queued manifests and the debug mode, which would otherwise fill up the memory-backed directory
+spool = ManifestSpool(
+    root_path=MANIFEST_ROOT_PATH,
+    max_bytes=whorf_conf.spool_max_bytes,
+    max_files=whorf_conf.spool_max_files,
+    max_age_in_sec=whorf_conf.spool_max_age_in_min * 60,
+)
+
+health_monitor = HealthMonitor(max_scan_duration_in_sec=MAX_SCAN_DURATION_IN_SEC)
+
+# existing objects of the cluster, which are scanned in the background, None, if the audit is disabled
+auditor = create_auditor(whorf_conf)
 
 
 @webhook.route("/", methods=["GET"])
@@ -32,45 +156,670 @@ def root() -> str:
     return "<h1 style='color:blue'>Ready!</h1>"
 
 
+@webhook.route("/readyz", methods=["GET"])
+def readyz() -> tuple[str, int]:
+    if not health_monitor.ready.is_set():
+        return "Scanner is not warmed up yet", 503
+
+    return "ok", 200
+
+
+@webhook.route("/livez", methods=["GET"])
+def livez() -> tuple[str, int]:
+    if health_monitor.warm_up_failed.is_set():
+        # a restart of the container is the last resort to get the scanner working
+        return "Scanner failed to warm up", 503
+
+    if duration := health_monitor.get_wedged_scan_duration():
+        webhook.logger.error(f"Scan is running for {duration:.0f}s, the scan worker seems to be wedged")
+        return f"Scan is running for {duration:.0f}s", 503
+
+    return "ok", 200
+
+
+@webhook.route("/metrics", methods=["GET"])
+def metrics() -> Response:
+    data, content_type = generate_metrics()
+    return Response(data, content_type=content_type)
+
+
 @webhook.route("/validate", methods=["POST"])
+@ADMISSION_DURATION.time()
 def validate() -> Response:
-    request_info = cast("dict[str, Any]", request.get_json())
-    webhook.logger.debug(json.dumps(request_info, indent=4))
+    # requests of ignored namespaces and with invalid UIDs are answered without decoding the whole body
+    peeked_request = peek_admission_request(request.get_data())
+    if peeked_request and (response := validate_k8s_request(uid=peeked_request[0], namespace=peeked_request[1])):
+        return response
+
+    with REQUEST_DECODE_DURATION.time():
+        request_info = cast("dict[str, Any]", request.get_json())
+    if webhook.logger.isEnabledFor(logging.DEBUG):
+        webhook.logger.debug(json.dumps(request_info, indent=4))
 
     namespace = request_info["request"].get("namespace")
     uid = request_info["request"].get("uid")
 
-    if response := validate_k8s_request(namespace=namespace, uid=uid):
-        # either namespace or UID was wrong
+    with tracer.start_span("admission", uid=uid, namespace=namespace) as span:
+        # the fields are only validated again, if they couldn't be read before decoding the body
+        if (uid, namespace) != peeked_request and (response := validate_k8s_request(namespace=namespace, uid=uid)):
+            # either namespace or UID was wrong
+            return response
+
+        obj = request_info["request"]["object"]
+        obj_kind_name = f'{obj["kind"]}/{obj["metadata"]["name"]}'
+        manifest_file_path = MANIFEST_ROOT_PATH / f"{uid}-req.yaml"
+        span.set_attribute("kind", obj["kind"])
+
+        webhook.logger.info(f"Start scanning object {obj_kind_name}")
+
+        verdict_key = get_object_hash(obj=obj, salt=ckv_whorf.config_hash)
+        upload_item = None
+        verdict = verdict_cache.get(verdict_key)
+        span.set_attribute("verdict_cache_hit", verdict is not None)
+        if verdict:
+            # the same object was already scanned and queued for the upload
+            webhook.logger.info(f"Found cached verdict for object {obj_kind_name}")
+        elif (fast_path_result := evaluate_fast_path(obj=obj)) and whorf_conf.fast_path_mode == "enforce":
+            verdict = get_fast_path_verdict(fast_path_result=fast_path_result, obj_kind_name=obj_kind_name)
+            verdict_cache.set(verdict_key, verdict)
+            # Checkov still scans the object in the background for the upload and to cross-check the fast path
+            background_scan = background_scanner.submit(
+                contextvars.copy_context().run,
+                scan_fast_path_request,
+                request_info=request_info,
+                obj_kind_name=obj_kind_name,
+                verdict_key=verdict_key,
+                manifest_file_path=manifest_file_path,
+                verdict=verdict,
+                fast_path_result=fast_path_result,
+            )
+            if background_scan:
+                background_scan.add_done_callback(partial(enqueue_finished_scan, obj=obj))
+            else:
+                webhook.logger.warning(f"Background scan queue is full, skip scanning {obj_kind_name} for the upload")
+            span.set_attribute("fast_path", value=True)
+        else:
+            # the context carries the current span to the scan thread
+            scan = scan_executor.submit(
+                contextvars.copy_context().run,
+                scan_request,
+                request_info=request_info,
+                obj_kind_name=obj_kind_name,
+                verdict_key=verdict_key,
+                manifest_file_path=manifest_file_path,
+                fast_path_result=fast_path_result,
+            )
+            try:
+                verdict, upload_item = scan.result(timeout=whorf_conf.scan_deadline_in_sec or None)
+            except FutureTimeoutError:
+                # let the scan finish in the background to still upload its results
+                scan.add_done_callback(partial(enqueue_finished_scan, obj=obj))
+                verdict = get_deadline_verdict(
+                    deadline_in_sec=whorf_conf.scan_deadline_in_sec, fail_open=whorf_conf.scan_deadline_fail_open
+                )
+                span.set_attribute("scan_deadline_exceeded", value=True)
+
+        ADMISSION_DECISIONS.labels(decision="allowed" if verdict.allowed else "denied").inc()
+        span.set_attribute("allowed", verdict.allowed)
+        with tracer.start_span("response"):
+            response = admission_response(allowed=verdict.allowed, uid=uid, message=verdict.message)
+
+        if upload_item:
+            # the manifest file is only needed for the periodic upload, therefore it is written after the response was sent
+            response.call_on_close(partial(enqueue_upload, obj=obj, upload_item=upload_item))
+
         return response
 
-    manifest_file_path = MANIFEST_ROOT_PATH / f"{uid}-req.yaml"
-    manifest_file_path.write_text(yaml.dump(to_dict(request_info["request"]["object"])))
 
-    webhook.logger.info(f"Start scanning file {manifest_file_path}")
+@webhook.route("/validate/batch", methods=["POST"])
+def validate_batch() -> Response | tuple[str, int]:
+    """Validates many objects against the admission policy without admitting or uploading them, ex. for CI pre-checks
 
-    ckv_whorf = CheckovWhorf(logger=webhook.logger, argv=DEFAULT_CHECKOV_ARGS)
-    ckv_whorf.update_config()
-    ckv_whorf.scan_file(file=str(manifest_file_path))
+    The objects are read, scanned and answered chunk by chunk, therefore the memory usage doesn't depend on the
+    number of objects, when they are sent as newline delimited JSON.
+    """
 
-    check_debug_mode(request_info=request_info, uid=uid, scan_reports=ckv_whorf.scan_reports)
+    objects = limit_objects(iter_objects(line.decode() for line in request.stream), whorf_conf.batch_max_objects)
+    chunks = chunked(objects, whorf_conf.batch_chunk_size)
+    try:
+        # a completely invalid or too large body can still be rejected, before the response is streamed
+        first_chunk = next(chunks, [])
+    except BatchTooLargeError as e:
+        return f"Invalid batch: {e}", 413
+    except ValueError as e:
+        return f"Invalid batch: {e}", 400
 
-    obj_kind_name = (
-        f'{request_info["request"]["object"]["kind"]}/{request_info["request"]["object"]["metadata"]["name"]}'
-    )
+    results = stream_batch_results(chunks=itertools.chain((first_chunk,), chunks))
+    return Response(stream_with_context(results), mimetype=NDJSON_MIMETYPE)
 
-    if any(report.failed_checks for report in ckv_whorf.scan_reports if report.check_type == CheckType.KUBERNETES):
-        return process_failed_checks(ckv_whorf=ckv_whorf, uid=uid, obj_kind_name=obj_kind_name)
+
+def stream_batch_results(chunks: Iterable[list[dict[str, Any]]]) -> Iterator[str]:
+    """Yields the results of the chunks as newline delimited JSON in the order of the objects
+
+    With scan processes the chunks are scanned in parallel, otherwise one after the other by the engine
+    of this process. Only as many chunks are read ahead, as can be scanned in parallel.
+    """
+
+    max_pending_chunks = SCAN_PROCESSES or 1
+    pending_chunks: deque[Future[list[BatchResult]]] = deque()
+    object_count = 0
+    error = None
+
+    with ThreadPoolExecutor(max_workers=max_pending_chunks, thread_name_prefix="batch") as executor:
+        try:
+            for chunk in chunks:
+                pending_chunks.append(executor.submit(validate_chunk, chunk))
+                object_count += len(chunk)
+                if len(pending_chunks) >= max_pending_chunks:
+                    yield from to_ndjson(pending_chunks.popleft().result())
+        except ValueError as e:
+            # the status code was already sent, therefore the error is the last line of the response
+            error = f"Invalid batch: {e}"
+
+        while pending_chunks:
+            yield from to_ndjson(pending_chunks.popleft().result())
+
+    if error:
+        webhook.logger.error(f"{error}, validated {object_count} objects")
+        yield f"{json.dumps({'error': error})}\n"
     else:
-        return process_passed_checks(ckv_whorf=ckv_whorf, uid=uid, obj_kind_name=obj_kind_name)
+        webhook.logger.info(f"Validated a batch of {object_count} objects")
+
+
+def to_ndjson(results: list[BatchResult]) -> Iterator[str]:
+    for result in results:
+        yield f"{json.dumps(asdict(result))}\n"
+
+
+def validate_chunk(objects: list[dict[str, Any]]) -> list[BatchResult]:
+    """Scans the chunk with a lower priority than admission requests and rate-limited across all batch validations"""
+
+    batch_rate_limiter.wait(object_count=len(objects))
+    background_scanner.wait_for_admission_scans()
+    with webhook.app_context():
+        return validate_objects(
+            objects=objects,
+            scan=scan_objects,
+            policy_index=ckv_whorf.policy_index,
+            ignored_namespaces=whorf_conf.ignored_namespaces,
+        )
+
+
+def evaluate_fast_path(obj: dict[str, Any]) -> FastPathResult | None:
+    """Evaluates the hard fail checks without a Checkov run, if the fast path is enabled and supports the config"""
+
+    hard_fail_evaluator = ckv_whorf.hard_fail_evaluator
+    if whorf_conf.fast_path_mode == "off" or not hard_fail_evaluator.complete:
+        return None
+
+    try:
+        with tracer.start_span("fast_path"):
+            return hard_fail_evaluator.evaluate(obj)
+    except Exception:
+        webhook.logger.error("Failed to evaluate the hard fail checks via the fast path", exc_info=True)
+        return None
+
+
+def scan_request(
+    request_info: dict[str, Any],
+    obj_kind_name: str,
+    verdict_key: str,
+    manifest_file_path: Path,
+    fast_path_result: FastPathResult | None = None,
+) -> tuple[Verdict, UploadItem | None]:
+    """Scans the object of the admission request and caches the verdict
+
+    In the two-phase scan mode only the hard fail checks are run for the verdict and the remaining checks are run
+    in the background, which then also queues the upload. A fast path result of the shadow mode is cross-checked
+    against the scan reports.
+    """
+
+    obj = request_info["request"]["object"]
+    two_phase = whorf_conf.two_phase_scan and bool(ckv_whorf.config.hard_fail_on)
+
+    with background_scanner.admission_scan():
+        complete, scan_reports = scan_object(
+            obj=obj, file_path=manifest_file_path, phase="hard-fail" if two_phase else "all"
+        )
+
+    with webhook.app_context(), REPORT_PROCESSING_DURATION.time():
+        with tracer.start_span("check_debug_mode"):
+            check_debug_mode(
+                request_info=request_info, uid=request_info["request"]["uid"], scan_reports=scan_reports, spool=spool
+            )
+        count_failed_checks(scan_reports=scan_reports)
+
+        if complete:
+            verdict = get_verdict(
+                scan_reports=scan_reports, policy_index=ckv_whorf.policy_index, obj_kind_name=obj_kind_name
+            )
+        else:
+            verdict = get_hard_fail_verdict(
+                scan_reports=scan_reports, policy_index=ckv_whorf.policy_index, obj_kind_name=obj_kind_name
+            )
+        upload_item = UploadItem(file_path=manifest_file_path, scan_reports=scan_reports, content_hash=verdict_key)
+
+        if fast_path_result:
+            compare_fast_path_result(
+                fast_path_result=fast_path_result,
+                scan_reports=scan_reports,
+                policy_index=ckv_whorf.policy_index,
+                obj_kind_name=obj_kind_name,
+            )
+
+    verdict_cache.set(verdict_key, verdict)
+
+    if not complete:
+        if remaining_scan := background_scanner.submit(
+            contextvars.copy_context().run, scan_remaining_checks, verdict=verdict, obj=obj, upload_item=upload_item
+        ):
+            remaining_scan.add_done_callback(partial(enqueue_finished_scan, obj=obj))
+            return verdict, None
+        webhook.logger.warning(
+            f"Background scan queue is full, only the hard fail checks of object {obj_kind_name} are uploaded"
+        )
+
+    return verdict, upload_item
+
+
+def scan_fast_path_request(
+    request_info: dict[str, Any],
+    obj_kind_name: str,
+    verdict_key: str,
+    manifest_file_path: Path,
+    verdict: Verdict,
+    fast_path_result: FastPathResult,
+) -> tuple[Verdict, UploadItem]:
+    """Scans the object, which was already decided by the fast path, with all checks for the upload
+
+    Checkov stays the source of truth, if the fast path diverged, the cached verdict is replaced by the one of Checkov.
+    """
+
+    obj = request_info["request"]["object"]
+    _, scan_reports = scan_object(obj=obj, file_path=manifest_file_path, phase="all")
+
+    with webhook.app_context():
+        check_debug_mode(
+            request_info=request_info, uid=request_info["request"]["uid"], scan_reports=scan_reports, spool=spool
+        )
+        count_failed_checks(scan_reports=scan_reports)
+
+        if not compare_fast_path_result(
+            fast_path_result=fast_path_result,
+            scan_reports=scan_reports,
+            policy_index=ckv_whorf.policy_index,
+            obj_kind_name=obj_kind_name,
+        ):
+            verdict_cache.set(
+                verdict_key,
+                get_hard_fail_verdict(
+                    scan_reports=scan_reports, policy_index=ckv_whorf.policy_index, obj_kind_name=obj_kind_name
+                ),
+            )
+
+    return verdict, UploadItem(file_path=manifest_file_path, scan_reports=scan_reports, content_hash=verdict_key)
+
+
+def scan_remaining_checks(verdict: Verdict, obj: dict[str, Any], upload_item: UploadItem) -> tuple[Verdict, UploadItem]:
+    """Runs the checks, which were skipped by the hard fail scan, and adds their reports to the upload item"""
+
+    _, scan_reports = scan_object(obj=obj, file_path=upload_item.file_path, phase="remaining")
+    count_failed_checks(scan_reports=scan_reports)
+    scan_reports = merge_scan_reports((upload_item.scan_reports, scan_reports))
+
+    return verdict, replace(upload_item, scan_reports=scan_reports)
+
+
+def scan_object(obj: dict[str, Any], file_path: Path, phase: ScanPhase) -> tuple[bool, list[Report]]:
+    """Scans the object either in the scan process pool or with the engine of this process
+
+    Returns, if all checks were run and the scan reports.
+    """
+
+    metadata = obj.get("metadata") or {}
+    with tracer.start_span(
+        "scan", phase=phase, kind=obj.get("kind"), namespace=metadata.get("namespace"), name=metadata.get("name")
+    ):
+        if SCAN_PROCESSES:
+            # the scan processes track the duration of their scans themselves
+            return run_in_scan_process(
+                scan_worker.scan_object,
+                obj=obj,
+                file_path=str(file_path),
+                phase=phase,
+                trace_context=tracer.get_current_context(),
+            )
+
+        with ckv_whorf.lock, health_monitor.track_scan():
+            complete = ckv_whorf.scan_object(obj=obj, file_path=str(file_path), phase=phase)
+            return complete, ckv_whorf.scan_reports
+
+
+def scan_objects(objects: dict[str, dict[str, Any]]) -> list[Report]:
+    """Scans the objects of a batch with all checks in a single run either in the scan process pool or in this process"""
+
+    if SCAN_PROCESSES:
+        return run_in_scan_process(scan_worker.scan_objects, objects=objects)
+
+    with ckv_whorf.lock, health_monitor.track_scan():
+        ckv_whorf.scan_objects(objects=objects)
+        return ckv_whorf.scan_reports
+
+
+def get_scan_process_pool() -> ProcessPoolExecutor | None:
+    """Returns the scan process pool of this worker, which is created on first use, or None without scan processes
+
+    It must not be created on import, otherwise the Gunicorn master would create it with preloading
+    and all forked workers would share its processes and pipes. 'spawn' avoids forking the threads of the
+    scheduler and executors into the scan processes.
+    """
+
+    global scan_process_pool, scan_warm_up_barrier
+
+    if not SCAN_PROCESSES:
+        return None
+
+    with scan_process_pool_lock:
+        if scan_process_pool is None:
+            mp_context = multiprocessing.get_context("spawn")
+            scan_start_times = mp_context.Array("d", SCAN_PROCESSES)
+            scan_warm_up_barrier = mp_context.Barrier(SCAN_PROCESSES)
+            scan_process_pool = ProcessPoolExecutor(
+                max_workers=SCAN_PROCESSES,
+                mp_context=mp_context,
+                initializer=scan_worker.init_worker,
+                initargs=(whorf_conf, scan_start_times, mp_context.Value("i", 0), scan_warm_up_barrier),
+            )
+            health_monitor.scan_process_start_times = scan_start_times
+
+    return scan_process_pool
+
+
+def run_in_scan_process(fn: Callable[..., T], /, **kwargs: Any) -> T:
+    """Runs the function in a process of the scan process pool and waits for its result
+
+    A pool, which is broken by a crashed or failed to initialize scan process, can't run anything anymore,
+    therefore it is replaced by a new one for the following calls.
+    """
+
+    global scan_process_pool
+
+    process_pool = cast("ProcessPoolExecutor", get_scan_process_pool())
+    try:
+        return process_pool.submit(fn, **kwargs).result()
+    except BrokenProcessPool:
+        with scan_process_pool_lock:
+            if scan_process_pool is process_pool:
+                webhook.logger.error("The scan process pool is broken, it is replaced by a new one")
+                scan_process_pool = None
+                health_monitor.scan_process_start_times = None
+        process_pool.shutdown(wait=False, cancel_futures=True)
+        raise
+
+
+def warm_up_scan_processes() -> set[int]:
+    """Warms up every process of the scan process pool and returns their process IDs
+
+    The pool only starts a new process, when no idle one is available, therefore the warm-ups wait for each other
+    at the barrier and keep the already started processes busy, until all of them run.
+    """
+
+    get_scan_process_pool()
+    if scan_warm_up_barrier is not None:
+        # a timed out barrier of a previous attempt is broken
+        scan_warm_up_barrier.reset()
+
+    with ThreadPoolExecutor(max_workers=SCAN_PROCESSES, thread_name_prefix="warm-up") as executor:
+        futures = [
+            executor.submit(run_in_scan_process, scan_worker.warm_up, timeout_in_sec=WARM_UP_TIMEOUT_IN_SEC)
+            for _ in range(SCAN_PROCESSES)
+        ]
+        return {future.result() for future in futures}
+
+
+def warm_up() -> None:
+    """Runs the complete Checkov setup by scanning a synthetic manifest, before reporting ready
+
+    With scan processes all of them are warmed up. A failed warm-up is retried with an increasing delay,
+    after the last attempt the liveness probe fails.
+    """
+
+    for attempt in range(1, WARM_UP_MAX_ATTEMPTS + 1):
+        try:
+            if SCAN_PROCESSES:
+                process_ids = warm_up_scan_processes()
+                webhook.logger.info(f"Warmed up {len(process_ids)} scan processes")
+            else:
+                ckv_whorf.warm_up()
+        except Exception:
+            webhook.logger.error(
+                f"Failed to warm up the scanner, attempt {attempt} of {WARM_UP_MAX_ATTEMPTS}", exc_info=True
+            )
+            if attempt < WARM_UP_MAX_ATTEMPTS:
+                time.sleep(WARM_UP_RETRY_DELAY_IN_SEC * 2 ** (attempt - 1))
+            continue
+
+        health_monitor.ready.set()
+        webhook.logger.info("Scanner is warmed up and ready")
+        return
+
+    health_monitor.warm_up_failed.set()
+
+
+def start_background_tasks() -> None:
+    """Starts the scheduler and the warm-up, which has to happen in the Gunicorn worker, because threads are not forked"""
+
+    scheduler.add_job(id="config", func=reload_config, trigger="interval", seconds=CONFIG_RELOAD_INTERVAL_IN_SEC)
+    if auditor:
+        scheduler.add_job(id="audit", func=audit_periodic, trigger="interval", minutes=whorf_conf.audit_interval_in_min)
+    scheduler.start()
+    get_scan_process_pool()
+    scan_executor.submit(warm_up)
+
+
+def reload_config() -> None:
+    """Applies changes of the Checkov and whorf config, which are mounted from ConfigMaps
+
+    The files are only parsed again, when their modification time changed, and the whorf config is swapped as a
+    whole, therefore requests always see either the previous or the new config.
+    """
+
+    global whorf_conf, whorf_conf_mtime
+
+    with ckv_whorf.lock:
+        if ckv_whorf.update_config():
+            # the cached verdicts are based on the previous config
+            verdict_cache.clear()
+            webhook.logger.info("Applied the changed Checkov config")
+
+    if (mtime := get_whorf_config_mtime()) == whorf_conf_mtime:
+        return
+
+    whorf_conf_mtime = mtime
+    try:
+        new_whorf_conf = get_whorf_config()
+    except Exception:
+        webhook.logger.error("Failed to parse the changed whorf config, keep the previous one", exc_info=True)
+        return
+
+    apply_whorf_config(new_whorf_conf)
+    whorf_conf = new_whorf_conf
+    webhook.logger.info("Applied the changed whorf config")
+
+
+def apply_whorf_config(new_whorf_conf: WhorfConfig) -> None:
+    """Resizes the caches and queues of this process and drops the cached verdicts
+
+    The scheduled jobs and scan processes keep their settings.
+    """
+
+    if (
+        new_whorf_conf.upload_interval_in_min != whorf_conf.upload_interval_in_min
+        or new_whorf_conf.audit_source != whorf_conf.audit_source
+        or new_whorf_conf.audit_interval_in_min != whorf_conf.audit_interval_in_min
+        or new_whorf_conf.sca_image_cache_path != whorf_conf.sca_image_cache_path
+    ):
+        webhook.logger.warning(
+            "Changes of the upload interval, the audit source and the image cache path are only applied after a restart"
+        )
+
+    # the cached verdicts depend on the whorf config as well, ex. the scan mode and the fast path mode
+    verdict_cache.clear()
+    verdict_cache.maxsize = new_whorf_conf.verdict_cache_size
+    verdict_cache.ttl = new_whorf_conf.verdict_cache_ttl_in_sec
+    upload_queue.resize(maxsize=new_whorf_conf.upload_queue_size, batch_size=new_whorf_conf.upload_batch_size)
+    spool.max_bytes = new_whorf_conf.spool_max_bytes
+    spool.max_files = new_whorf_conf.spool_max_files
+    spool.max_age_in_sec = new_whorf_conf.spool_max_age_in_min * 60
+    if auditor:
+        auditor.rate_limiter.max_objects_per_min = new_whorf_conf.audit_max_objects_per_min
+    batch_rate_limiter.max_objects_per_min = new_whorf_conf.batch_max_objects_per_min
+    if image_cache := ckv_whorf.kubernetes_runner.image_cache:
+        image_cache.resize(maxsize=new_whorf_conf.sca_image_cache_size, ttl=new_whorf_conf.sca_image_cache_ttl_in_sec)
+    configure_tracing(new_whorf_conf)
+    new_whorf_conf.init_app(webhook)
+
+
+def enqueue_finished_scan(scan: Future[tuple[Verdict, UploadItem | None]], obj: dict[str, Any]) -> None:
+    """Adds the results of a scan, which finished after the admission response, to the upload queue"""
+
+    if exc := scan.exception():
+        webhook.logger.error("Failed to finish the scan in the background", exc_info=exc)
+        return
+
+    _, upload_item = scan.result()
+    if upload_item:
+        enqueue_upload(obj=obj, upload_item=upload_item)
+
+
+def enqueue_upload(obj: dict[str, Any], upload_item: UploadItem) -> bool:
+    """Persists the scanned manifest and adds it together with its scan reports to the upload queue
+
+    Returns, if it was accepted by the upload queue.
+    """
+
+    with MANIFEST_DUMP_DURATION.time():
+        persist_manifest(obj=obj, file_path=upload_item.file_path, spool=spool, content_hash=upload_item.content_hash)
+
+    if not upload_queue.put(upload_item):
+        webhook.logger.warning(f"Upload queue is full, skip uploading {upload_item.file_path}")
+        spool.remove(upload_item.file_path)
+        return False
+
+    if upload_queue.under_pressure:
+        # don't wait for the next scheduled upload
+        scheduler.modify_job("upload", next_run_time=datetime.now())
+    return True
+
+
+@scheduler.task("cron", id="upload", minute=whorf_conf.upload_interval_in_min)
+def upload_periodic() -> None:
+    """Uploads the manifests, which are queued at the start of the upload, in batches
+
+    Manifests queued during the upload wait for the next one, so a high admission rate can't keep the upload running.
+    Only the uploaded manifests are deleted afterwards, the ones of a failed batch are queued again for the next upload.
+    """
+
+    pending_count = upload_queue.depth
+    while pending_count > 0 and (upload_items := upload_queue.get_batch(max_size=pending_count)):
+        pending_count -= len(upload_items)
+        # the files of evicted manifests don't exist anymore
+        unique_upload_items = deduplicate_upload_items(
+            [upload_item for upload_item in upload_items if upload_item.file_path in spool]
+        )
+        files = [str(upload_item.file_path) for upload_item in unique_upload_items]
+        webhook.logger.info(
+            f"Start uploading {len(files)} scanned manifests, skipped {len(upload_items) - len(files)} duplicates "
+            "or evicted manifests"
+        )
+        if not files:
+            continue
+
+        scan_reports = merge_scan_reports(upload_item.scan_reports for upload_item in unique_upload_items)
+
+        start_time = time.perf_counter()
+        if SCAN_PROCESSES:
+            uploaded = run_in_scan_process(
+                scan_worker.upload_reports, root_folder=str(MANIFEST_ROOT_PATH), files=files, scan_reports=scan_reports
+            )
+        else:
+            with ckv_whorf.lock:
+                uploaded = ckv_whorf.upload_reports(
+                    root_folder=str(MANIFEST_ROOT_PATH), files=files, scan_reports=scan_reports
+                )
+
+        if not uploaded:
+            # the manifests stay in the spool and are retried by the next upload, unless the queue is full by now
+            requeued_items = [upload_item for upload_item in unique_upload_items if upload_queue.put(upload_item)]
+            webhook.logger.error(f"Failed to upload {len(files)} manifests, requeued {len(requeued_items)} of them")
+            kept_file_paths = {upload_item.file_path for upload_item in requeued_items}
+            for upload_item in upload_items:
+                if upload_item.file_path not in kept_file_paths:
+                    spool.remove(upload_item.file_path)
+            break
+
+        upload_queue.record_upload(item_count=len(upload_items), latency_in_sec=time.perf_counter() - start_time)
+
+        for upload_item in upload_items:
+            spool.remove(upload_item.file_path)
+
+        webhook.logger.info(
+            f"Upload queue depth: {upload_queue.depth}, upload latency: {upload_queue.last_upload_latency_in_sec:.3f}s, "
+            f"dropped: {upload_queue.dropped}, spooled: {spool.file_count} files with {spool.bytes} bytes, "
+            f"evicted: {spool.evictions}"
+        )
+
+
+@scheduler.task("cron", id="spool", minute="*")
+def sweep_spool() -> None:
+    spool.sweep()
+
+
+def audit_periodic() -> None:
+    """Scans the existing objects, which changed since their last audit, and queues them for the upload
+
+    The objects are scanned in small rate-limited chunks, so admission requests only wait shortly for the engine.
+    The audit stops early, when the upload queue fills up, the remaining objects are audited by the next run.
+    """
+
+    if not auditor or not auditor.acquire_lock():
+        return
+
+    webhook.logger.info("Start auditing the existing objects")
+    audited = 0
+    for chunk in chunked(auditor.get_changed_objects(config_hash=ckv_whorf.config_hash), AUDIT_CHUNK_SIZE):
+        if upload_queue.under_pressure:
+            webhook.logger.warning("Upload queue is under pressure, stop auditing until the next run")
+            break
+
+        auditor.wait_for_rate_limit(object_count=len(chunk))
+        audited += audit_chunk(audit=auditor, chunk=chunk)
+
+    webhook.logger.info(f"Audited {audited} changed objects, {len(auditor.object_hashes)} objects are up to date")
+
+
+def audit_chunk(audit: Auditor, chunk: list[tuple[str, dict[str, Any]]]) -> int:
+    """Scans the objects in a single run and returns the number of objects queued for the upload"""
+
+    # the pods of a ReplicaSet have the same hash, therefore the file path has to be unique per object
+    objects = {str(MANIFEST_ROOT_PATH / f"audit-{uuid.uuid4()}.yaml"): obj for _, obj in chunk}
+    with tracer.start_span("audit", object_count=len(objects)):
+        reports_by_file = split_scan_reports(scan_objects(objects=objects))
 
+    audited = 0
+    for (object_hash, obj), file_path in zip(chunk, objects, strict=True):
+        upload_item = UploadItem(
+            file_path=Path(file_path), scan_reports=reports_by_file.get(file_path, []), content_hash=object_hash
+        )
+        # objects, which didn't fit into the upload queue, stay unaudited and are retried by the next run
+        if enqueue_upload(obj=obj, upload_item=upload_item):
+            audit.mark_audited(obj=obj, object_hash=object_hash)
+            audited += 1
 
-@scheduler.task("cron", id="scan", minute=whorf_conf.upload_interval_in_min)
-def scan_periodic() -> None:
-    webhook.logger.info(f"Start scanning directory {MANIFEST_ROOT_PATH}")
+    AUDITED_OBJECTS.inc(audited)
+    return audited
 
-    ckv_whorf = CheckovWhorf(logger=webhook.logger, argv=DEFAULT_CHECKOV_ARGS)
-    ckv_whorf.update_config()
-    ckv_whorf.scan_directory(str(MANIFEST_ROOT_PATH))
 
-    cleanup_directory(MANIFEST_ROOT_PATH)
+if not PRELOAD:
+    # with preloading they are started by the forked workers, see gunicorn.conf.py
+    start_background_tasks()
@@ -0,0 +1,429 @@
+"""Replays a corpus of AdmissionReview payloads against the /validate endpoint and reports its performance
+
+ex.
+    python -m benchmarks.run_benchmark --target flask --requests 200 --output results.json
+    python -m benchmarks.run_benchmark --target gunicorn --concurrency 4 --baseline results.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from importlib.metadata import version
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger("whorf.benchmark")
+
+BENCHMARK_PATH = Path(__file__).parent
+REPO_PATH = BENCHMARK_PATH.parent
+DEFAULT_CORPUS_PATH = BENCHMARK_PATH / "corpus"
+DEFAULT_CONFIG_PATH = BENCHMARK_PATH / "config"
+
+STARTUP_TIMEOUT_IN_SEC = 120
+POLL_INTERVAL_IN_SEC = 0.05
+
+# a request is sent with the name of its corpus payload and the serialized AdmissionReview
+BenchmarkRequest = tuple[str, bytes]
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    # Checkov configures the root logger on import
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    corpus = load_corpus(Path(args.corpus))
+    requests = create_requests(corpus=corpus, count=args.warm_up + args.requests, cache_hits=args.cache_hits)
+
+    with prepare_work_dir(config_path=Path(args.config)) as work_dir:
+        if args.target == "flask":
+            result = run_flask(work_dir=work_dir, requests=requests, args=args)
+        else:
+            result = run_gunicorn(work_dir=work_dir, requests=requests, args=args)
+
+    result["corpus"] = sorted(corpus)
+    result["versions"] = {"python": platform.python_version(), "checkov": version("checkov")}
+
+    log_result(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2) + "\n")
+        logger.info(f"Saved results to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        return compare_to_baseline(result=result, baseline=baseline, max_regression_in_percent=args.max_regression)
+
+    return 0
+
+
+def parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark of the Whorf admission path, which runs fully offline")
+    parser.add_argument("--target", choices=("flask", "gunicorn"), default="flask", help="App server to benchmark")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS_PATH), help="Folder with AdmissionReview JSON files")
+    parser.add_argument("--config", default=str(DEFAULT_CONFIG_PATH), help="Folder with .checkov.yaml and whorf.yaml")
+    parser.add_argument("--requests", type=int, default=100, help="Number of measured requests")
+    parser.add_argument("--warm-up", type=int, default=10, help="Number of requests sent before measuring")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of concurrent clients")
+    parser.add_argument("--workers", type=int, default=1, help="Number of Gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="Number of threads per Gunicorn worker")
+    parser.add_argument("--preload", action="store_true", help="Preload the app in the Gunicorn master")
+    parser.add_argument(
+        "--cache-hits", action="store_true", help="Replay identical objects, which are answered by the verdict cache"
+    )
+    parser.add_argument("--output", help="Path of the JSON results file")
+    parser.add_argument("--baseline", help="Path of a previous JSON results file to compare with")
+    parser.add_argument(
+        "--max-regression", type=float, help="Fail, if a latency or throughput regressed by more than this percentage"
+    )
+
+    return parser.parse_args(argv)
+
+
+def load_corpus(corpus_path: Path) -> dict[str, dict[str, Any]]:
+    corpus = {file_path.stem: json.loads(file_path.read_text()) for file_path in sorted(corpus_path.glob("*.json"))}
+    if not corpus:
+        raise ValueError(f"No AdmissionReview JSON files found in {corpus_path}")
+
+    return corpus
+
+
+def create_requests(corpus: dict[str, dict[str, Any]], *, count: int, cache_hits: bool) -> list[BenchmarkRequest]:
+    """Serializes the requests upfront, every request gets its own UID and by default its own object name"""
+
+    requests = []
+    payloads = list(corpus.items())
+    for idx in range(count):
+        name, payload = payloads[idx % len(payloads)]
+        payload = json.loads(json.dumps(payload))
+        payload["request"]["uid"] = str(uuid.uuid4())
+        if not cache_hits:
+            # otherwise the verdict cache answers all requests after the first round
+            payload["request"]["object"]["metadata"]["name"] += f"-{idx}"
+        requests.append((name, json.dumps(payload).encode()))
+
+    return requests
+
+
+@contextmanager
+def prepare_work_dir(config_path: Path) -> Iterator[Path]:
+    """Creates a working dir with the config files, which are read relative to it by the app"""
+
+    with tempfile.TemporaryDirectory(prefix="whorf-benchmark-") as tmp_dir:
+        work_dir = Path(tmp_dir)
+        shutil.copytree(config_path, work_dir / "config")
+        yield work_dir
+
+
+def get_offline_env() -> dict[str, str]:
+    env = {key: value for key, value in os.environ.items() if key not in ("BC_API_KEY", "PRISMA_API_URL")}
+    # denied requests are logged as errors, failed requests fail the benchmark anyway
+    env["LOG_LEVEL"] = "CRITICAL"
+    # no guidelines or custom policies are downloaded from the platform
+    env["BC_SKIP_MAPPING"] = "TRUE"
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (str(REPO_PATH), env.get("PYTHONPATH"))))
+
+    return env
+
+
+def run_flask(work_dir: Path, requests: list[BenchmarkRequest], args: argparse.Namespace) -> dict[str, Any]:
+    """Benchmarks the Flask app in this process via its test client"""
+
+    os.environ.clear()
+    os.environ.update(get_offline_env())
+    os.chdir(work_dir)
+
+    start_time = time.perf_counter()
+    from benchmarks.offline_app import webhook
+
+    startup_in_sec = time.perf_counter() - start_time
+    first_request_latency = send_flask_request(webhook.test_client(), requests[0][1])
+
+    from app.whorf import health_monitor, upload_periodic
+
+    health_monitor.ready.wait(STARTUP_TIMEOUT_IN_SEC)
+    ready_in_sec = time.perf_counter() - start_time
+
+    local = threading.local()
+
+    def send(body: bytes) -> float:
+        if not hasattr(local, "client"):
+            local.client = webhook.test_client()
+        return send_flask_request(local.client, body)
+
+    result = measure(send=send, requests=requests[1:], args=args)
+    # removes the persisted manifests
+    upload_periodic()
+
+    result["target"] = "flask"
+    result["cold_start"] = {
+        "startup_in_sec": round(startup_in_sec, 3),
+        "first_request_latency_in_ms": round(first_request_latency * 1000, 2),
+        "ready_in_sec": round(ready_in_sec, 3),
+    }
+    result["memory_high_water_mark_in_mib"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    return result
+
+
+def send_flask_request(client: Any, body: bytes) -> float:
+    start_time = time.perf_counter()
+    response = client.post("/validate", data=body, content_type="application/json")
+    latency = time.perf_counter() - start_time
+    # runs the 'call_on_close' callbacks like the upload queueing
+    response.close()
+
+    if response.status_code != 200:
+        raise RuntimeError(f"Request failed with status {response.status_code}")
+
+    return latency
+
+
+def run_gunicorn(work_dir: Path, requests: list[BenchmarkRequest], args: argparse.Namespace) -> dict[str, Any]:
+    """Benchmarks the app in a Gunicorn server with the config of the container image, but without TLS"""
+
+    port = get_free_port()
+    env = get_offline_env()
+    env.update(
+        WHORF_WORKERS=str(args.workers),
+        WHORF_THREADS=str(args.threads),
+        WHORF_PRELOAD=str(args.preload).lower(),
+        WHORF_SCAN_PROCESSES="0",
+    )
+    command = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "--config",
+        str(REPO_PATH / "gunicorn.conf.py"),
+        "--bind",
+        f"127.0.0.1:{port}",
+        "benchmarks.offline_app:webhook",
+    ]
+
+    start_time = time.perf_counter()
+    with (work_dir / "gunicorn.log").open("w") as log_file:
+        server = subprocess.Popen(command, cwd=work_dir, env=env, stdout=log_file, stderr=log_file)  # noqa: S603
+        try:
+            wait_for_endpoint(port=port, path="/", server=server)
+            startup_in_sec = time.perf_counter() - start_time
+            first_request_latency = send_http_request(http.client.HTTPConnection("127.0.0.1", port), requests[0][1])
+            wait_for_endpoint(port=port, path="/readyz", server=server)
+            ready_in_sec = time.perf_counter() - start_time
+
+            local = threading.local()
+
+            def send(body: bytes) -> float:
+                if not hasattr(local, "connection"):
+                    local.connection = http.client.HTTPConnection("127.0.0.1", port)
+                return send_http_request(local.connection, body)
+
+            result = measure(send=send, requests=requests[1:], args=args)
+            memory_high_water_mark = get_process_tree_high_water_mark(pid=server.pid)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    result["target"] = "gunicorn"
+    result["gunicorn"] = {"workers": args.workers, "threads": args.threads, "preload": args.preload}
+    result["cold_start"] = {
+        "startup_in_sec": round(startup_in_sec, 3),
+        "first_request_latency_in_ms": round(first_request_latency * 1000, 2),
+        "ready_in_sec": round(ready_in_sec, 3),
+    }
+    result["memory_high_water_mark_in_mib"] = memory_high_water_mark
+
+    return result
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def wait_for_endpoint(port: int, path: str, server: subprocess.Popen[bytes]) -> None:
+    deadline = time.perf_counter() + STARTUP_TIMEOUT_IN_SEC
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Gunicorn exited with code {server.returncode}, see its log in the working dir")
+
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+        try:
+            connection.request("GET", path)
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            connection.close()
+
+        time.sleep(POLL_INTERVAL_IN_SEC)
+
+    raise TimeoutError(f"Endpoint {path} wasn't available after {STARTUP_TIMEOUT_IN_SEC}s")
+
+
+def send_http_request(connection: http.client.HTTPConnection, body: bytes) -> float:
+    start_time = time.perf_counter()
+    connection.request("POST", "/validate", body=body, headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    response.read()
+    latency = time.perf_counter() - start_time
+
+    if response.status != 200:
+        raise RuntimeError(f"Request failed with status {response.status}")
+
+    return latency
+
+
+def get_process_tree_high_water_mark(pid: int) -> float | None:
+    """Sums up the peak resident set size of the process and all its child processes, only supported on Linux"""
+
+    proc_path = Path("/proc")
+    if not proc_path.exists():
+        return None
+
+    children: dict[int, list[int]] = defaultdict(list)
+    for stat_path in proc_path.glob("[0-9]*/stat"):
+        try:
+            # the process name is in parentheses and can contain spaces
+            fields = stat_path.read_text().rsplit(")", maxsplit=1)[1].split()
+        except OSError:
+            continue
+        children[int(fields[1])].append(int(stat_path.parent.name))
+
+    high_water_mark_in_kib = 0
+    pids = [pid]
+    while pids:
+        current_pid = pids.pop()
+        pids.extend(children[current_pid])
+        try:
+            status = (proc_path / str(current_pid) / "status").read_text()
+        except OSError:
+            continue
+        for line in status.splitlines():
+            if line.startswith("VmHWM:"):
+                high_water_mark_in_kib += int(line.split()[1])
+
+    return round(high_water_mark_in_kib / 1024, 1)
+
+
+def measure(
+    send: Callable[[bytes], float], requests: list[BenchmarkRequest], args: argparse.Namespace
+) -> dict[str, Any]:
+    """Sends the warm-up requests and then measures the latencies and throughput of the remaining ones"""
+
+    warm_up_requests = requests[: args.warm_up - 1] if args.warm_up else []
+    measured_requests = requests[len(warm_up_requests) :]
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+
+    def send_request(request: BenchmarkRequest) -> tuple[str, float]:
+        name, body = request
+        return name, send(body)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(send_request, warm_up_requests))
+
+        start_time = time.perf_counter()
+        for name, latency in executor.map(send_request, measured_requests):
+            latencies[name].append(latency)
+        duration = time.perf_counter() - start_time
+
+    all_latencies = [latency for payload_latencies in latencies.values() for latency in payload_latencies]
+    return {
+        "requests": len(measured_requests),
+        "concurrency": args.concurrency,
+        "cache_hits": args.cache_hits,
+        "duration_in_sec": round(duration, 3),
+        "throughput_per_sec": round(len(measured_requests) / duration, 2),
+        "latency_in_ms": get_latency_stats(all_latencies),
+        "latency_by_payload_in_ms": {name: get_latency_stats(latencies[name]) for name in sorted(latencies)},
+    }
+
+
+def get_latency_stats(latencies: list[float]) -> dict[str, float]:
+    if len(latencies) < 2:
+        latencies = latencies * 2
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "mean": round(statistics.fmean(latencies) * 1000, 2),
+        "p50": round(percentiles[49] * 1000, 2),
+        "p95": round(percentiles[94] * 1000, 2),
+        "p99": round(percentiles[98] * 1000, 2),
+        "max": round(max(latencies) * 1000, 2),
+    }
+
+
+def log_result(result: dict[str, Any]) -> None:
+    latency = result["latency_in_ms"]
+    cold_start = result["cold_start"]
+    logger.info(
+        f"{result['target']}: {result['requests']} requests with concurrency {result['concurrency']} "
+        f"in {result['duration_in_sec']}s, throughput {result['throughput_per_sec']}/s"
+    )
+    logger.info(f"latency p50 {latency['p50']}ms, p95 {latency['p95']}ms, p99 {latency['p99']}ms")
+    for name, payload_latency in result["latency_by_payload_in_ms"].items():
+        logger.info(f"  {name}: p50 {payload_latency['p50']}ms, p95 {payload_latency['p95']}ms")
+    logger.info(
+        f"cold start: startup {cold_start['startup_in_sec']}s, "
+        f"first request {cold_start['first_request_latency_in_ms']}ms, ready {cold_start['ready_in_sec']}s"
+    )
+    logger.info(f"memory high-water mark {result['memory_high_water_mark_in_mib']}Mi")
+
+
+def compare_to_baseline(
+    result: dict[str, Any], baseline: dict[str, Any], max_regression_in_percent: float | None
+) -> int:
+    """Logs the changes compared to the baseline and returns 1, if any of them exceeds the max regression"""
+
+    # the baseline value, the current value and if a higher value is better
+    values = {
+        "throughput": (baseline["throughput_per_sec"], result["throughput_per_sec"], True),
+        **{
+            f"latency {stat}": (baseline["latency_in_ms"][stat], result["latency_in_ms"][stat], False)
+            for stat in ("p50", "p95", "p99")
+        },
+    }
+    if baseline.get("memory_high_water_mark_in_mib") and result.get("memory_high_water_mark_in_mib"):
+        values["memory"] = (baseline["memory_high_water_mark_in_mib"], result["memory_high_water_mark_in_mib"], False)
+
+    exit_code = 0
+    for name, (baseline_value, value, higher_is_better) in values.items():
+        change = get_change_in_percent(baseline_value, value)
+        regression = -change if higher_is_better else change
+        regressed = max_regression_in_percent is not None and regression > max_regression_in_percent
+        logger.info(f"{name}: {change:+.1f}% compared to the baseline{' - regression' if regressed else ''}")
+        exit_code = 1 if regressed else exit_code
+
+    return exit_code
+
+
+def get_change_in_percent(baseline: float, value: float) -> float:
+    return (value - baseline) / baseline * 100 if baseline else 0.0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
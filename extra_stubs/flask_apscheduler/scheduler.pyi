@@ -16,3 +16,5 @@ class APScheduler:
     def task(self, trigger: str, *, id: str, minute: str | None = None) -> Callable[[_F], _F]: ...
     def init_app(self, app: Flask) -> None: ...
     def start(self, paused: bool = ...) -> None: ...
+    def add_job(self, id: str, func: Callable[..., Any], **kwargs: Any) -> Any: ...
+    def modify_job(self, id: str, jobstore: str | None = None, **changes: Any) -> Any: ...
@@ -0,0 +1,49 @@
+# Gunicorn config, which is adjustable via env variables of the container
+from __future__ import annotations
+
+import gc
+import os
+import shutil
+from typing import Any
+
+# every worker process holds its own Checkov engine (~200Mi)
+workers = int(os.environ.get("WHORF_WORKERS", "1"))
+# more than one thread switches to the 'gthread' worker class, scans of a worker are still run one at a time,
+# but cached verdicts and ignored namespaces are answered while a scan is running
+threads = int(os.environ.get("WHORF_THREADS", "1"))
+# has to be higher than the scan deadline in the 'whorf.yaml' config
+timeout = int(os.environ.get("WHORF_TIMEOUT", "30"))
+# imports Checkov and loads its checks once in the master, the forked workers share those memory pages copy-on-write
+preload_app = os.environ.get("WHORF_PRELOAD", "false").lower() == "true"
+
+
+# the metrics of all workers and scan processes are collected in this directory, see "Metrics" in the README
+prometheus_multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+
+def on_starting(server: Any) -> None:  # noqa: ARG001
+    if prometheus_multiproc_dir:
+        # the metric files of a previous run would be added to the new values
+        shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+        os.makedirs(prometheus_multiproc_dir)
+
+
+def when_ready(server: Any) -> None:  # noqa: ARG001
+    if preload_app:
+        # otherwise the garbage collector of the workers touches the preloaded objects and copies their pages
+        gc.freeze()
+
+
+def post_worker_init(worker: Any) -> None:  # noqa: ARG001
+    if preload_app:
+        # threads are not forked, therefore the scheduler and the warm-up can only be started in the worker
+        from app.whorf import start_background_tasks
+
+        start_background_tasks()
+
+
+def child_exit(server: Any, worker: Any) -> None:  # noqa: ARG001
+    if prometheus_multiproc_dir:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+from pytest_mock import MockerFixture
+
+from app.audit import ApiServerAuditSource, Auditor, DirectoryAuditSource
+
+
+def test_get_changed_objects(tmp_path: Path) -> None:
+    # given
+    pod = {"apiVersion": "v1", "kind": "Pod", "metadata": {"name": "pod", "namespace": "default"}, "spec": {}}
+    role = {"apiVersion": "rbac.authorization.k8s.io/v1", "kind": "Role", "metadata": {"name": "role"}}
+    (tmp_path / "pod.yaml").write_text(yaml.dump(pod))
+    (tmp_path / "roles.json").write_text(json.dumps({"apiVersion": "v1", "kind": "List", "items": [role]}))
+    (tmp_path / "README.md").write_text("not a manifest")
+
+    auditor = Auditor(source=DirectoryAuditSource(path=tmp_path), max_objects_per_min=60)
+
+    # when/then
+    changed_objects = list(auditor.get_changed_objects(config_hash="config"))
+    assert [obj for _, obj in changed_objects] == [pod, role]
+
+    for object_hash, obj in changed_objects:
+        auditor.mark_audited(obj=obj, object_hash=object_hash)
+    assert list(auditor.get_changed_objects(config_hash="config")) == []
+
+    # only the changed object is audited again
+    pod["metadata"]["resourceVersion"] = "4711"
+    pod["spec"] = {"hostNetwork": True}
+    (tmp_path / "pod.yaml").write_text(yaml.dump(pod))
+    assert [obj for _, obj in auditor.get_changed_objects(config_hash="config")] == [pod]
+
+    # a config change audits all objects again
+    assert len(list(auditor.get_changed_objects(config_hash="new-config"))) == 2
+
+    # deleted objects are forgotten
+    (tmp_path / "roles.json").unlink()
+    list(auditor.get_changed_objects(config_hash="config"))
+    assert list(auditor.object_hashes) == ["Pod/default/pod"]
+
+
+def test_wait_for_rate_limit_without_limit(mocker: MockerFixture, tmp_path: Path) -> None:
+    # given
+    sleep_mock = mocker.patch("app.background.time.sleep")
+    auditor = Auditor(source=DirectoryAuditSource(path=tmp_path), max_objects_per_min=0)
+
+    # when
+    for _ in range(2):
+        auditor.wait_for_rate_limit(object_count=10)
+
+    # then
+    sleep_mock.assert_not_called()
+
+
+def test_api_server_audit_source_outside_of_cluster(mocker: MockerFixture) -> None:
+    # given
+    mocker.patch.dict("os.environ", clear=True)
+
+    # when
+    source = ApiServerAuditSource(resources=["v1/pods"])
+
+    # then
+    with pytest.raises(RuntimeError, match="KUBERNETES_SERVICE_HOST is not set"):
+        list(source.list_objects())
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from app.background import BackgroundScanExecutor
+
+
+def test_background_scans_yield_to_admission_scans() -> None:
+    # given
+    executor = BackgroundScanExecutor(maxsize=1, max_wait_in_sec=5)
+    finished = threading.Event()
+
+    # when
+    with executor.admission_scan():
+        background_scan = executor.submit(finished.set)
+        dropped_scan = executor.submit(finished.set)
+        time.sleep(0.05)
+        started_during_admission_scan = finished.is_set()
+
+    # then
+    assert started_during_admission_scan is False
+    assert dropped_scan is None
+    assert executor.dropped == 1
+
+    assert background_scan is not None
+    background_scan.result(timeout=1)
+    assert finished.is_set()
+    assert executor.pending == 0
+
+
+def test_background_scans_wait_at_most_max_wait() -> None:
+    # given
+    executor = BackgroundScanExecutor(maxsize=1, max_wait_in_sec=0.01)
+
+    # when
+    with executor.admission_scan():
+        background_scan = executor.submit(lambda: "done")
+
+        # then
+        assert background_scan is not None
+        assert background_scan.result(timeout=1) == "done"
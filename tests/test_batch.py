@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import copy
+import json
+
+import pytest
+from checkov.common.bridgecrew.check_type import CheckType
+from checkov.common.output.record import Record
+from checkov.common.output.report import Report
+
+from app.batch import BatchTooLargeError, chunked, iter_objects, limit_objects, split_scan_reports, validate_objects
+from app.models import PolicyIndex
+
+
+def test_iter_objects() -> None:
+    # given
+    pod = {"apiVersion": "v1", "kind": "Pod", "metadata": {"name": "pod"}}
+    role = {"apiVersion": "rbac.authorization.k8s.io/v1", "kind": "Role", "metadata": {"name": "role"}}
+    admission_review = {"kind": "AdmissionReview", "request": {"uid": "13b390aa", "object": role}}
+    object_list = {"apiVersion": "v1", "kind": "List", "items": [pod, role]}
+
+    # when/then
+    assert list(iter_objects(json.dumps(object_list, indent=2).splitlines(keepends=True))) == [pod, role]
+    assert list(iter_objects([json.dumps([pod, admission_review])])) == [pod, role]
+    assert list(iter_objects([f"{json.dumps(pod)}\n", "\n", f"{json.dumps(admission_review)}\n"])) == [pod, role]
+
+    with pytest.raises(ValueError):
+        list(iter_objects([json.dumps(["pod"])]))
+    with pytest.raises(ValueError):
+        list(iter_objects(["kind: Pod"]))
+
+
+def test_iter_objects_is_lazy() -> None:
+    # given
+    pod = {"apiVersion": "v1", "kind": "Pod", "metadata": {"name": "pod"}}
+    lines = iter([json.dumps(pod), "invalid"])
+
+    # when
+    objects = iter_objects(lines)
+
+    # then
+    assert next(objects) == pod
+    with pytest.raises(ValueError):
+        next(objects)
+
+
+def test_split_scan_reports(k8s_record: Record, license_record: Record) -> None:
+    # given
+    other_k8s_record = copy.copy(k8s_record)
+    other_k8s_record.file_abs_path = "/path/to/other.yaml"
+    k8s_report = Report(check_type=CheckType.KUBERNETES)
+    k8s_report.add_record(k8s_record)
+    k8s_report.add_record(other_k8s_record)
+    sca_report = Report(check_type=CheckType.SCA_IMAGE)
+    sca_report.add_record(license_record)
+
+    # when
+    reports_by_file = split_scan_reports([k8s_report, sca_report])
+
+    # then
+    reports = reports_by_file[k8s_record.file_abs_path]
+    assert [report.check_type for report in reports] == [CheckType.KUBERNETES, CheckType.SCA_IMAGE]
+    assert reports[0].failed_checks == [k8s_record]
+    assert reports[1].failed_checks == [license_record]
+
+    other_reports = reports_by_file["/path/to/other.yaml"]
+    assert [report.check_type for report in other_reports] == [CheckType.KUBERNETES]
+    assert other_reports[0].failed_checks == [other_k8s_record]
+
+
+def test_limit_objects() -> None:
+    # given
+    chunks = chunked(limit_objects(({"kind": "Pod"} for _ in range(5)), max_count=3), size=2)
+
+    # when/then
+    assert len(next(chunks)) == 2
+    with pytest.raises(BatchTooLargeError, match="Batch exceeds the limit of 3 objects"):
+        next(chunks)
+
+    assert len(list(limit_objects(({"kind": "Pod"} for _ in range(5)), max_count=0))) == 5
+
+
+def test_validate_objects_without_records(webhook) -> None:
+    # given
+    objects = [
+        {"apiVersion": "v1", "kind": "ConfigMap", "metadata": {"name": "config", "namespace": "app"}},
+        {"apiVersion": "v1", "kind": "Pod", "metadata": {"name": "pod", "namespace": "kube-system"}},
+    ]
+
+    # when
+    with webhook.app_context():
+        results = validate_objects(
+            objects=objects, scan=lambda _: [], policy_index=PolicyIndex(), ignored_namespaces={"kube-system"}
+        )
+
+    # then
+    # objects without any applicable check get the same message as an admission request
+    assert [(result.allowed, result.message) for result in results] == [
+        (True, "Checkov found 0 total issues in this manifest."),
+        (True, "Namespace in ignore list. Ignoring validation"),
+    ]
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from typing import Any
+
+from pytest_mock import MockerFixture
+
+import app.cache
+from app.cache import TTLCache
+from app.utils import get_object_hash
+
+
+def test_ttl_cache_evicts_least_recently_used() -> None:
+    # given
+    cache: TTLCache[int] = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+
+    # when
+    cache.set("c", 3)
+
+    # then
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 1, 1)
+
+
+def test_ttl_cache_expires_entries(mocker: MockerFixture) -> None:
+    # given
+    monotonic = mocker.patch.object(app.cache.time, "monotonic", return_value=100.0)
+    cache: TTLCache[int] = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+
+    # when
+    monotonic.return_value = 161.0
+    value = cache.get("a")
+
+    # then
+    assert value is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses, cache.evictions) == (0, 1, 1)
+
+
+def test_ttl_cache_counts_metrics(mocker: MockerFixture) -> None:
+    # given
+    lookups_metric = mocker.MagicMock()
+    evictions_metric = mocker.MagicMock()
+    cache: TTLCache[int] = TTLCache(maxsize=1, ttl=60, lookups_metric=lookups_metric, evictions_metric=evictions_metric)
+    cache.set("a", 1)
+
+    # when
+    cache.get("a")
+    cache.set("b", 2)
+    cache.get("a")
+
+    # then
+    assert [call.kwargs for call in lookups_metric.labels.call_args_list] == [{"result": "hit"}, {"result": "miss"}]
+    evictions_metric.labels.assert_called_once_with(reason="size")
+
+
+def test_get_object_hash_of_replica_pods() -> None:
+    # given
+    def create_pod(name: str, sa_volume_name: str) -> dict[str, Any]:
+        return {
+            "apiVersion": "v1",
+            "kind": "Pod",
+            "metadata": {"name": name, "generateName": "nginx-7c5ddbdf54-", "uid": name},
+            "spec": {
+                "containers": [
+                    {
+                        "name": "nginx",
+                        "image": "nginx",
+                        "volumeMounts": [
+                            {"name": "config", "mountPath": "/etc/nginx"},
+                            {"name": sa_volume_name, "mountPath": "/var/run/secrets/kubernetes.io/serviceaccount"},
+                        ],
+                    }
+                ],
+                "volumes": [
+                    {"name": "config", "configMap": {"name": "nginx"}},
+                    {"name": sa_volume_name, "projected": {"sources": [{"serviceAccountToken": {"path": "token"}}]}},
+                ],
+            },
+        }
+
+    # when
+    first_hash = get_object_hash(create_pod(name="nginx-7c5ddbdf54-2xk9p", sa_volume_name="kube-api-access-7xk2p"))
+    second_hash = get_object_hash(create_pod(name="nginx-7c5ddbdf54-qz8rt", sa_volume_name="kube-api-access-m4d9w"))
+    other_volume_hash = get_object_hash(create_pod(name="nginx-7c5ddbdf54-qz8rt", sa_volume_name="token"))
+
+    # then
+    assert first_hash == second_hash
+    assert first_hash != other_volume_hash
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import logging
+import os
+from pathlib import Path
+
+import pytest
+import yaml
+from checkov.common.bridgecrew.check_type import CheckType
+from checkov.common.output.report import Report
+from checkov.kubernetes.runner import Runner as KubernetesRunner
+from checkov.runner_filter import RunnerFilter
+from pytest_mock import MockerFixture
+
+import app.checkov_whorf
+from app.checkov_whorf import CheckovWhorf
+from app.consts import DEFAULT_CHECKOV_ARGS
+
+
+@pytest.fixture()
+def ckv_whorf(mocker: MockerFixture, tmp_path: Path) -> CheckovWhorf:
+    checkov_conf_path = tmp_path / ".checkov.yaml"
+    checkov_conf_path.write_text("framework: kubernetes")
+
+    mocker.patch.object(app.checkov_whorf, "CHECKOV_CONFIG_PATH", checkov_conf_path)
+
+    ckv_whorf = CheckovWhorf(logger=logging.getLogger(), argv=DEFAULT_CHECKOV_ARGS)
+    ckv_whorf.update_config()
+
+    return ckv_whorf
+
+
+def test_scan_object_reuses_engine(ckv_whorf: CheckovWhorf, tmp_path: Path) -> None:
+    # given
+    pod = {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {"name": "pod"},
+        "spec": {"containers": [{"name": "nginx", "image": "nginx"}]},
+    }
+    cluster_role = {
+        "apiVersion": "rbac.authorization.k8s.io/v1",
+        "kind": "ClusterRole",
+        "metadata": {"name": "role"},
+        "rules": [],
+    }
+
+    # when
+    ckv_whorf.scan_object(obj=pod, file_path=str(tmp_path / "pod.yaml"))
+    runner_filter = ckv_whorf.runner_filter
+    ckv_whorf.scan_object(obj=cluster_role, file_path=str(tmp_path / "cluster_role.yaml"))
+
+    # then
+    assert runner_filter is not None
+    assert ckv_whorf.runner_filter is runner_filter
+
+    k8s_report = next(report for report in ckv_whorf.scan_reports if report.check_type == CheckType.KUBERNETES)
+    resources = {record.resource for record in k8s_report.failed_checks + k8s_report.passed_checks}
+    assert resources == {"ClusterRole.default.role"}
+
+
+def test_scan_object(ckv_whorf: CheckovWhorf, tmp_path: Path) -> None:
+    # given
+    obj = {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {"name": "pod", "annotations": {"checkov.io/skip1": "CKV_K8S_21"}},
+        "spec": {"containers": [{"name": "nginx", "image": "nginx", "securityContext": {"privileged": True}}]},
+    }
+    pod_file_path = tmp_path / "pod.yaml"
+    pod_file_path.write_text(yaml.dump(obj))
+
+    file_report = KubernetesRunner().run(
+        root_folder=None, files=[str(pod_file_path)], runner_filter=RunnerFilter(framework=["kubernetes"])
+    )
+    assert isinstance(file_report, Report)
+
+    # when
+    ckv_whorf.scan_object(obj=obj, file_path=str(tmp_path / "obj.yaml"))
+
+    # then
+    object_report = ckv_whorf.scan_reports[0]
+    assert object_report.check_type == CheckType.KUBERNETES
+    assert {record.check_id for record in object_report.failed_checks} == {
+        record.check_id for record in file_report.failed_checks
+    }
+    assert {record.check_id for record in object_report.skipped_checks} == {"CKV_K8S_21"}
+    assert not (tmp_path / "obj.yaml").exists()
+    # the given object is not changed by Checkov
+    assert obj["metadata"]["annotations"] == {"checkov.io/skip1": "CKV_K8S_21"}
+
+
+def test_update_config(ckv_whorf: CheckovWhorf) -> None:
+    # given
+    checkov_conf_path = app.checkov_whorf.CHECKOV_CONFIG_PATH
+    unchanged = ckv_whorf.update_config()
+
+    checkov_conf_path.write_text("framework: kubernetes\nhard-fail-on:\n- CKV_K8S_16")
+    os.utime(checkov_conf_path, ns=(0, ckv_whorf.config_mtime + 1))
+
+    # when
+    changed = ckv_whorf.update_config()
+
+    # then
+    assert unchanged is False
+    assert changed is True
+    assert ckv_whorf.config.hard_fail_on == ["CKV_K8S_16"]
+
+
+def test_scan_object_reuses_pod_template_results(ckv_whorf: CheckovWhorf, tmp_path: Path) -> None:
+    # given
+    container = {"name": "nginx", "image": "nginx", "securityContext": {"privileged": True}}
+    deployment = {
+        "apiVersion": "apps/v1",
+        "kind": "Deployment",
+        "metadata": {"name": "nginx", "namespace": "nginx"},
+        "spec": {
+            "template": {
+                "metadata": {"labels": {"app": "nginx"}},
+                "spec": {"containers": [container]},
+            }
+        },
+    }
+    pod = {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {
+            "generateName": "nginx-7c5ddbdf54-",
+            "name": "nginx-7c5ddbdf54-x9k2p",
+            "namespace": "nginx",
+            "labels": {"app": "nginx", "pod-template-hash": "7c5ddbdf54"},
+        },
+        "spec": {
+            "containers": [
+                {**container, "volumeMounts": [{"name": "kube-api-access-4b7mz", "mountPath": "/var/run/secrets"}]}
+            ]
+        },
+    }
+
+    ckv_whorf.scan_object(obj=pod, file_path=str(tmp_path / "pod.yaml"))
+    expected_failed_checks = {record.check_id for record in ckv_whorf.scan_reports[0].failed_checks}
+    ckv_whorf.kubernetes_runner.template_results.clear()
+
+    ckv_whorf.scan_object(obj=deployment, file_path=str(tmp_path / "deployment.yaml"))
+    hits = ckv_whorf.kubernetes_runner.template_results.hits
+
+    # when
+    ckv_whorf.scan_object(obj=pod, file_path=str(tmp_path / "pod.yaml"))
+
+    # then
+    assert ckv_whorf.kubernetes_runner.template_results.hits == hits + 1
+
+    failed_checks = ckv_whorf.scan_reports[0].failed_checks
+    assert {record.check_id for record in failed_checks} == expected_failed_checks
+    privileged_record = next(record for record in failed_checks if record.check_id == "CKV_K8S_16")
+    assert privileged_record.resource == "Pod.nginx.nginx-7c5ddbdf54-x9k2p"
+    assert privileged_record.check_result["evaluated_keys"] == ["spec/containers/[0]/securityContext/privileged"]
+
+
+def test_scan_object_in_phases(ckv_whorf: CheckovWhorf, tmp_path: Path) -> None:
+    # given
+    checkov_conf_path = app.checkov_whorf.CHECKOV_CONFIG_PATH
+    checkov_conf_path.write_text("framework: kubernetes\nhard-fail-on:\n- CKV_K8S_16\n- CKV_K8S_20")
+    os.utime(checkov_conf_path, ns=(0, ckv_whorf.config_mtime + 1))
+    ckv_whorf.update_config()
+
+    obj = {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {"name": "pod"},
+        "spec": {"containers": [{"name": "nginx", "image": "nginx", "securityContext": {"privileged": True}}]},
+    }
+    file_path = str(tmp_path / "pod.yaml")
+
+    first_complete = ckv_whorf.scan_object(obj=obj, file_path=file_path, phase="hard-fail")
+    all_failed_checks = {record.check_id for record in ckv_whorf.scan_reports[0].failed_checks}
+
+    # when
+    hard_fail_complete = ckv_whorf.scan_object(obj=obj, file_path=file_path, phase="hard-fail")
+    hard_fail_failed_checks = {record.check_id for record in ckv_whorf.scan_reports[0].failed_checks}
+    ckv_whorf.scan_object(obj=obj, file_path=file_path, phase="remaining")
+    remaining_failed_checks = {record.check_id for record in ckv_whorf.scan_reports[0].failed_checks}
+
+    # then
+    # the first scan after a config change runs the complete Checkov setup
+    assert first_complete is True
+    assert hard_fail_complete is False
+
+    assert hard_fail_failed_checks == {"CKV_K8S_16", "CKV_K8S_20"}
+    assert remaining_failed_checks == all_failed_checks - hard_fail_failed_checks
+
+
+def test_scan_object_in_phases_with_severity(ckv_whorf: CheckovWhorf, tmp_path: Path) -> None:
+    # given
+    checkov_conf_path = app.checkov_whorf.CHECKOV_CONFIG_PATH
+    checkov_conf_path.write_text("framework: kubernetes\nhard-fail-on:\n- CKV_K8S_16\n- HIGH")
+    os.utime(checkov_conf_path, ns=(0, ckv_whorf.config_mtime + 1))
+    ckv_whorf.update_config()
+
+    obj = {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {"name": "pod"},
+        "spec": {"containers": [{"name": "nginx", "image": "nginx", "securityContext": {"privileged": True}}]},
+    }
+    file_path = str(tmp_path / "pod.yaml")
+    ckv_whorf.scan_object(obj=obj, file_path=file_path, phase="all")
+    all_failed_checks = {record.check_id for record in ckv_whorf.scan_reports[0].failed_checks}
+
+    # when
+    complete = ckv_whorf.scan_object(obj=obj, file_path=file_path, phase="hard-fail")
+
+    # then
+    # severities are only resolved by Checkov, therefore all checks are run
+    assert ckv_whorf.two_phase_supported is False
+    assert complete is True
+    assert {record.check_id for record in ckv_whorf.scan_reports[0].failed_checks} == all_failed_checks
+
+
+def test_scan_objects_builds_graph_only_for_graph_check_kinds(
+    ckv_whorf: CheckovWhorf, mocker: MockerFixture, tmp_path: Path
+) -> None:
+    # given
+    role = {
+        "apiVersion": "rbac.authorization.k8s.io/v1",
+        "kind": "ClusterRole",
+        "metadata": {"name": "secret-reader"},
+        "rules": [{"apiGroups": [""], "resources": ["secrets"], "verbs": ["get", "list"]}],
+    }
+    role_binding = {
+        "apiVersion": "rbac.authorization.k8s.io/v1",
+        "kind": "ClusterRoleBinding",
+        "metadata": {"name": "secret-reader"},
+        "roleRef": {"apiGroup": "rbac.authorization.k8s.io", "kind": "ClusterRole", "name": "secret-reader"},
+        "subjects": [{"kind": "ServiceAccount", "name": "app", "namespace": "default"}],
+    }
+    service = {"apiVersion": "v1", "kind": "Service", "metadata": {"name": "app"}, "spec": {"ports": [{"port": 80}]}}
+    rbac_objects = {str(tmp_path / "role.yaml"): role, str(tmp_path / "role-binding.yaml"): role_binding}
+
+    # the first scan runs the complete Checkov setup
+    ckv_whorf.scan_objects(objects=rbac_objects)
+    build_graph_spy = mocker.spy(ckv_whorf.kubernetes_runner.graph_manager, "build_graph_from_definitions")
+
+    # when
+    ckv_whorf.scan_objects(objects={str(tmp_path / "service.yaml"): service})
+    service_check_ids = {record.check_id for record in ckv_whorf.scan_reports[0].failed_checks}
+    service_build_count = build_graph_spy.call_count
+    ckv_whorf.scan_objects(objects=rbac_objects)
+    rbac_check_ids = {record.check_id for record in ckv_whorf.scan_reports[0].failed_checks}
+
+    # then
+    # the graph check results of the previous scan must not leak into the scan without graph
+    assert service_build_count == 0
+    assert not any(check_id.startswith("CKV2_") for check_id in service_check_ids)
+    assert build_graph_spy.call_count == 1
+    assert "CKV2_K8S_5" in rbac_check_ids
+
+
+def test_upload_reports_sets_up_platform_integration(
+    ckv_whorf: CheckovWhorf, mocker: MockerFixture, tmp_path: Path
+) -> None:
+    # given
+    bc_integration = mocker.patch.object(app.checkov_whorf, "bc_integration")
+    bc_integration.s3_setup_failed = True  # failed previous upload
+    bc_integration.setup_bridgecrew_credentials.side_effect = lambda **_: setattr(
+        bc_integration, "use_s3_integration", True
+    )
+    upload_mock = mocker.patch.object(ckv_whorf, "upload_results_periodically")
+    ckv_whorf.config.bc_api_key = "xyz"
+    ckv_whorf.config.repo_id = "k8s/cluster"
+    files = [str(tmp_path / "pod.yaml")]
+
+    # when
+    uploaded = ckv_whorf.upload_reports(root_folder=str(tmp_path), files=files, scan_reports=[])
+
+    # then
+    assert uploaded is True
+    assert bc_integration.setup_bridgecrew_credentials.call_args.kwargs["repo_id"] == "k8s/cluster"
+    upload_mock.assert_called_once_with(root_folder=str(tmp_path), files=files)
+
+    # when
+    bc_integration.setup_bridgecrew_credentials.side_effect = None
+    uploaded = ckv_whorf.upload_reports(root_folder=str(tmp_path), files=files, scan_reports=[])
+
+    # then
+    assert uploaded is False
+    upload_mock.assert_called_once()
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from app.cli import main
+
+
+@pytest.fixture()
+def checkov_conf_path(tmp_path: Path) -> Path:
+    checkov_conf_path = tmp_path / ".checkov.yaml"
+    checkov_conf_path.write_text("framework: kubernetes")
+    return checkov_conf_path
+
+
+def test_main_with_list(checkov_conf_path: Path, tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    # given
+    deployment = json.loads((Path(__file__).parent / "request.json").read_text())["request"]["object"]
+    config_map = {"apiVersion": "v1", "kind": "ConfigMap", "metadata": {"name": "config", "namespace": "app"}}
+    objects_path = tmp_path / "objects.json"
+    objects_path.write_text(json.dumps({"apiVersion": "v1", "kind": "List", "items": [deployment, config_map]}))
+
+    # when
+    exit_code = main([str(objects_path), "--checkov-config", str(checkov_conf_path)])
+
+    # then
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(result["kind"], result["name"], result["allowed"]) for result in results] == [
+        ("Deployment", "nginx", False),
+        ("ConfigMap", "config", True),
+    ]
+    assert results[1]["message"] == "Checkov found 0 total issues in this manifest."
+    assert exit_code == 1
+
+
+def test_main_exit_code_with_allowed_objects(
+    checkov_conf_path: Path, tmp_path: Path, capsys: pytest.CaptureFixture
+) -> None:
+    # given
+    config_maps = [
+        {"apiVersion": "v1", "kind": "ConfigMap", "metadata": {"name": name, "namespace": "app"}}
+        for name in ("first", "second")
+    ]
+    manifests_path = tmp_path / "manifests.yaml"
+    manifests_path.write_text(yaml.dump_all(config_maps))
+
+    # when
+    exit_code = main([str(manifests_path), "--checkov-config", str(checkov_conf_path)])
+
+    # then
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(result["name"], result["allowed"]) for result in results] == [("first", True), ("second", True)]
+    assert exit_code == 0
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+import yaml
+from checkov.common.output.record import Record
+from checkov.common.output.report import Report
+from pytest_mock import MockerFixture
+
+import app.checkov_whorf
+from app.checkov_whorf import CheckovWhorf
+from app.consts import DEFAULT_CHECKOV_ARGS
+from app.fast_path import HardFailEvaluator, compare_fast_path_result
+from app.models import FastPathResult, PolicyIndex
+
+HARD_FAIL_ON = [
+    "CKV_K8S_1",
+    "CKV_K8S_2",
+    "CKV_K8S_3",
+    "CKV_K8S_4",
+    "CKV_K8S_5",
+    "CKV_K8S_6",
+    "CKV_K8S_7",
+    "CKV_K8S_16",
+    "CKV_K8S_17",
+    "CKV_K8S_18",
+    "CKV_K8S_19",
+    "CKV_K8S_20",
+    "CKV_K8S_21",
+    "CKV_K8S_23",
+    "CKV_K8S_27",
+    "CKV_K8S_39",
+    "CKV_K8S_49",
+]
+
+
+def test_hard_fail_evaluator_matches_checkov(mocker: MockerFixture, tmp_path: Path) -> None:
+    # given
+    checkov_conf_path = tmp_path / ".checkov.yaml"
+    checkov_conf_path.write_text(yaml.dump({"framework": "kubernetes", "hard-fail-on": HARD_FAIL_ON}))
+    mocker.patch.object(app.checkov_whorf, "CHECKOV_CONFIG_PATH", checkov_conf_path)
+
+    ckv_whorf = CheckovWhorf(logger=logging.getLogger(), argv=DEFAULT_CHECKOV_ARGS)
+    ckv_whorf.update_config()
+
+    deployment = yaml.safe_load(Path("tests/nginx.yaml").read_text())
+    pod = {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {"name": "pod", "namespace": "default", "annotations": {"checkov.io/skip1": "CKV_K8S_20=test"}},
+        "spec": {"containers": [{"name": "nginx", "image": "nginx", "securityContext": {"privileged": True}}]},
+    }
+
+    for obj in (deployment, pod):
+        ckv_whorf.scan_object(obj=obj, file_path=str(tmp_path / "obj.yaml"), phase="hard-fail")
+
+        # when
+        fast_path_result = ckv_whorf.hard_fail_evaluator.evaluate(obj)
+
+        # then
+        assert ckv_whorf.hard_fail_evaluator.complete is True
+        assert "CKV_K8S_16" in fast_path_result.hard_fails
+        assert compare_fast_path_result(
+            fast_path_result=fast_path_result,
+            scan_reports=ckv_whorf.scan_reports,
+            policy_index=ckv_whorf.policy_index,
+            obj_kind_name=obj["kind"],
+        )
+
+    assert "CKV_K8S_20" not in fast_path_result.hard_fails
+
+
+def test_hard_fail_evaluator_config() -> None:
+    # when/then
+    # graph checks and severities can only be evaluated by Checkov
+    assert HardFailEvaluator(hard_fail_on=["CKV_K8S_16", "CKV2_K8S_6"]).complete is False
+    assert HardFailEvaluator(hard_fail_on=["HIGH"]).complete is False
+    assert HardFailEvaluator().complete is False
+
+    evaluator = HardFailEvaluator(hard_fail_on=["CKV_K8S_16", "CKV_K8S_20"], skip_checks=["CKV_K8S_20"])
+    assert evaluator.complete is True
+    assert {check.id for check in evaluator.checks_by_kind["Pod"]} == {"CKV_K8S_16"}
+
+
+def test_compare_fast_path_result_divergence(k8s_record: Record) -> None:
+    # given
+    report = Report("kubernetes")
+    report.add_record(k8s_record)
+    policy_index = PolicyIndex(hard_fail_ids=frozenset(("CKV_K8S_16", "CKV_K8S_20")))
+
+    # when/then
+    assert compare_fast_path_result(
+        fast_path_result=FastPathResult(hard_fails={"CKV_K8S_16": ""}),
+        scan_reports=[report],
+        policy_index=policy_index,
+        obj_kind_name="Pod/nginx",
+    )
+    assert not compare_fast_path_result(
+        fast_path_result=FastPathResult(hard_fails={"CKV_K8S_20": ""}),
+        scan_reports=[report],
+        policy_index=policy_index,
+        obj_kind_name="Pod/nginx",
+    )
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from pathlib import Path
+
+from checkov.common.images.image_referencer import ImageReferencerMixin
+from pytest_mock import MockerFixture
+
+from app.image_cache import ImageScanCache, get_image_cache_key
+from app.kubernetes_runner import KubernetesObjectRunner
+from app.models import ImageScanResult
+
+
+def test_get_image_cache_key() -> None:
+    # when/then
+    assert get_image_cache_key("nginx:1.25") == "nginx:1.25"
+    assert get_image_cache_key("docker.io/library/nginx@sha256:1403e55ab3") == "sha256:1403e55ab3"
+
+
+def test_image_scan_cache_with_disk_store(tmp_path: Path) -> None:
+    # given
+    result = ImageScanResult(scan_result={"results": [{"id": "sha256:1403e55ab3"}]}, license_statuses=[])
+    image_cache = ImageScanCache(maxsize=1, ttl=60, path=tmp_path)
+    image_cache.set("nginx@sha256:1403e55ab3", result)
+
+    # when/then
+    assert image_cache.get("mirror.local/nginx@sha256:1403e55ab3") == result
+    # a new process only finds the result on disk
+    assert ImageScanCache(maxsize=1, ttl=60, path=tmp_path).get("nginx@sha256:1403e55ab3") == result
+    assert ImageScanCache(maxsize=1, ttl=0, path=tmp_path).get("nginx@sha256:1403e55ab3") is None
+
+    time.sleep(0.01)
+    image_cache.set("redis:7", result)
+    assert len(list(tmp_path.iterdir())) == 1
+    assert ImageScanCache(maxsize=1, ttl=60, path=tmp_path).get("nginx@sha256:1403e55ab3") is None
+
+
+def test_image_scan_cache_evicts_invalid_entry(tmp_path: Path) -> None:
+    # given
+    result = ImageScanResult(scan_result={"results": [{"id": "sha256:1403e55ab3"}]}, license_statuses=[])
+    ImageScanCache(maxsize=1, ttl=60, path=tmp_path).set("nginx@sha256:1403e55ab3", result)
+    (cache_file_path,) = tmp_path.iterdir()
+    cache_file_path.write_text('{"scan_result": {}}')
+
+    # when/then
+    assert ImageScanCache(maxsize=1, ttl=60, path=tmp_path).get("nginx@sha256:1403e55ab3") is None
+    assert cache_file_path.exists() is False
+
+
+def test_fetch_image_results_with_image_cache(mocker: MockerFixture) -> None:
+    # given
+    scan_result = {"results": [{"id": "sha256:1403e55ab3", "packages": []}]}
+    license_statuses = [{"package_name": "tiff", "package_version": "4.2.0", "policy": "BC_LIC_1", "license": "MIT"}]
+    fetch_image_results_mock = mocker.patch.object(
+        ImageReferencerMixin, "_fetch_image_results_async", side_effect=lambda names: [scan_result] * len(names)
+    )
+    fetch_licenses_mock = mocker.patch.object(
+        ImageReferencerMixin,
+        "_fetch_licenses_per_image",
+        side_effect=lambda names, _: dict.fromkeys(names, license_statuses),
+    )
+    image_cache = ImageScanCache(maxsize=10, ttl=60)
+    image_cache_get_spy = mocker.spy(image_cache, "get")
+    runner = KubernetesObjectRunner(image_cache=image_cache)
+
+    # when
+    for _ in range(2):
+        results = asyncio.run(runner._fetch_image_results_async(["nginx:1.25", "redis:7"]))
+        licenses = asyncio.run(runner._fetch_licenses_per_image(["nginx:1.25", "redis:7"], results))
+
+    # then
+    assert results == [scan_result, scan_result]
+    assert licenses == {"nginx:1.25": license_statuses, "redis:7": license_statuses}
+    assert fetch_image_results_mock.call_count == 2
+    assert fetch_image_results_mock.call_args.args == ([],)
+    assert fetch_licenses_mock.call_args.args == ([], [])
+    # every image is looked up only once per run
+    assert image_cache_get_spy.call_count == 4
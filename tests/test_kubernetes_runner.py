@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import copy
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+from checkov.common.output.report import Report
+from checkov.kubernetes.runner import Runner as KubernetesRunner
+from checkov.runner_filter import RunnerFilter
+
+from app.kubernetes_runner import KubernetesObjectRunner
+
+CORPUS_PATH = Path(__file__).parent.parent / "benchmarks/corpus"
+
+
+def get_results(report: Report) -> set[tuple[str, str, str, str]]:
+    return {
+        (
+            record.check_id,
+            str(record.check_result["result"]),
+            record.resource,
+            json.dumps(record.check_result.get("evaluated_keys")),
+        )
+        for record in [*report.passed_checks, *report.failed_checks, *report.skipped_checks]
+    }
+
+
+def to_pod(obj: dict[str, Any]) -> dict[str, Any]:
+    """Creates a Pod of the pod template of a workload object like its controller would do"""
+
+    template = copy.deepcopy(obj["spec"]["template"])
+    metadata = template.get("metadata") or {}
+    metadata["labels"] = {**(metadata.get("labels") or {}), "pod-template-hash": "7c5ddbdf54"}
+    metadata["name"] = f'{obj["metadata"]["name"]}-7c5ddbdf54-x9k2p'
+    metadata["namespace"] = obj["metadata"].get("namespace", "default")
+    return {"apiVersion": "v1", "kind": "Pod", "metadata": metadata, "spec": template["spec"]}
+
+
+@pytest.mark.parametrize(
+    "runner_filter_kwargs",
+    [{}, {"checks": ["CKV_K8S_8", "CKV_K8S_16", "CKV_K8S_20"]}, {"skip_checks": ["CKV_K8S_8", "CKV_K8S_16"]}],
+    ids=["all", "checks", "skip_checks"],
+)
+@pytest.mark.parametrize("corpus_file", sorted(path.name for path in CORPUS_PATH.glob("*.json")))
+def test_scan_entity_matches_checkov_runner(
+    corpus_file: str, runner_filter_kwargs: dict[str, Any], tmp_path: Path
+) -> None:
+    # given
+    obj = json.loads((CORPUS_PATH / corpus_file).read_text())["request"]["object"]
+    objects = [obj, to_pod(obj)] if "template" in (obj.get("spec") or {}) else [obj]
+    object_runner = KubernetesObjectRunner()
+
+    for index, scanned_obj in enumerate(objects):
+        file_path = tmp_path / f"obj-{index}.json"
+        file_path.write_text(json.dumps(scanned_obj))
+
+        # the second run reuses the container check results of the pod template of the first one
+        for _ in range(2):
+            # when
+            runner_filter = RunnerFilter(framework=["kubernetes"], run_image_referencer=False, **runner_filter_kwargs)
+            expected_report = KubernetesRunner().run(
+                root_folder=None, files=[str(file_path)], runner_filter=runner_filter
+            )
+
+            object_runner.load_objects(objects={str(file_path): scanned_obj}, runner_filter=runner_filter)
+            report = object_runner.run(root_folder=None, files=[str(file_path)], runner_filter=runner_filter)
+            object_runner.set_external_data(definitions=None, context=None, breadcrumbs=None)
+
+            # then
+            assert isinstance(expected_report, Report)
+            assert isinstance(report, Report)
+            assert get_results(report) == get_results(expected_report)
+
+    assert object_runner.template_results.hits > 0 or len(objects) == 1
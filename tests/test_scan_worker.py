@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import multiprocessing
+import pickle
+from pathlib import Path
+
+from checkov.common.bridgecrew.check_type import CheckType
+from pytest_mock import MockerFixture
+
+import app.checkov_whorf
+from app import scan_worker
+
+
+def test_scan_object(mocker: MockerFixture, tmp_path: Path) -> None:
+    # given
+    checkov_conf_path = tmp_path / ".checkov.yaml"
+    checkov_conf_path.write_text("framework: kubernetes")
+    mocker.patch.object(app.checkov_whorf, "CHECKOV_CONFIG_PATH", checkov_conf_path)
+    mocker.patch.object(scan_worker, "ckv_whorf", None)
+
+    obj = {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {"name": "pod"},
+        "spec": {"containers": [{"name": "nginx", "image": "nginx", "securityContext": {"privileged": True}}]},
+    }
+
+    scan_worker.init_worker()
+
+    # when
+    complete, scan_reports = scan_worker.scan_object(obj=obj, file_path=str(tmp_path / "pod.yaml"), phase="all")
+
+    # then
+    assert complete is True
+    # the reports are sent back to the web server process
+    scan_reports = pickle.loads(pickle.dumps(scan_reports))  # noqa: S301
+    assert scan_reports[0].check_type == CheckType.KUBERNETES
+    assert "CKV_K8S_16" in {record.check_id for record in scan_reports[0].failed_checks}
+
+
+def test_track_scan(mocker: MockerFixture) -> None:
+    # given
+    scan_start_times = multiprocessing.get_context("spawn").Array("d", 2)
+    mocker.patch.object(scan_worker, "scan_start_times", scan_start_times)
+    mocker.patch.object(scan_worker, "scan_slot", 1)
+    mocker.patch("app.scan_worker.time.monotonic", return_value=100.0)
+
+    # when
+    with scan_worker.track_scan():
+        running_start_times = scan_start_times[:]
+
+    # then
+    assert running_start_times == [0.0, 100.0]
+    assert scan_start_times[:] == [0.0, 0.0]
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+
+from app.spool import ManifestSpool
+
+
+def test_spool_evicts_oldest_files(tmp_path: Path) -> None:
+    # given
+    spool = ManifestSpool(root_path=tmp_path, max_bytes=10, max_files=2, max_age_in_sec=60)
+    file_paths = [tmp_path / f"{idx}-req.yaml" for idx in range(4)]
+
+    # when/then
+    spool.write(file_path=file_paths[0], data="1234")
+    spool.write(file_path=file_paths[1], data="1234")
+    spool.write(file_path=file_paths[2], data="1234")
+    assert [file_path.exists() for file_path in file_paths[:3]] == [False, True, True]
+    assert (spool.file_count, spool.bytes) == (2, 8)
+
+    spool.write(file_path=file_paths[3], data="123456789")
+    assert [file_path in spool for file_path in file_paths] == [False, False, False, True]
+    assert (spool.file_count, spool.bytes, spool.evictions) == (1, 9, 3)
+
+    spool.remove(file_paths[3])
+    assert file_paths[3].exists() is False
+    assert (spool.file_count, spool.bytes) == (0, 0)
+
+
+def test_spool_compacts_duplicates(tmp_path: Path) -> None:
+    # given
+    spool = ManifestSpool(root_path=tmp_path, max_bytes=100, max_files=10, max_age_in_sec=60)
+
+    # when
+    spool.write(file_path=tmp_path / "0-req.yaml", data="nginx", content_hash="nginx")
+    spool.write(file_path=tmp_path / "1-req.yaml", data="redis", content_hash="redis")
+    spool.write(file_path=tmp_path / "2-req.yaml", data="nginx", content_hash="nginx")
+
+    # then
+    assert sorted(file_path.name for file_path in tmp_path.iterdir()) == ["1-req.yaml", "2-req.yaml"]
+    assert (spool.file_count, spool.bytes) == (2, 10)
+
+
+def test_spool_sweeps_expired_files(tmp_path: Path) -> None:
+    # given
+    spool = ManifestSpool(root_path=tmp_path, max_bytes=100, max_files=10, max_age_in_sec=0.1)
+    spool.write(file_path=tmp_path / "0-req.yaml", data="nginx")
+
+    orphan_file_path = tmp_path / "audit-1234.yaml"
+    orphan_file_path.write_text("redis")
+    expired_at = time.time() - 60
+    os.utime(orphan_file_path, (expired_at, expired_at))
+    other_file_path = tmp_path / "whorf-traces.jsonl"
+    other_file_path.write_text("{}")
+    os.utime(other_file_path, (expired_at, expired_at))
+
+    # when
+    time.sleep(0.2)
+    spool.sweep()
+
+    # then
+    assert [file_path.name for file_path in tmp_path.iterdir()] == ["whorf-traces.jsonl"]
+    assert spool.file_count == 0
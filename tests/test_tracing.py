@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from app.tracing import JsonFileSpanExporter, Tracer
+
+
+def test_start_span_exports_trace(tmp_path: Path) -> None:
+    # given
+    traces_file_path = tmp_path / "traces.jsonl"
+    tracer = Tracer()
+    tracer.configure(exporter=JsonFileSpanExporter(file_path=traces_file_path), sample_ratio=1.0)
+
+    # when
+    with tracer.start_span("admission", uid="13b390aa", namespace=None) as span:
+        span.set_attribute("kind", "Deployment")
+        with pytest.raises(ValueError), tracer.start_span("scan"):
+            raise ValueError("wedged")
+    tracer.flush()
+
+    # then
+    traces = json.loads(traces_file_path.read_text())
+    scan_span, admission_span = traces["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+    assert admission_span["name"] == "admission"
+    assert admission_span["attributes"] == [
+        {"key": "uid", "value": {"stringValue": "13b390aa"}},
+        {"key": "kind", "value": {"stringValue": "Deployment"}},
+    ]
+    assert "parentSpanId" not in admission_span
+
+    assert scan_span["name"] == "scan"
+    assert scan_span["traceId"] == admission_span["traceId"]
+    assert scan_span["parentSpanId"] == admission_span["spanId"]
+    assert scan_span["status"] == {"code": 2, "message": "ValueError: wedged"}
+    assert tracer.get_current_context() is None
+
+
+def test_start_span_without_sampling(tmp_path: Path) -> None:
+    # given
+    traces_file_path = tmp_path / "traces.jsonl"
+    tracer = Tracer()
+    tracer.configure(exporter=JsonFileSpanExporter(file_path=traces_file_path), sample_ratio=0.0)
+
+    # when
+    with tracer.start_span("admission") as span, tracer.start_span("scan") as child_span:
+        span.set_attribute("kind", "Deployment")
+    tracer.flush()
+
+    # then
+    assert span.context.sampled is False
+    assert child_span.context.sampled is False
+    assert span.attributes == {}
+    assert traces_file_path.exists() is False
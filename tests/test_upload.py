@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from checkov.common.bridgecrew.check_type import CheckType
+from checkov.common.output.record import Record
+from checkov.common.output.report import Report
+
+from app.models import UploadItem
+from app.upload import UploadQueue, deduplicate_upload_items, merge_scan_reports
+
+
+def test_upload_queue_drops_items_when_full() -> None:
+    # given
+    upload_queue = UploadQueue(maxsize=3, batch_size=2)
+    upload_items = [UploadItem(file_path=Path(f"{idx}-req.yaml"), scan_reports=[]) for idx in range(4)]
+
+    # when
+    accepted = [upload_queue.put(upload_item) for upload_item in upload_items]
+
+    # then
+    assert accepted == [True, True, True, False]
+    assert upload_queue.under_pressure is True
+    assert (upload_queue.enqueued, upload_queue.dropped) == (3, 1)
+
+    assert upload_queue.get_batch() == upload_items[:2]
+    assert upload_queue.get_batch(max_size=0) == []
+    assert upload_queue.get_batch() == upload_items[2:3]
+    assert upload_queue.get_batch() == []
+
+
+def test_deduplicate_upload_items() -> None:
+    # given
+    upload_items = [
+        UploadItem(file_path=Path("0-req.yaml"), scan_reports=[], content_hash="nginx"),
+        UploadItem(file_path=Path("1-req.yaml"), scan_reports=[], content_hash="redis"),
+        UploadItem(file_path=Path("2-req.yaml"), scan_reports=[], content_hash="nginx"),
+        UploadItem(file_path=Path("3-req.yaml"), scan_reports=[]),
+        UploadItem(file_path=Path("4-req.yaml"), scan_reports=[]),
+    ]
+
+    # when
+    unique_upload_items = deduplicate_upload_items(upload_items)
+
+    # then
+    assert unique_upload_items == [upload_items[1], upload_items[2], upload_items[3], upload_items[4]]
+
+
+def test_merge_scan_reports(k8s_record: Record, license_record: Record) -> None:
+    # given
+    k8s_report = Report(check_type=CheckType.KUBERNETES)
+    k8s_report.add_record(k8s_record)
+    k8s_report.add_resource("Deployment.nginx.nginx")
+    other_k8s_report = Report(check_type=CheckType.KUBERNETES)
+    other_k8s_report.add_record(k8s_record)
+    other_k8s_report.add_resource("Deployment.nginx.other")
+    sca_report = Report(check_type=CheckType.SCA_IMAGE)
+    sca_report.add_record(license_record)
+
+    # when
+    merged_reports = merge_scan_reports([[k8s_report, sca_report], [other_k8s_report]])
+
+    # then
+    assert [report.check_type for report in merged_reports] == [CheckType.KUBERNETES, CheckType.SCA_IMAGE]
+    assert len(merged_reports[0].failed_checks) == 2
+    assert merged_reports[0].resources == {"Deployment.nginx.nginx", "Deployment.nginx.other"}
+    assert len(merged_reports[1].failed_checks) == 1
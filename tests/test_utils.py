@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+import app.utils
+from app.utils import get_whorf_config
+
+
+def test_get_whorf_config_choices(mocker: MockerFixture, tmp_path: Path) -> None:
+    # given
+    whorf_conf_path = tmp_path / "whorf.yaml"
+    whorf_conf_path.write_text(
+        "scan-mode: two-phase\nscan-deadline-mode: fail-open\ntracing-exporter: collector\nfast-path-mode: off"
+    )
+    mocker.patch.object(app.utils, "WHORF_CONFIG_PATH", whorf_conf_path)
+
+    # when
+    whorf_conf = get_whorf_config()
+
+    # then
+    assert whorf_conf.two_phase_scan is True
+    assert whorf_conf.scan_deadline_fail_open is True
+    assert whorf_conf.tracing_exporter == "collector"
+    assert whorf_conf.fast_path_mode == "off"
+
+
+def test_get_whorf_config_with_unknown_choices(
+    mocker: MockerFixture, tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    # given
+    whorf_conf_path = tmp_path / "whorf.yaml"
+    whorf_conf_path.write_text(
+        "scan-mode: two_phase\nscan-deadline-mode: open\ntracing-exporter: otlp\n"
+        "audit-source: kubernetes\nfast-path-mode: on"
+    )
+    mocker.patch.object(app.utils, "WHORF_CONFIG_PATH", whorf_conf_path)
+
+    # when
+    whorf_conf = get_whorf_config()
+
+    # then
+    # YAML parses an unquoted 'on' as true, which must not enable any mode
+    assert whorf_conf.fast_path_mode == "off"
+    assert whorf_conf.two_phase_scan is False
+    assert whorf_conf.scan_deadline_fail_open is False
+    assert whorf_conf.tracing_exporter == "none"
+    assert whorf_conf.audit_source == "none"
+    assert "Unknown value True of 'fast-path-mode' in the whorf config" in caplog.text
+    assert "Unknown value 'otlp' of 'tracing-exporter' in the whorf config" in caplog.text
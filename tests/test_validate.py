@@ -1,101 +1,108 @@
 from __future__ import annotations
 
-import logging
+import copy
+import json
+from pathlib import Path
 
 from checkov.common.bridgecrew.check_type import CheckType
 from checkov.common.output.report import Report
 
-from app.checkov_whorf import CheckovWhorf
-from app.consts import DEFAULT_CHECKOV_ARGS
+from app.models import PolicyIndex, Verdict
+from app.namespaces import NamespaceMatcher
+from app.utils import peek_admission_request
 from app.validate import (
     generate_sca_output,
-    process_failed_checks,
-    process_passed_checks,
+    get_verdict,
+    summarize_reports,
     validate_k8s_request,
 )
 
 
-def test_process_passed_checks(webhook) -> None:
+def test_get_verdict_with_passed_checks(webhook) -> None:
     #  given
-    ckv_whorf = CheckovWhorf(logger=logging.getLogger(), argv=DEFAULT_CHECKOV_ARGS)
-
     report = Report(check_type=CheckType.KUBERNETES)
-    ckv_whorf.scan_reports = [report]
 
     # when
     with webhook.app_context():
-        response = process_passed_checks(
-            ckv_whorf=ckv_whorf, uid="13b390aa-ea59-48ef-9fb8-069bf0430dce", obj_kind_name="Deployment/nginx"
-        )
+        verdict = get_verdict(scan_reports=[report], policy_index=PolicyIndex(), obj_kind_name="Deployment/nginx")
 
     # then
-    assert response.json == {
-        "apiVersion": "admission.k8s.io/v1",
-        "kind": "AdmissionReview",
-        "response": {
-            "allowed": True,
-            "status": {"code": 200, "message": "Checkov found 0 total issues in this manifest."},
-            "uid": "13b390aa-ea59-48ef-9fb8-069bf0430dce",
-        },
-    }
+    assert verdict == Verdict(allowed=True, message="Checkov found 0 total issues in this manifest.")
 
 
-def test_process_failed_checks(webhook, k8s_record, license_record, package_record) -> None:
+def test_get_verdict_with_failed_checks(webhook, k8s_record, license_record, package_record) -> None:
     #  given
-    ckv_whorf = CheckovWhorf(logger=logging.getLogger(), argv=DEFAULT_CHECKOV_ARGS)
-
     k8s_report = Report(check_type=CheckType.KUBERNETES)
     k8s_report.add_record(k8s_record)
     sca_report = Report(check_type=CheckType.SCA_IMAGE)
     sca_report.add_record(license_record)
     sca_report.add_record(package_record)
 
-    ckv_whorf.scan_reports = [k8s_report, sca_report]
-
     # when
     with webhook.app_context():
-        response = process_failed_checks(
-            ckv_whorf=ckv_whorf, uid="13b390aa-ea59-48ef-9fb8-069bf0430dce", obj_kind_name="Deployment/nginx"
+        verdict = get_verdict(
+            scan_reports=[k8s_report, sca_report], policy_index=PolicyIndex(), obj_kind_name="Deployment/nginx"
         )
 
     # then
-    assert response.json == {
-        "apiVersion": "admission.k8s.io/v1",
-        "kind": "AdmissionReview",
-        "response": {
-            "allowed": False,
-            "status": {
-                "code": 403,
-                "message": "\n".join(
-                    [
-                        "Checkov found 1 total issues in this manifest.",
-                        "Checkov found 1 CVEs in container images of which are 1 critical, 0 high, 0 medium and 0 low.",
-                        "Checkov found 1 license violations in container images.",
-                    ]
-                ),
-            },
-            "uid": "13b390aa-ea59-48ef-9fb8-069bf0430dce",
-        },
-    }
+    assert verdict == Verdict(
+        allowed=False,
+        message="\n".join(
+            [
+                "Checkov found 1 total issues in this manifest.",
+                "Checkov found 1 CVEs in container images of which are 1 critical, 0 high, 0 medium and 0 low.",
+                "Checkov found 1 license violations in container images.",
+                "Image nginx: 1 CVEs (1 critical, 0 high, 0 medium, 0 low) and 1 license violations.",
+            ]
+        ),
+    )
 
 
 def test_generate_sca_output(webhook, license_record, package_record) -> None:
     #  given
+    sidecar_package_record = copy.deepcopy(package_record)
+    sidecar_package_record.file_path = (
+        "/13b390aa-ea59-48ef-9fb8-069bf0430dce-req.yaml (envoy:1.29 lines:1-98 (sha256:2a7a1b7c5a))"
+    )
     report = Report(check_type=CheckType.SCA_IMAGE)
     report.add_record(license_record)
     report.add_record(package_record)
+    report.add_record(sidecar_package_record)
 
     # when
     with webhook.app_context():
-        message = generate_sca_output(reports=[report])
+        message = generate_sca_output(summary=summarize_reports(reports=[report], policy_index=PolicyIndex()))
 
     # then
     assert message == [
-        "Checkov found 1 CVEs in container images of which are 1 critical, 0 high, 0 medium and 0 low.",
+        "Checkov found 2 CVEs in container images of which are 2 critical, 0 high, 0 medium and 0 low.",
         "Checkov found 1 license violations in container images.",
+        "Image envoy:1.29: 1 CVEs (1 critical, 0 high, 0 medium, 0 low) and 0 license violations.",
+        "Image nginx: 1 CVEs (1 critical, 0 high, 0 medium, 0 low) and 1 license violations.",
     ]
 
 
+def test_summarize_reports(webhook, k8s_record, license_record, package_record) -> None:
+    #  given
+    k8s_report = Report(check_type=CheckType.KUBERNETES)
+    k8s_report.add_record(k8s_record)
+    sca_report = Report(check_type=CheckType.SCA_IMAGE)
+    sca_report.add_record(license_record)
+    sca_report.add_record(package_record)
+    policy_index = PolicyIndex(hard_fail_ids=frozenset(("BC_K8S_15", "CKV_K8S_20")))
+
+    # when
+    with webhook.app_context():
+        summary = summarize_reports(reports=[k8s_report, sca_report], policy_index=policy_index)
+
+    # then
+    assert summary.k8s_issue_count == 1
+    assert list(summary.hard_fails) == ["CKV_K8S_16"]
+    assert summary.sca_image_scanned is True
+    assert (summary.cve_count, summary.license_count) == (1, 1)
+    assert summary.cve_severities == {"CRITICAL": 1, "HIGH": 0, "MEDIUM": 0, "LOW": 0}
+
+
 def test_validate_k8s_request(webhook) -> None:
     # given
     namespace = "my-namespace"
@@ -149,3 +156,34 @@ def test_validate_k8s_request_with_ignore_namespace(webhook) -> None:
             "uid": "13b390aa-ea59-48ef-9fb8-069bf0430dce",
         },
     }
+
+
+def test_namespace_matcher() -> None:
+    # given
+    matcher = NamespaceMatcher(["default", "kube-*", "team-?-system"])
+
+    # when/then
+    assert "default" in matcher
+    assert "kube-system" in matcher
+    assert "team-a-system" in matcher
+    assert "kube" not in matcher
+    assert "my-kube-system" not in matcher
+    assert None not in matcher
+
+
+def test_peek_admission_request() -> None:
+    # given
+    request_info = json.loads((Path(__file__).parent / "request.json").read_text())
+    # the 'object' of the request can contain the same field names
+    request_with_late_fields = {
+        "request": {"userInfo": {"uid": "user"}, "object": {"metadata": {"namespace": "nginx"}}, "uid": "late"}
+    }
+
+    # when/then
+    assert peek_admission_request(json.dumps(request_info).encode()) == (
+        "13b390aa-ea59-48ef-9fb8-069bf0430dce",
+        "nginx",
+    )
+    assert peek_admission_request(json.dumps(request_with_late_fields).encode()) is None
+    assert peek_admission_request(b'{"request": {"uid": "cluster-scoped", "object": {}}}') == ("cluster-scoped", None)
+    assert peek_admission_request(b"invalid") is None
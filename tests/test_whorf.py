@@ -1,14 +1,18 @@
 from __future__ import annotations
 
 import json
+import os
+import time
 from pathlib import Path
 from typing import TYPE_CHECKING, Any
 
 import pytest
+import yaml
 from pytest_mock import MockerFixture
 
 import app.checkov_whorf
 import app.utils
+from app.models import Verdict
 
 if TYPE_CHECKING:
     from flask.testing import FlaskClient
@@ -24,8 +28,10 @@ def client(mocker: MockerFixture, tmp_path: Path) -> FlaskClient:
     mocker.patch.object(app.checkov_whorf, "CHECKOV_CONFIG_PATH", checkov_conf_path)
     mocker.patch.object(app.utils, "WHORF_CONFIG_PATH", whorf_conf_path)
 
-    from app.whorf import webhook
+    from app.whorf import reload_config, webhook
 
+    # apply the config files of this test, which also clears the verdict cache
+    reload_config()
     return webhook.test_client()
 
 
@@ -48,3 +54,544 @@ def test_validate(client: FlaskClient, request_info) -> None:
             "status": {"code": 403, "message": "Checkov found 16 total issues in this manifest."},
         },
     }
+
+
+def test_validate_persists_manifest_after_response(
+    client: FlaskClient, request_info, mocker: MockerFixture, tmp_path: Path
+) -> None:
+    # given
+    mocker.patch("app.whorf.MANIFEST_ROOT_PATH", tmp_path)
+    manifest_file_path = tmp_path / "13b390aa-ea59-48ef-9fb8-069bf0430dce-req.yaml"
+
+    # when
+    response = client.post("/validate", json=request_info)
+    persisted_before_close = manifest_file_path.exists()
+    response.close()
+
+    # then
+    from app.whorf import upload_queue
+
+    assert persisted_before_close is False
+    assert yaml.safe_load(manifest_file_path.read_text()) == request_info["request"]["object"]
+    assert manifest_file_path in {upload_item.file_path for upload_item in upload_queue.get_batch()}
+
+
+def test_validate_with_cached_verdict(client: FlaskClient, request_info) -> None:
+    # given
+    from app.whorf import verdict_cache
+
+    first_response = client.post("/validate", json=request_info)
+    hits = verdict_cache.hits
+
+    request_info["request"]["uid"] = "2a7a1b7c-5a8b-4c32-9d38-0a1e4f3b2c1d"
+    request_info["request"]["object"]["metadata"]["resourceVersion"] = "4711"
+    request_info["request"]["object"]["spec"]["replicas"] = 3
+
+    # when
+    response = client.post("/validate", json=request_info)
+
+    # then
+    assert verdict_cache.hits == hits + 1
+    assert response.json["response"]["uid"] == "2a7a1b7c-5a8b-4c32-9d38-0a1e4f3b2c1d"
+    assert response.json["response"]["status"] == first_response.json["response"]["status"]
+
+
+def test_upload_periodic(client: FlaskClient, request_info, mocker: MockerFixture, tmp_path: Path) -> None:
+    # given
+    from app.whorf import ckv_whorf, upload_periodic, upload_queue
+
+    upload_reports_mock = mocker.patch.object(ckv_whorf, "upload_reports")
+    mocker.patch("app.whorf.MANIFEST_ROOT_PATH", tmp_path)
+    upload_queue.get_batch()  # remove leftovers of previous tests
+
+    request_info["request"]["object"]["metadata"]["name"] = "nginx-upload"
+    client.post("/validate", json=request_info).close()
+    manifest_file_path = tmp_path / "13b390aa-ea59-48ef-9fb8-069bf0430dce-req.yaml"
+    persisted_before_upload = manifest_file_path.exists()
+    persisted_manifest = manifest_file_path.read_text()
+
+    # when
+    upload_periodic()
+
+    # then
+    assert persisted_before_upload is True
+    assert manifest_file_path.exists() is False
+    assert upload_queue.depth == 0
+
+    upload_reports_mock.assert_called_once()
+    assert upload_reports_mock.call_args.kwargs["files"] == [str(manifest_file_path)]
+    k8s_report = upload_reports_mock.call_args.kwargs["scan_reports"][0]
+    assert len(k8s_report.failed_checks) == 16
+    # the records point to the uploaded file relative to the upload root and match its content
+    assert {record.file_path for record in k8s_report.failed_checks} == {f"/{manifest_file_path.name}"}
+    assert {record.file_line_range[1] for record in k8s_report.failed_checks} == {len(persisted_manifest.splitlines())}
+    assert {record.code_block[0][1] for record in k8s_report.failed_checks} == {persisted_manifest}
+
+
+def test_upload_periodic_requeues_failed_upload(
+    client: FlaskClient, request_info, mocker: MockerFixture, tmp_path: Path
+) -> None:
+    # given
+    from app.whorf import ckv_whorf, upload_periodic, upload_queue
+
+    upload_reports_mock = mocker.patch.object(ckv_whorf, "upload_reports", return_value=False)
+    mocker.patch("app.whorf.MANIFEST_ROOT_PATH", tmp_path)
+    upload_queue.get_batch()  # remove leftovers of previous tests
+
+    request_info["request"]["object"]["metadata"]["name"] = "nginx-upload-failed"
+    client.post("/validate", json=request_info).close()
+    manifest_file_path = tmp_path / "13b390aa-ea59-48ef-9fb8-069bf0430dce-req.yaml"
+
+    # when
+    upload_periodic()
+
+    # then
+    upload_reports_mock.assert_called_once()
+    assert manifest_file_path.exists() is True
+    assert [upload_item.file_path for upload_item in upload_queue.get_batch()] == [manifest_file_path]
+
+
+def test_validate_with_exceeded_scan_deadline(client: FlaskClient, request_info, mocker: MockerFixture) -> None:
+    # given
+    from app.whorf import ckv_whorf, upload_queue, whorf_conf
+
+    mocker.patch.object(whorf_conf, "scan_deadline_in_sec", 0.01)
+    scan_object = ckv_whorf.scan_object
+    mocker.patch.object(ckv_whorf, "scan_object", side_effect=lambda **kwargs: time.sleep(0.5) or scan_object(**kwargs))
+    mocker.patch("app.whorf.persist_manifest")
+    upload_queue.get_batch()  # remove leftovers of previous tests
+
+    request_info["request"]["object"]["metadata"]["name"] = "nginx-deadline"
+
+    # when
+    response = client.post("/validate", json=request_info)
+
+    # then
+    assert response.json["response"]["allowed"] is False
+    assert response.json["response"]["status"]["message"] == (
+        "Checkov scan exceeded the deadline of 0.01s and was truncated. Request rejected!"
+    )
+
+    # the scan still finishes in the background
+    for _ in range(100):
+        if upload_queue.depth:
+            break
+        time.sleep(0.1)
+    assert upload_queue.depth == 1
+
+
+def test_readyz(client: FlaskClient) -> None:
+    # given
+    from app.whorf import health_monitor, warm_up
+
+    health_monitor.ready.clear()
+    not_ready_response = client.get("/readyz")
+
+    # when
+    warm_up()
+    response = client.get("/readyz")
+
+    # then
+    assert not_ready_response.status_code == 503
+    assert response.status_code == 200
+
+
+def test_warm_up_retries(client: FlaskClient, mocker: MockerFixture) -> None:
+    # given
+    from app.whorf import ckv_whorf, health_monitor, warm_up
+
+    health_monitor.ready.clear()
+    sleep_mock = mocker.patch("app.whorf.time.sleep")
+    mocker.patch.object(ckv_whorf, "warm_up", side_effect=[RuntimeError("platform not reachable"), None])
+
+    # when
+    warm_up()
+
+    # then
+    assert health_monitor.ready.is_set()
+    sleep_mock.assert_called_once_with(2)
+    assert client.get("/livez").status_code == 200
+
+
+def test_livez_with_failed_warm_up(client: FlaskClient, mocker: MockerFixture) -> None:
+    # given
+    from app.whorf import ckv_whorf, health_monitor, warm_up
+
+    health_monitor.ready.clear()
+    mocker.patch("app.whorf.time.sleep")
+    mocker.patch.object(ckv_whorf, "warm_up", side_effect=RuntimeError("platform not reachable"))
+
+    # when
+    warm_up()
+    response = client.get("/livez")
+
+    # then
+    health_monitor.warm_up_failed.clear()
+    assert health_monitor.ready.is_set() is False
+    assert response.status_code == 503
+    assert response.text == "Scanner failed to warm up"
+
+
+def test_run_in_scan_process_replaces_broken_pool(mocker: MockerFixture) -> None:
+    # given
+    from concurrent.futures.process import BrokenProcessPool
+
+    import app.whorf
+
+    mocker.patch.object(app.whorf, "scan_process_pool", None)
+    mocker.patch.object(app.whorf, "SCAN_PROCESSES", 1)
+    process_pool_mock = mocker.patch.object(app.whorf, "ProcessPoolExecutor")
+    process_pool_mock.return_value.submit.side_effect = BrokenProcessPool("init_worker failed")
+
+    # when
+    with pytest.raises(BrokenProcessPool):
+        app.whorf.run_in_scan_process(print)
+
+    # then
+    process_pool_mock.return_value.shutdown.assert_called_once()
+    assert app.whorf.scan_process_pool is None
+    app.whorf.get_scan_process_pool()
+    assert process_pool_mock.call_count == 2
+
+
+def test_livez_with_wedged_scan(client: FlaskClient, mocker: MockerFixture) -> None:
+    # given
+    from app.whorf import health_monitor
+
+    monotonic = mocker.patch("app.health.time.monotonic", return_value=100.0)
+
+    # when
+    with health_monitor.track_scan():
+        healthy_response = client.get("/livez")
+        monotonic.return_value = 401.0
+        wedged_response = client.get("/livez")
+
+    # then
+    assert healthy_response.status_code == 200
+    assert wedged_response.status_code == 503
+    assert wedged_response.text == "Scan is running for 301s"
+    assert client.get("/livez").status_code == 200
+
+    # when
+    mocker.patch.object(health_monitor, "scan_process_start_times", [0.0, 50.0])
+
+    # then
+    # scans in the scan processes are tracked by the processes themselves
+    assert client.get("/livez").text == "Scan is running for 351s"
+
+
+def test_get_scan_process_pool_is_created_lazily(mocker: MockerFixture) -> None:
+    # given
+    import app.whorf
+
+    # nothing is created on import, which would happen in the Gunicorn master with preloading
+    assert app.whorf.scan_process_pool is None
+    mocker.patch.object(app.whorf, "scan_process_pool", None)
+    mocker.patch.object(app.whorf, "SCAN_PROCESSES", 2)
+    process_pool_mock = mocker.patch.object(app.whorf, "ProcessPoolExecutor")
+
+    # when
+    first_pool = app.whorf.get_scan_process_pool()
+    second_pool = app.whorf.get_scan_process_pool()
+
+    # then
+    assert first_pool is second_pool is process_pool_mock.return_value
+    process_pool_mock.assert_called_once()
+    assert process_pool_mock.call_args.kwargs["max_workers"] == 2
+
+
+def test_metrics(client: FlaskClient, request_info) -> None:
+    # given
+    request_info["request"]["object"]["metadata"]["name"] = "nginx-metrics"
+    client.post("/validate", json=request_info).close()
+
+    # when
+    response = client.get("/metrics")
+
+    # then
+    metrics = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert 'whorf_admission_decisions_total{decision="denied"}' in metrics
+    assert 'whorf_failed_checks_total{check_id="CKV_K8S_8"}' in metrics
+    assert 'whorf_checkov_run_duration_seconds_count{framework="kubernetes"}' in metrics
+    assert "whorf_admission_duration_seconds_count" in metrics
+
+
+def test_validate_with_tracing(client: FlaskClient, request_info, mocker: MockerFixture, tmp_path: Path) -> None:
+    # given
+    from app.tracing import JsonFileSpanExporter, tracer
+
+    traces_file_path = tmp_path / "traces.jsonl"
+    mocker.patch.object(tracer, "exporter", JsonFileSpanExporter(file_path=traces_file_path))
+    request_info["request"]["object"]["metadata"]["name"] = "nginx-tracing"
+
+    # when
+    client.post("/validate", json=request_info).close()
+    tracer.flush()
+
+    # then
+    traces = json.loads(traces_file_path.read_text())
+    spans = {span["name"]: span for span in traces["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+
+    assert {"admission", "scan", "runner", "check_debug_mode", "response"} <= spans.keys()
+    assert {span["traceId"] for span in spans.values()} == {spans["admission"]["traceId"]}
+    assert spans["scan"]["parentSpanId"] == spans["admission"]["spanId"]
+    assert {"key": "kind", "value": {"stringValue": "Deployment"}} in spans["admission"]["attributes"]
+
+
+def test_validate_batch(client: FlaskClient, request_info) -> None:
+    # given
+    deployment = request_info["request"]["object"]
+    ignored_pod = {"apiVersion": "v1", "kind": "Pod", "metadata": {"name": "pod", "namespace": "default"}}
+    body = "\n".join(json.dumps(obj) for obj in (request_info, ignored_pod, deployment))
+
+    # when
+    response = client.post("/validate/batch", data=body, content_type="application/x-ndjson")
+
+    # then
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    expected_result = {
+        "kind": "Deployment",
+        "namespace": "nginx",
+        "name": "nginx",
+        "allowed": False,
+        "message": "Checkov found 16 total issues in this manifest.",
+    }
+    assert results == [
+        expected_result,
+        {
+            "kind": "Pod",
+            "namespace": "default",
+            "name": "pod",
+            "allowed": True,
+            "message": "Namespace in ignore list. Ignoring validation",
+        },
+        expected_result,
+    ]
+
+
+def test_validate_batch_with_invalid_body(client: FlaskClient) -> None:
+    # when
+    response = client.post("/validate/batch", data="kind: Pod", content_type="application/x-ndjson")
+
+    # then
+    assert response.status_code == 400
+
+
+def test_validate_batch_with_invalid_object(client: FlaskClient, request_info, mocker: MockerFixture) -> None:
+    # given
+    from app.whorf import whorf_conf
+
+    mocker.patch.object(whorf_conf, "batch_chunk_size", 1)
+    body = "\n".join((json.dumps(request_info), "kind: Pod"))
+
+    # when
+    response = client.post("/validate/batch", data=body, content_type="application/x-ndjson")
+
+    # then
+    assert response.status_code == 200
+
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [result.get("name") for result in results] == ["nginx", None]
+    assert results[-1]["error"].startswith("Invalid batch")
+
+
+def test_validate_batch_with_too_many_objects(client: FlaskClient, mocker: MockerFixture) -> None:
+    # given
+    from app.whorf import whorf_conf
+
+    mocker.patch.object(whorf_conf, "batch_max_objects", 2)
+    pod = {"apiVersion": "v1", "kind": "Pod", "metadata": {"name": "pod", "namespace": "default"}}
+    body = "\n".join(json.dumps(pod) for _ in range(3))
+
+    # when
+    response = client.post("/validate/batch", data=body, content_type="application/x-ndjson")
+
+    # then
+    assert response.status_code == 413
+    assert response.text == "Invalid batch: Batch exceeds the limit of 2 objects"
+
+
+def test_validate_batch_is_rate_limited(client: FlaskClient, request_info, mocker: MockerFixture) -> None:
+    # given
+    from app.whorf import batch_rate_limiter, whorf_conf
+
+    mocker.patch.object(whorf_conf, "batch_chunk_size", 1)
+    mocker.patch.object(batch_rate_limiter, "max_objects_per_min", 60)
+    mocker.patch.object(batch_rate_limiter, "_next_scan_time", 0.0)
+    sleep_mock = mocker.patch("app.background.time.sleep")
+    body = "\n".join(json.dumps(request_info) for _ in range(2))
+
+    # when
+    response = client.post("/validate/batch", data=body, content_type="application/x-ndjson")
+
+    # then
+    assert len(response.get_data(as_text=True).splitlines()) == 2
+    # the second chunk waits for the slot of the first one
+    sleep_mock.assert_called_once()
+    assert 0 < sleep_mock.call_args.args[0] <= 1
+
+
+@pytest.mark.usefixtures("client")
+def test_audit_periodic(request_info, mocker: MockerFixture, tmp_path: Path) -> None:
+    # given
+    from app.audit import Auditor, DirectoryAuditSource
+    from app.whorf import audit_periodic, upload_queue
+
+    manifest_path = tmp_path / "manifests"
+    manifest_path.mkdir()
+    (manifest_path / "deployment.yaml").write_text(yaml.dump(request_info["request"]["object"]))
+
+    auditor = Auditor(source=DirectoryAuditSource(path=manifest_path), max_objects_per_min=6000)
+    mocker.patch("app.whorf.auditor", auditor)
+    mocker.patch("app.audit.AUDIT_LOCK_PATH", tmp_path / "audit.lock")
+    mocker.patch("app.whorf.MANIFEST_ROOT_PATH", tmp_path)
+    upload_queue.get_batch()  # remove leftovers of previous tests
+
+    # when
+    audit_periodic()
+    audit_periodic()
+
+    # then
+    upload_items = upload_queue.get_batch()
+    assert len(upload_items) == 1
+    assert upload_items[0].file_path.parent == tmp_path
+    assert yaml.safe_load(upload_items[0].file_path.read_text()) == request_info["request"]["object"]
+    assert len(upload_items[0].scan_reports[0].failed_checks) == 16
+    assert auditor.audited == 1
+
+
+def test_reload_config(client: FlaskClient, request_info, mocker: MockerFixture) -> None:
+    # given
+    from app.whorf import reload_config, verdict_cache, webhook, whorf_conf
+
+    # restore the config for the following tests
+    mocker.patch("app.whorf.whorf_conf", whorf_conf)
+    mocker.patch.dict(webhook.extensions)
+    mocker.patch.object(verdict_cache, "maxsize", verdict_cache.maxsize)
+
+    whorf_conf_path = app.utils.WHORF_CONFIG_PATH
+    whorf_conf_path.write_text("ignores-namespaces:\n - default\n - nginx\nverdict-cache-size: 10")
+    os.utime(whorf_conf_path, ns=(0, 4711))
+    verdict_cache.set("verdict-key", Verdict(allowed=True, message="cached"))
+
+    # when
+    reload_config()
+    cached_verdict = verdict_cache.get("verdict-key")
+    response = client.post("/validate", json=request_info)
+
+    # then
+    assert response.json["response"]["allowed"] is True
+    assert response.json["response"]["status"]["message"] == "Namespace in ignore list. Ignoring validation"
+    assert verdict_cache.maxsize == 10
+    assert cached_verdict is None
+
+
+def test_validate_with_fast_path(client: FlaskClient, request_info, mocker: MockerFixture) -> None:
+    # given
+    from app.whorf import background_scanner, ckv_whorf, reload_config, webhook, whorf_conf
+
+    # restore the config for the following tests
+    mocker.patch("app.whorf.whorf_conf", whorf_conf)
+    mocker.patch.dict(webhook.extensions)
+    scan_fast_path_request_mock = mocker.patch("app.whorf.scan_fast_path_request", return_value=(None, None))
+
+    checkov_conf_path = app.checkov_whorf.CHECKOV_CONFIG_PATH
+    checkov_conf_path.write_text("framework: kubernetes\nhard-fail-on:\n- CKV_K8S_16\n- CKV_K8S_20")
+    os.utime(checkov_conf_path, ns=(0, ckv_whorf.config_mtime + 1))
+    whorf_conf_path = app.utils.WHORF_CONFIG_PATH
+    whorf_conf_path.write_text("ignores-namespaces:\n - default\nfast-path-mode: enforce")
+    os.utime(whorf_conf_path, ns=(0, 4712))
+    reload_config()
+
+    # when
+    response = client.post("/validate", json=request_info)
+
+    # then
+    assert response.json["response"]["allowed"] is False
+    assert response.json["response"]["status"]["message"].splitlines() == [
+        "Checkov found 2 issues in violation of admission policy.",
+        "CKV_K8S_16:",
+        "  Description: Container should not be privileged",
+        "CKV_K8S_20:",
+        "  Description: Containers should not run with allowPrivilegeEscalation",
+        "The remaining checks are evaluated in the background.",
+    ]
+    # Checkov scans the object in the background
+    for _ in range(100):
+        if scan_fast_path_request_mock.called:
+            break
+        time.sleep(0.1)
+    scan_fast_path_request_mock.assert_called_once()
+
+    # when
+    mocker.patch.object(background_scanner, "maxsize", 0)
+    dropped_before = background_scanner.dropped
+    request_info["request"]["object"]["metadata"]["name"] = "nginx-fast-path-dropped"
+    dropped_response = client.post("/validate", json=request_info)
+
+    # then
+    # the admission is still decided, but the background scan is dropped with a full queue
+    assert dropped_response.json["response"]["allowed"] is False
+    assert background_scanner.dropped == dropped_before + 1
+    scan_fast_path_request_mock.assert_called_once()
+
+
+def test_validate_with_ignored_namespace_before_decoding(
+    client: FlaskClient, request_info, mocker: MockerFixture
+) -> None:
+    # given
+    from app.whorf import reload_config, webhook, whorf_conf
+
+    # restore the config for the following tests
+    mocker.patch("app.whorf.whorf_conf", whorf_conf)
+    mocker.patch.dict(webhook.extensions)
+    get_json = mocker.patch("flask.Request.get_json")
+
+    whorf_conf_path = app.utils.WHORF_CONFIG_PATH
+    whorf_conf_path.write_text("ignores-namespaces:\n - default\n - ngin*")
+    os.utime(whorf_conf_path, ns=(0, 4713))
+    reload_config()
+
+    # when
+    # the fields are serialized in the order of the API server, the test client would sort them
+    response = client.post("/validate", data=json.dumps(request_info), content_type="application/json")
+
+    # then
+    assert response.json["response"]["allowed"] is True
+    assert response.json["response"]["status"]["message"] == "Namespace in ignore list. Ignoring validation"
+    get_json.assert_not_called()
+
+
+def test_readyz_with_multiple_scan_processes(
+    client: FlaskClient, mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    # given
+    import app.whorf
+
+    # the spawned scan processes read the Checkov config relative to the working directory
+    (tmp_path / "config").mkdir()
+    (tmp_path / "config/.checkov.yaml").write_text("framework: kubernetes")
+    monkeypatch.chdir(tmp_path)
+    mocker.patch.object(app.whorf, "scan_process_pool", None)
+    mocker.patch.object(app.whorf, "SCAN_PROCESSES", 2)
+    warm_up_spy = mocker.spy(app.whorf, "warm_up_scan_processes")
+    app.whorf.health_monitor.ready.clear()
+    not_ready_response = client.get("/readyz")
+
+    # when
+    try:
+        app.whorf.warm_up()
+        response = client.get("/readyz")
+    finally:
+        if app.whorf.scan_process_pool:
+            app.whorf.scan_process_pool.shutdown()
+
+    # then
+    assert not_ready_response.status_code == 503
+    assert response.status_code == 200
+    # each scan process ran a warm-up before the webhook reported ready
+    assert len(warm_up_spy.spy_return) == 2